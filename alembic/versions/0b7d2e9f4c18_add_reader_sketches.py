@@ -0,0 +1,32 @@
+"""Add reader sketches
+
+Revision ID: 0b7d2e9f4c18
+Revises: f3a6c8b0d217
+Create Date: 2026-10-19 21:47:19.220835
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7d2e9f4c18'
+down_revision: Union[str, None] = 'f3a6c8b0d217'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('reader_sketches',
+    sa.Column('scope', sa.String(length=10), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('sketch', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'scope_id', 'day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('reader_sketches')
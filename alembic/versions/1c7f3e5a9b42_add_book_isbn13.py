@@ -0,0 +1,54 @@
+"""Add book isbn13
+
+Revision ID: 1c7f3e5a9b42
+Revises: 6e2a9c4f8b13
+Create Date: 2026-10-20 15:41:26.208913
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.isbn import normalize_isbns
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c7f3e5a9b42'
+down_revision: Union[str, None] = '6e2a9c4f8b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('isbn13', sa.String(length=13), nullable=True))
+
+    # Normalize the stored ISBNs. Those with a wrong check digit are left NULL.
+    conn = op.get_bind()
+    books = conn.execute(
+        sa.text('SELECT id, isbn FROM books').execution_options(yield_per=BATCH_SIZE)
+    )
+    update = sa.text('UPDATE books SET isbn13 = :isbn13 WHERE id = :id')
+    for batch in books.partitions():
+        ids, isbns = zip(*batch)
+        rows = []
+        for id, isbn, isbn13 in zip(ids, isbns, normalize_isbns(isbns)):
+            if isbn13 is None:
+                logger.warning('Book %d has an invalid ISBN %r, its isbn13 is left empty.', id, isbn)
+            else:
+                rows.append({'id': id, 'isbn13': isbn13})
+        if rows:
+            conn.execute(update, rows)
+
+    # Fails if two books have the same ISBN written differently
+    op.create_index('ix_books_isbn13', 'books', ['isbn13'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_isbn13', table_name='books')
+    op.drop_column('books', 'isbn13')
@@ -0,0 +1,28 @@
+"""Add report job claim and heartbeat
+
+Revision ID: 3f9c2a7d5e18
+Revises: b7e1d9c3a524
+Create Date: 2026-10-22 15:42:09.381627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a7d5e18'
+down_revision: Union[str, None] = 'b7e1d9c3a524'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('report_jobs', sa.Column('claim', sa.String(length=32), nullable=True))
+    op.add_column('report_jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('report_jobs', 'heartbeat_at')
+    op.drop_column('report_jobs', 'claim')
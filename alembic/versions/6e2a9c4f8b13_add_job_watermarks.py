@@ -0,0 +1,30 @@
+"""Add job watermarks
+
+Revision ID: 6e2a9c4f8b13
+Revises: 9d4f1b6a3e27
+Create Date: 2026-10-20 09:12:05.734219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2a9c4f8b13'
+down_revision: Union[str, None] = '9d4f1b6a3e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('job_watermarks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('horizon', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_watermarks')
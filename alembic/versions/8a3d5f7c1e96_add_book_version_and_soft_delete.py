@@ -0,0 +1,63 @@
+"""Add book version and soft delete
+
+Revision ID: 8a3d5f7c1e96
+Revises: 1c7f3e5a9b42
+Create Date: 2026-10-21 10:27:53.614072
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3d5f7c1e96'
+down_revision: Union[str, None] = '1c7f3e5a9b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = 'deleted_at IS NULL'
+
+# Indexes of the book listings, made partial so that they leave out deleted books
+LISTING_INDEXES = [
+    ('ix_books_genre_id_id', ['genre_id', 'id'], None),
+    ('ix_books_author_id_id', ['author_id', 'id'], None),
+    ('ix_books_publisher_id_id', ['publisher_id', 'id'], 'publisher_id IS NOT NULL'),
+    ('ix_books_publish_date_id', ['publish_date', 'id'], None),
+    ('ix_books_available_id', ['id'], 'available'),
+]
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('books', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    for name, columns, where in LISTING_INDEXES:
+        op.drop_index(name, table_name='books')
+        op.create_index(name, 'books', columns, unique=False, postgresql_where=sa.text(f'{where} AND {LIVE}' if where else LIVE))
+    op.create_index('ix_books_live_id', 'books', ['id'], unique=False, postgresql_where=sa.text(LIVE))
+
+    op.drop_constraint('books_title_key', 'books', type_='unique')
+    op.drop_constraint('books_isbn_key', 'books', type_='unique')
+    op.drop_index('ix_books_isbn13', table_name='books')
+    op.create_index('ix_books_title', 'books', ['title'], unique=True, postgresql_where=sa.text(LIVE))
+    op.create_index('ix_books_isbn', 'books', ['isbn'], unique=True, postgresql_where=sa.text(LIVE))
+    op.create_index('ix_books_isbn13', 'books', ['isbn13'], unique=True, postgresql_where=sa.text(LIVE))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_isbn13', table_name='books')
+    op.drop_index('ix_books_isbn', table_name='books')
+    op.drop_index('ix_books_title', table_name='books')
+    op.create_index('ix_books_isbn13', 'books', ['isbn13'], unique=True)
+    op.create_unique_constraint('books_isbn_key', 'books', ['isbn'])
+    op.create_unique_constraint('books_title_key', 'books', ['title'])
+
+    op.drop_index('ix_books_live_id', table_name='books')
+    for name, columns, where in LISTING_INDEXES:
+        op.drop_index(name, table_name='books')
+        op.create_index(name, 'books', columns, unique=False, postgresql_where=sa.text(where) if where else None)
+
+    op.drop_column('books', 'deleted_at')
+    op.drop_column('books', 'version')
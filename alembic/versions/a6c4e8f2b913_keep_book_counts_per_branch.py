@@ -0,0 +1,130 @@
+"""Keep book counts per branch
+
+Revision ID: a6c4e8f2b913
+Revises: 3f9c2a7d5e18
+Create Date: 2026-10-23 10:27:51.604218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import BOOK_COUNTS_ADD_FUNCTION, BOOK_COUNTS_FUNCTION, BOOK_COUNTS_TRIGGERS
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c4e8f2b913'
+down_revision: Union[str, None] = '3f9c2a7d5e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Counted table, its counts table and key column
+COUNTED = [
+    ('authors', 'author_book_counts', 'author_id'),
+    ('genres', 'genre_book_counts', 'genre_id'),
+    ('publishers', 'publisher_book_counts', 'publisher_id'),
+]
+
+# The counts as of the previous revision, on the authors, genres and publishers themselves
+GLOBAL_BOOK_COUNTS_FUNCTION = """
+CREATE OR REPLACE FUNCTION books_update_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.deleted_at IS NULL THEN
+        UPDATE authors SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.author_id;
+        UPDATE genres SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.genre_id;
+        UPDATE publishers SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.publisher_id;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.deleted_at IS NULL THEN
+        UPDATE authors SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.author_id;
+        UPDATE genres SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.genre_id;
+        UPDATE publishers SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.publisher_id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+GLOBAL_BOOK_COUNTS_UPDATE_TRIGGER = """
+CREATE TRIGGER books_counts_update AFTER UPDATE OF author_id, genre_id, publisher_id, available, deleted_at
+ON books FOR EACH ROW
+WHEN ((OLD.author_id, OLD.genre_id, OLD.publisher_id, OLD.available, OLD.deleted_at IS NULL)
+      IS DISTINCT FROM (NEW.author_id, NEW.genre_id, NEW.publisher_id, NEW.available, NEW.deleted_at IS NULL))
+EXECUTE FUNCTION books_update_counts()
+"""
+
+
+def upgrade() -> None:
+    for table, counts, column in COUNTED:
+        op.create_table(counts,
+        sa.Column('branch_id', sa.Integer(), nullable=False),
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('book_count', sa.Integer(), nullable=False),
+        sa.Column('available_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['branch_id'], ['branches.id'], ),
+        sa.ForeignKeyConstraint([column], [f'{table}.id'], ),
+        sa.PrimaryKeyConstraint('branch_id', column)
+        )
+    op.create_index(
+        'ix_author_book_counts_branch_id_book_count_author_id', 'author_book_counts',
+        ['branch_id', sa.text('(-book_count)'), 'author_id'], unique=False,
+    )
+    op.create_index(
+        'ix_author_book_counts_branch_id_available_count_author_id', 'author_book_counts',
+        ['branch_id', sa.text('(-available_count)'), 'author_id'], unique=False,
+    )
+
+    # Dropping the trigger locks books against writes until the counts below are committed
+    op.execute('DROP TRIGGER books_counts_update ON books')
+    op.execute(BOOK_COUNTS_ADD_FUNCTION)
+    op.execute(BOOK_COUNTS_FUNCTION)
+    op.execute(BOOK_COUNTS_TRIGGERS[1])
+
+    for _, counts, column in COUNTED:
+        op.execute(f"""
+            INSERT INTO {counts} (branch_id, {column}, book_count, available_count)
+            SELECT branch_id, {column}, count(*), count(*) FILTER (WHERE available)
+            FROM books WHERE deleted_at IS NULL AND {column} IS NOT NULL GROUP BY branch_id, {column}
+        """)
+
+    op.drop_index('ix_authors_available_count_id', table_name='authors')
+    op.drop_index('ix_authors_book_count_id', table_name='authors')
+    for table, _, _ in COUNTED:
+        op.drop_column(table, 'available_count')
+        op.drop_column(table, 'book_count')
+
+
+def downgrade() -> None:
+    for table, _, _ in COUNTED:
+        op.add_column(table, sa.Column('book_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('available_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute('DROP TRIGGER books_counts_update ON books')
+    op.execute(GLOBAL_BOOK_COUNTS_FUNCTION)
+    op.execute(GLOBAL_BOOK_COUNTS_UPDATE_TRIGGER)
+    op.execute('DROP FUNCTION books_add_counts(integer, integer, integer, integer, boolean, integer)')
+
+    # The counts of all branches together
+    for table, counts, column in COUNTED:
+        op.execute(f"""
+            UPDATE {table} SET book_count = totals.books, available_count = totals.available
+            FROM (
+                SELECT {column} AS id, sum(book_count) AS books, sum(available_count) AS available
+                FROM {counts} GROUP BY {column}
+            ) AS totals
+            WHERE {table}.id = totals.id
+        """)
+
+    op.create_index('ix_authors_book_count_id', 'authors', [sa.text('(-book_count)'), 'id'], unique=False)
+    op.create_index('ix_authors_available_count_id', 'authors', [sa.text('(-available_count)'), 'id'], unique=False)
+
+    op.drop_index('ix_author_book_counts_branch_id_available_count_author_id', table_name='author_book_counts')
+    op.drop_index('ix_author_book_counts_branch_id_book_count_author_id', table_name='author_book_counts')
+    for _, counts, _ in reversed(COUNTED):
+        op.drop_table(counts)
@@ -0,0 +1,34 @@
+"""Add book filter indexes
+
+Revision ID: a7c41e9b2d05
+Revises: 3f9a1c2d7e4b
+Create Date: 2026-10-19 14:03:47.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c41e9b2d05'
+down_revision: Union[str, None] = '3f9a1c2d7e4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_books_genre_id_id', 'books', ['genre_id', 'id'], unique=False)
+    op.create_index('ix_books_author_id_id', 'books', ['author_id', 'id'], unique=False)
+    op.create_index('ix_books_publisher_id_id', 'books', ['publisher_id', 'id'], unique=False, postgresql_where=sa.text('publisher_id IS NOT NULL'))
+    op.create_index('ix_books_publish_date_id', 'books', ['publish_date', 'id'], unique=False)
+    op.create_index('ix_books_available_id', 'books', ['id'], unique=False, postgresql_where=sa.text('available'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_books_available_id', table_name='books', postgresql_where=sa.text('available'))
+    op.drop_index('ix_books_publish_date_id', table_name='books')
+    op.drop_index('ix_books_publisher_id_id', table_name='books', postgresql_where=sa.text('publisher_id IS NOT NULL'))
+    op.drop_index('ix_books_author_id_id', table_name='books')
+    op.drop_index('ix_books_genre_id_id', table_name='books')
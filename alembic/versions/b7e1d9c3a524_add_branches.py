@@ -0,0 +1,106 @@
+"""Add branches
+
+Revision ID: b7e1d9c3a524
+Revises: d4b8e2a6f015
+Create Date: 2026-10-22 11:18:42.736105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e1d9c3a524'
+down_revision: Union[str, None] = 'd4b8e2a6f015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = 'deleted_at IS NULL'
+
+# Indexes of the book listings, old name and columns, new name and columns, and condition
+LISTING_INDEXES = [
+    ('ix_books_live_id', ['id'], 'ix_books_branch_id_id', ['branch_id', 'id'], LIVE),
+    ('ix_books_genre_id_id', ['genre_id', 'id'], 'ix_books_branch_id_genre_id_id', ['branch_id', 'genre_id', 'id'], LIVE),
+    ('ix_books_author_id_id', ['author_id', 'id'], 'ix_books_branch_id_author_id_id', ['branch_id', 'author_id', 'id'], LIVE),
+    (
+        'ix_books_publisher_id_id', ['publisher_id', 'id'],
+        'ix_books_branch_id_publisher_id_id', ['branch_id', 'publisher_id', 'id'],
+        f'publisher_id IS NOT NULL AND {LIVE}',
+    ),
+    (
+        'ix_books_publish_date_id', ['publish_date', 'id'],
+        'ix_books_branch_id_publish_date_id', ['branch_id', 'publish_date', 'id'], LIVE,
+    ),
+    ('ix_books_available_id', ['id'], 'ix_books_branch_id_available_id', ['branch_id', 'id'], f'available AND {LIVE}'),
+]
+
+# Titles and ISBNs, unique within a branch
+UNIQUE_INDEXES = [
+    ('ix_books_title', 'ix_books_branch_id_title', 'title'),
+    ('ix_books_isbn', 'ix_books_branch_id_isbn', 'isbn'),
+    ('ix_books_isbn13', 'ix_books_branch_id_isbn13', 'isbn13'),
+]
+
+LOAN_INDEXES = [
+    ('ix_borrowing_history_open_loans', 'return_date IS NULL'),
+    ('ix_borrowing_history_past_loans', 'return_date IS NOT NULL'),
+]
+
+BRANCH_TABLES = ['users', 'books', 'borrowing_history']
+
+
+def upgrade() -> None:
+    op.create_table('branches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_branches_id'), 'branches', ['id'], unique=False)
+    # Every existing user, book and borrowing belongs to it
+    op.execute("INSERT INTO branches (name) VALUES ('main')")
+
+    for table in BRANCH_TABLES:
+        op.add_column(table, sa.Column('branch_id', sa.Integer(), server_default='1', nullable=False))
+        op.create_foreign_key(f'{table}_branch_id_fkey', table, 'branches', ['branch_id'], ['id'])
+
+    # Events of the books and borrowings written so far are the main branch's
+    op.add_column('outbox_events', sa.Column('branch_id', sa.Integer(), nullable=True))
+    op.execute("UPDATE outbox_events SET branch_id = 1 WHERE aggregate IN ('book', 'borrowing')")
+
+    for old_name, _, new_name, columns, where in LISTING_INDEXES:
+        op.drop_index(old_name, table_name='books')
+        op.create_index(new_name, 'books', columns, unique=False, postgresql_where=sa.text(where))
+    for old_name, new_name, column in UNIQUE_INDEXES:
+        op.drop_index(old_name, table_name='books')
+        op.create_index(new_name, 'books', ['branch_id', column], unique=True, postgresql_where=sa.text(LIVE))
+
+    for name, where in LOAN_INDEXES:
+        op.drop_index(name, table_name='borrowing_history')
+        op.create_index(name, 'borrowing_history', ['branch_id', 'user_id', 'id'], unique=False, postgresql_where=sa.text(where))
+    op.create_index('ix_borrowing_history_branch_id_book_id_id', 'borrowing_history', ['branch_id', 'book_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrowing_history_branch_id_book_id_id', table_name='borrowing_history')
+    for name, where in LOAN_INDEXES:
+        op.drop_index(name, table_name='borrowing_history')
+        op.create_index(name, 'borrowing_history', ['user_id', 'id'], unique=False, postgresql_where=sa.text(where))
+
+    # Fails if two branches have books with the same title or ISBN
+    for old_name, new_name, column in UNIQUE_INDEXES:
+        op.drop_index(new_name, table_name='books')
+        op.create_index(old_name, 'books', [column], unique=True, postgresql_where=sa.text(LIVE))
+    for old_name, old_columns, new_name, _, where in LISTING_INDEXES:
+        op.drop_index(new_name, table_name='books')
+        op.create_index(old_name, 'books', old_columns, unique=False, postgresql_where=sa.text(where))
+
+    op.drop_column('outbox_events', 'branch_id')
+    for table in BRANCH_TABLES:
+        op.drop_constraint(f'{table}_branch_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'branch_id')
+
+    op.drop_index(op.f('ix_branches_id'), table_name='branches')
+    op.drop_table('branches')
@@ -0,0 +1,28 @@
+"""Add loan indexes
+
+Revision ID: c2e8d4f61a93
+Revises: a7c41e9b2d05
+Create Date: 2026-10-19 16:21:05.804117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e8d4f61a93'
+down_revision: Union[str, None] = 'a7c41e9b2d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_borrowing_history_open_loans', 'borrowing_history', ['user_id', 'id'], unique=False, postgresql_where=sa.text('return_date IS NULL'))
+    op.create_index('ix_borrowing_history_past_loans', 'borrowing_history', ['user_id', 'id'], unique=False, postgresql_where=sa.text('return_date IS NOT NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrowing_history_past_loans', table_name='borrowing_history', postgresql_where=sa.text('return_date IS NOT NULL'))
+    op.drop_index('ix_borrowing_history_open_loans', table_name='borrowing_history', postgresql_where=sa.text('return_date IS NULL'))
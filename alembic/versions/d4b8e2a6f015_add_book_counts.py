@@ -0,0 +1,94 @@
+"""Add book counts
+
+Revision ID: d4b8e2a6f015
+Revises: 8a3d5f7c1e96
+Create Date: 2026-10-21 16:05:38.290417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4b8e2a6f015'
+down_revision: Union[str, None] = '8a3d5f7c1e96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTED = [('authors', 'author_id'), ('genres', 'genre_id'), ('publishers', 'publisher_id')]
+
+# The counts as of this revision, on the authors, genres and publishers themselves
+BOOK_COUNTS_FUNCTION = """
+CREATE OR REPLACE FUNCTION books_update_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.deleted_at IS NULL THEN
+        UPDATE authors SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.author_id;
+        UPDATE genres SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.genre_id;
+        UPDATE publishers SET book_count = book_count - 1, available_count = available_count - (OLD.available IS TRUE)::int
+        WHERE id = OLD.publisher_id;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.deleted_at IS NULL THEN
+        UPDATE authors SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.author_id;
+        UPDATE genres SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.genre_id;
+        UPDATE publishers SET book_count = book_count + 1, available_count = available_count + (NEW.available IS TRUE)::int
+        WHERE id = NEW.publisher_id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+BOOK_COUNTS_TRIGGERS = [
+    """
+    CREATE TRIGGER books_counts_insert_delete AFTER INSERT OR DELETE ON books
+    FOR EACH ROW EXECUTE FUNCTION books_update_counts()
+    """,
+    """
+    CREATE TRIGGER books_counts_update AFTER UPDATE OF author_id, genre_id, publisher_id, available, deleted_at
+    ON books FOR EACH ROW
+    WHEN ((OLD.author_id, OLD.genre_id, OLD.publisher_id, OLD.available, OLD.deleted_at IS NULL)
+          IS DISTINCT FROM (NEW.author_id, NEW.genre_id, NEW.publisher_id, NEW.available, NEW.deleted_at IS NULL))
+    EXECUTE FUNCTION books_update_counts()
+    """,
+]
+
+
+def upgrade() -> None:
+    for table, _ in COUNTED:
+        op.add_column(table, sa.Column('book_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('available_count', sa.Integer(), server_default='0', nullable=False))
+
+    # The triggers lock books against writes until the counts below are committed
+    op.execute(BOOK_COUNTS_FUNCTION)
+    for statement in BOOK_COUNTS_TRIGGERS:
+        op.execute(statement)
+
+    for table, column in COUNTED:
+        op.execute(f"""
+            UPDATE {table} SET book_count = counts.books, available_count = counts.available
+            FROM (
+                SELECT {column} AS id, count(*) AS books, count(*) FILTER (WHERE available) AS available
+                FROM books WHERE deleted_at IS NULL GROUP BY {column}
+            ) AS counts
+            WHERE {table}.id = counts.id
+        """)
+
+    op.create_index('ix_authors_book_count_id', 'authors', [sa.text('(-book_count)'), 'id'], unique=False)
+    op.create_index('ix_authors_available_count_id', 'authors', [sa.text('(-available_count)'), 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_authors_available_count_id', table_name='authors')
+    op.drop_index('ix_authors_book_count_id', table_name='authors')
+    op.execute('DROP TRIGGER books_counts_update ON books')
+    op.execute('DROP TRIGGER books_counts_insert_delete ON books')
+    op.execute('DROP FUNCTION books_update_counts()')
+    for table, _ in COUNTED:
+        op.drop_column(table, 'available_count')
+        op.drop_column(table, 'book_count')
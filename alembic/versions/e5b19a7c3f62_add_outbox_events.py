@@ -0,0 +1,37 @@
+"""Add outbox events
+
+Revision ID: e5b19a7c3f62
+Revises: c2e8d4f61a93
+Create Date: 2026-10-19 18:40:12.067381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b19a7c3f62'
+down_revision: Union[str, None] = 'c2e8d4f61a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox_events',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('txid', sa.BigInteger(), server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False),
+    sa.Column('aggregate', sa.String(length=50), nullable=False),
+    sa.Column('aggregate_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_events_txid_id', 'outbox_events', ['txid', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_events_txid_id', table_name='outbox_events')
+    op.drop_table('outbox_events')
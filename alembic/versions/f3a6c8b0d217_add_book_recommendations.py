@@ -0,0 +1,34 @@
+"""Add book recommendations
+
+Revision ID: f3a6c8b0d217
+Revises: e5b19a7c3f62
+Create Date: 2026-10-19 20:05:33.912604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a6c8b0d217'
+down_revision: Union[str, None] = 'e5b19a7c3f62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('book_recommendations',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('recommended_book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.ForeignKeyConstraint(['recommended_book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'rank')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('book_recommendations')
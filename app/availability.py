@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Optional
+
+from sqlalchemy.orm import Session
+
+from app.notifications import notify
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel carrying borrow and return events to every worker
+AVAILABILITY_CHANNEL = "book_availability"
+
+# Events buffered per subscriber before it is considered too slow and disconnected
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = 15.0
+
+
+def notify_availability(session: Session, book_id: int, event: str, branch_id: int) -> None:
+    """
+    Announce that a book of a branch was borrowed or returned, once the
+    session's transaction commits.
+    """
+    notify(session, AVAILABILITY_CHANNEL, {"book_id": book_id, "event": event, "branch_id": branch_id})
+
+
+class AvailabilityBroadcaster:
+    """
+    Fans the events heard by the worker's single LISTEN connection out to
+    the asyncio queues of its stream subscribers.
+
+    `publish` is called from the listener thread and hands the event over to
+    the event loop; an idle subscriber costs one empty queue. A subscriber
+    whose queue is full is disconnected rather than slowing down the others,
+    EventSource clients reconnect on their own.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, event: Any) -> None:
+        # Called from the listener thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event: Any) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Disconnecting a slow availability subscriber")
+                self._subscribers.discard(queue)
+                # Make room for the end of stream marker
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+_broadcaster = AvailabilityBroadcaster()
+
+
+def get_broadcaster() -> AvailabilityBroadcaster:
+    return _broadcaster
+
+
+async def availability_events(
+        broadcaster: AvailabilityBroadcaster,
+        branch_id: int,
+        keepalive: float = KEEPALIVE_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    Yield the server-sent events of a branch's books for a new subscriber
+    until it is disconnected.
+    """
+    queue = broadcaster.subscribe()
+    try:
+        # Tell the client the stream is open before the first event
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            if event.get("branch_id") != branch_id:
+                continue
+            yield f"event: availability\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
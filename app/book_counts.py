@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from sqlalchemy import Select, and_, func, select
+
+from app.models import Author, AuthorBookCount, Genre, GenreBookCount, Publisher, PublisherBookCount
+
+# Counted models: their counts table and its key column, kept per branch by the books' triggers
+BOOK_COUNTS = {
+    Author: (AuthorBookCount, AuthorBookCount.author_id),
+    Genre: (GenreBookCount, GenreBookCount.genre_id),
+    Publisher: (PublisherBookCount, PublisherBookCount.publisher_id),
+}
+
+COUNT_FIELDS = ("book_count", "available_count")
+
+
+def own_columns(model, schema: type[BaseModel]) -> list:
+    """
+    Return the model columns of `schema`, without the counts kept in the
+    counts table. A new author, genre or publisher has no books yet.
+    """
+    return [getattr(model, name) for name in schema.model_fields if name not in COUNT_FIELDS]
+
+
+def select_with_book_counts(model, schema: type[BaseModel], branch_id: int) -> Select:
+    """
+    Select the columns of `schema` with the counts of the branch's books, 0
+    when the branch has none of them.
+    """
+    counts, key = BOOK_COUNTS[model]
+    return select(
+        *own_columns(model, schema),
+        *[func.coalesce(getattr(counts, name), 0).label(name) for name in COUNT_FIELDS],
+    ).outerjoin(counts, and_(key == model.id, counts.branch_id == branch_id))
@@ -0,0 +1,47 @@
+from typing import Optional, Sequence
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.outbox import record_events
+
+# Items accepted by one bulk request
+BULK_MAX_ITEMS = 10_000
+
+# Rows per INSERT statement, well under Postgres' limit of bind parameters
+BULK_CHUNK_SIZE = 1000
+
+
+def bulk_upsert_by_name(
+        session: Session,
+        model,
+        rows: Sequence[dict],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        aggregate: Optional[str] = None,
+) -> list[dict]:
+    """
+    Insert or update rows keyed by their unique `name`, in chunked
+    INSERT ... ON CONFLICT (name) DO UPDATE statements. With `aggregate`,
+    an "upserted" outbox event is recorded for every row.
+
+    Returns the id of every name, in the order the names first appear.
+    """
+    # One statement cannot update the same row twice, the last row of a name wins
+    by_name = {row["name"]: row for row in rows}
+    values = list(by_name.values())
+
+    mapping = []
+    for start in range(0, len(values), chunk_size):
+        statement = insert(model).values(values[start:start + chunk_size])
+        # Setting name to itself still returns the rows that already existed
+        statement = statement.on_conflict_do_update(
+            index_elements=[model.name],
+            set_={column: statement.excluded[column] for column in values[0]},
+        ).returning(model.id, model.name)
+        mapping.extend(row._asdict() for row in session.execute(statement))
+
+    if aggregate is not None:
+        record_events(
+            session, aggregate, "upserted", [{**by_name[item["name"]], **item} for item in mapping]
+        )
+    return mapping
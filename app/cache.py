@@ -0,0 +1,288 @@
+import copy
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import REPLICA_SESSION
+from app.notifications import notify
+
+# Namespaces of cached data
+BOOKS = "books"
+HISTORY = "history"
+REFERENCE = "reference"
+PRINCIPALS = "principals"
+
+
+def history_namespace(book_id: int) -> str:
+    # One namespace per book, so that invalidating it reaches every page and fieldset of its history
+    return f"{HISTORY}:{book_id}"
+
+
+# Postgres channel used to broadcast invalidations to every worker
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+# Appended to the keys of the values produced on a replica
+REPLICA_KEY_SUFFIX = "@replica"
+
+
+class _Flight:
+    # A value being produced, shared with the requests that miss the same entry meanwhile
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _copy_error(error: BaseException) -> Optional[BaseException]:
+    # Each waiter raises its own exception: raising one object from several threads mixes up its traceback.
+    # None if the exception can't be rebuilt.
+    if isinstance(error, HTTPException):
+        return HTTPException(error.status_code, error.detail, error.headers)
+    try:
+        return copy.copy(error)
+    except Exception:
+        return None
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends.
+
+    Each namespace has a generation number; invalidating a namespace bumps it,
+    which makes every entry written under an older generation unreachable.
+    """
+
+    def __init__(self):
+        self._flights: dict[tuple, _Flight] = {}
+        self._flights_lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        ttl: float,
+        generation: Optional[int] = None,
+    ) -> None:
+        raise NotImplementedError
+
+    def generation(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str, key: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def get_or_set(
+        self,
+        namespace: str,
+        key: str,
+        producer: Callable[[], Any],
+        ttl: Optional[float] = None,
+        session: Optional[Session] = None,
+    ) -> Any:
+        """
+        Return the cached value, or produce and cache it.
+
+        The generation is read before producing, so a value computed while a
+        write committed is stored under the old generation and never served.
+
+        A value produced by a `session` bound to a replica is stored apart and
+        only served to other replica reads. The replica may not have had the
+        write that just invalidated the namespace, so such a value can lag by
+        up to the TTL. Reads on the primary, e.g. right after the user's own
+        write, never see it.
+
+        Concurrent misses of the same entry in this process are coalesced:
+        the first one produces the value, the others wait for it and get the
+        same value, or a copy of its exception, instead of running the query
+        again. Reads from a replica and from the primary, e.g. right after a
+        write, are never shared with each other. A waiter still holds its
+        request's connection, so after `cache_wait_seconds` it stops waiting
+        and produces the value itself, in case the first one is stuck waiting
+        for a connection from the pool.
+        """
+        replica = session is not None and bool(session.info.get(REPLICA_SESSION))
+        value = self.get(namespace, key)
+        if value is None and replica:
+            value = self.get(namespace, key + REPLICA_KEY_SUFFIX)
+        if value is not None:
+            return value
+
+        generation = self.generation(namespace)
+        flight_key = (namespace, generation, key, replica)
+        with self._flights_lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(settings.cache_wait_seconds):
+                if flight.error is None:
+                    return flight.value
+                error = _copy_error(flight.error)
+                if error is not None:
+                    raise error from flight.error
+            return self._produce(namespace, key, producer, ttl, replica, generation)
+
+        try:
+            flight.value = self._produce(namespace, key, producer, ttl, replica, generation)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # Later misses find the stored value, or start a new flight
+            with self._flights_lock:
+                del self._flights[flight_key]
+            flight.done.set()
+
+    def _produce(
+        self, namespace: str, key: str, producer: Callable[[], Any], ttl: Optional[float], replica: bool, generation: int
+    ) -> Any:
+        value = producer()
+        self.set(
+            namespace,
+            key + REPLICA_KEY_SUFFIX if replica else key,
+            value,
+            settings.cache_ttl_seconds if ttl is None else ttl,
+            generation,
+        )
+        return value
+
+
+class LocalCache(CacheBackend):
+    """
+    In-process cache, kept consistent across workers by the invalidations
+    broadcast over Postgres. Also the stand-in used by the tests.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: dict[tuple[str, str], tuple[float, int, Any]] = {}
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, generation, value = entry
+        if expires_at < time.monotonic() or generation != self.generation(namespace):
+            return None
+        return value
+
+    def set(self, namespace, key, value, ttl, generation=None):
+        with self._lock:
+            if generation is None:
+                generation = self._generations.get(namespace, 0)
+            if len(self._entries) >= self.max_entries:
+                # Evict the oldest entry, dicts keep insertion order
+                self._entries.pop(next(iter(self._entries)))
+            self._entries.pop((namespace, key), None)
+            self._entries[(namespace, key)] = (time.monotonic() + ttl, generation, value)
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace, key=None):
+        with self._lock:
+            if key is None:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            else:
+                self._entries.pop((namespace, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by all workers through Redis. Requires the optional `redis`
+    package. Values are stored as JSON.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL requires the 'redis' package.") from e
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, namespace, key, generation):
+        return f"cache:{namespace}:{generation}:{key}"
+
+    def get(self, namespace, key):
+        value = self._redis.get(self._key(namespace, key, self.generation(namespace)))
+        return None if value is None else orjson.loads(value)
+
+    def set(self, namespace, key, value, ttl, generation=None):
+        if generation is None:
+            generation = self.generation(namespace)
+        self._redis.set(
+            self._key(namespace, key, generation), orjson.dumps(value), px=int(ttl * 1000)
+        )
+
+    def generation(self, namespace):
+        return int(self._redis.get(f"cache:{namespace}:generation") or 0)
+
+    def invalidate(self, namespace, key=None):
+        if key is None:
+            self._redis.incr(f"cache:{namespace}:generation")
+        else:
+            self._redis.delete(self._key(namespace, key, self.generation(namespace)))
+
+    def clear(self):
+        for key in self._redis.scan_iter("cache:*"):
+            self._redis.delete(key)
+
+
+_cache: Optional[CacheBackend] = None
+
+
+def get_cache() -> CacheBackend:
+    global _cache
+    if _cache is None:
+        _cache = RedisCache(settings.cache_url) if settings.cache_url else LocalCache()
+    return _cache
+
+
+def invalidate_on_commit(session: Session, namespace: str, key: Optional[str] = None):
+    """
+    Invalidate cached data once the session's transaction commits, in this
+    worker directly and in the others through a Postgres notification.
+    """
+    notify(session, INVALIDATION_CHANNEL, {"namespace": namespace, "key": key})
+    session.info.setdefault("cache_invalidations", set()).add((namespace, key))
+
+
+def handle_invalidation(message: dict) -> None:
+    get_cache().invalidate(message["namespace"], message.get("key"))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for namespace, key in session.info.pop("cache_invalidations", ()):
+        get_cache().invalidate(namespace, key)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("cache_invalidations", None)
@@ -1,7 +1,7 @@
-from pydantic_settings import BaseSettings
-from dotenv import load_dotenv
+from functools import lru_cache
+from typing import List, Optional
 
-load_dotenv()
+from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
@@ -20,8 +20,79 @@ class Settings(BaseSettings):
     algorithm: str
     access_token_expire_minutes: int
 
+    # Connection pool of the primary engine, opened when the app starts
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_prewarm: int = 5
+
+    # Read replicas for catalog reads, as a JSON list of SQLAlchemy URLs
+    db_replica_urls: List[str] = []
+    # How long a replica that failed its health check is skipped
+    db_replica_retry_seconds: float = 30
+    # After a write, the user's reads go to the primary for this long
+    read_your_writes_seconds: float = 5
+
+    # Shared cache: Redis URL, or an in-process cache per worker when unset.
+    # Invalidations are broadcast to all workers over Postgres LISTEN/NOTIFY.
+    cache_url: Optional[str] = None
+    cache_ttl_seconds: float = 60
+    # How long a request waits for another one producing the same missing entry before producing it itself
+    cache_wait_seconds: float = 5
+    principal_cache_ttl_seconds: float = 60
+
+    # Token-bucket rate limits on login and circulation endpoints. Buckets are
+    # per worker unless a Redis URL is set to share them.
+    rate_limit_enabled: bool = True
+    rate_limit_url: Optional[str] = None
+
+    # How long responses stored under an Idempotency-Key are replayed
+    idempotency_ttl_hours: int = 24
+
+    # Queries slower than this are logged with their route and handler
+    slow_query_threshold_ms: float = 500
+    # Share of slow SELECTs whose plan is captured with EXPLAIN ANALYZE
+    slow_query_explain_sample_rate: float = 0.1
+
+    # Background refresh of the "borrowed together" recommendations, 0 disables it
+    recommendations_refresh_seconds: float = 300
+    # Neighbours stored per book
+    recommendations_top_k: int = 10
+
+    # How often new borrowings are folded into the distinct-reader sketches, 0 disables it
+    reader_sketches_refresh_seconds: float = 60
+
+    # Report jobs run in a pool of this many processes, below the API's CPU priority
+    report_workers: int = 2
+    # How often a running report job records that its worker is alive
+    report_heartbeat_seconds: float = 30
+    # Running jobs without a heartbeat for this long when the app starts are queued again
+    report_stale_minutes: int = 5
+    # Directory the finished reports are written to
+    report_dir: str = "reports"
+    # Open loans older than this are listed by the overdue report
+    loan_period_days: int = 21
+
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    # Read the environment and .env only once, on first use
+    return Settings()
+
+
+class _LazySettings:
+    """
+    Stand-in for the settings object that defers reading the environment
+    until an attribute is accessed, so importing the app has no side effects.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
+
+
+settings = _LazySettings()
@@ -1,18 +1,132 @@
+import threading
+import time
+from typing import List, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from app.config import settings
+from app.slow_query import install_slow_query_log
 
-SQLALCHEMY_DATABASE_URL = (
-    f"postgresql+psycopg2://{settings.db_user}:{settings.db_password}@{settings.db_host}/{settings.db_name}"
-)
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SessionLocal = sessionmaker(autoflush=False, autocommit=False)
 
-SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+# Session.info flag of the sessions bound to a read replica
+REPLICA_SESSION = "replica"
 Base = declarative_base()
 
-# Create database tables if they do not exist
-Base.metadata.create_all(bind=engine)
+# Created lazily by get_engine(), normally from the app's lifespan handler.
+# The schema itself is managed by Alembic only.
+_engine: Optional[Engine] = None
+_replica_set: Optional["ReplicaSet"] = None
+
+
+def database_url() -> str:
+    return (
+        f"postgresql+psycopg2://{settings.db_user}:{settings.db_password}@{settings.db_host}/{settings.db_name}"
+    )
+
+
+def get_engine() -> Engine:
+    """
+    Return the primary engine, creating it and binding SessionLocal on first use.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            database_url(),
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+        )
+        install_slow_query_log(_engine)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+class ReplicaSet:
+    """
+    Read replicas handed out in round-robin order. A replica that fails to
+    connect is skipped for `retry_after` seconds before being tried again.
+    """
+
+    def __init__(self, engines: List[Engine], retry_after: float):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until = [0.0] * len(engines)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def connect(self) -> Optional[Connection]:
+        """
+        Return a connection to the next healthy replica, or None if there is none.
+        """
+        for _ in range(len(self.engines)):
+            with self._lock:
+                index = self._next
+                self._next = (index + 1) % len(self.engines)
+
+            if self._down_until[index] > time.monotonic():
+                continue
+            try:
+                return self.engines[index].connect()
+            except OperationalError:
+                self._down_until[index] = time.monotonic() + self.retry_after
+        return None
+
+    def dispose(self) -> None:
+        for engine in self.engines:
+            engine.dispose()
+
+
+def get_replica_set() -> ReplicaSet:
+    """
+    Return the configured read replicas, creating their engines on first use.
+    """
+    global _replica_set
+    if _replica_set is None:
+        engines = []
+        for url in settings.db_replica_urls:
+            engine = create_engine(
+                url,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_pre_ping=True,
+            )
+            install_slow_query_log(engine)
+            engines.append(engine)
+        _replica_set = ReplicaSet(engines, settings.db_replica_retry_seconds)
+    return _replica_set
+
+
+def prewarm_pool(engine: Engine, connections: int) -> None:
+    """
+    Open `connections` pooled connections up front so the first requests of a
+    new worker don't pay for the TCP and authentication handshakes.
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+def init_engine() -> Engine:
+    engine = get_engine()
+    prewarm_pool(engine, min(settings.db_pool_prewarm, settings.db_pool_size))
+    get_replica_set()
+    return engine
+
+
+def dispose_engine() -> None:
+    global _engine, _replica_set
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+    if _replica_set is not None:
+        _replica_set.dispose()
+        _replica_set = None
 
 
 class SessionManager:
@@ -1,7 +1,114 @@
-from app.database import SessionLocal, SessionManager
+import hashlib
+import hmac
+import math
+import time
+from typing import Optional
 
+from fastapi import Request
+from fastapi.security.utils import get_authorization_scheme_param
 
-def get_db():
+from app.config import settings
+from app.database import (
+    REPLICA_SESSION,
+    SessionLocal,
+    SessionManager,
+    get_engine,
+    get_replica_set,
+)
+from auth.utils import get_token_subject
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Cookie sent back after a write, so that whichever worker serves the user's
+# next reads sends them to the primary until the replicas have caught up
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+
+def _write_marker_signature(subject: str, until: int) -> str:
+    message = f"{subject}:{until}".encode()
+    return hmac.new(settings.secret_key.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def write_marker(subject: str, until: int) -> str:
+    """
+    Cookie value telling that `subject` wrote and should read from the
+    primary until the epoch second `until`.
+    """
+    return f"{until}.{_write_marker_signature(subject, until)}"
+
+
+def wrote_recently(request: Request) -> bool:
+    subject = request_subject(request)
+    until, _, signature = request.cookies.get(READ_YOUR_WRITES_COOKIE, "").partition(".")
+    if subject is None or not until.isdigit():
+        return False
+    return int(until) > time.time() and hmac.compare_digest(
+        signature, _write_marker_signature(subject, int(until))
+    )
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI middleware that sets the read-your-writes cookie on the
+    responses of committed writes, marked by `get_db`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            marker = scope.get("state", {}).get(READ_YOUR_WRITES_COOKIE)
+            if message["type"] == "http.response.start" and marker is not None:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={marker}; Max-Age={math.ceil(settings.read_your_writes_seconds)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def request_subject(request: Request) -> Optional[str]:
+    # Username from the bearer token, used only to pick a database
+    _, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    return get_token_subject(token)
+
+
+def get_db(request: Request):
+    get_engine()
     db = SessionLocal()
     with SessionManager(db) as session:
         yield session
+
+    # The write was committed, keep this user's reads on the primary for a while
+    subject = request_subject(request)
+    if request.method not in READ_METHODS and subject is not None:
+        until = math.ceil(time.time() + settings.read_your_writes_seconds)
+        setattr(request.state, READ_YOUR_WRITES_COOKIE, write_marker(subject, until))
+
+
+def get_read_db(request: Request):
+    """
+    Session for read-only endpoints: served by a healthy replica when one is
+    configured, and by the primary right after the user's own writes.
+    """
+    conn = None
+    if not wrote_recently(request):
+        conn = get_replica_set().connect()
+
+    if conn is None:
+        yield from get_db(request)
+        return
+
+    try:
+        db = SessionLocal(bind=conn, info={REPLICA_SESSION: True})
+        with SessionManager(db) as session:
+            yield session
+    finally:
+        conn.close()
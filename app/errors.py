@@ -0,0 +1,25 @@
+from typing import NoReturn, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+
+def constraint_name(error: IntegrityError) -> Optional[str]:
+    # Name of the violated constraint, as reported by psycopg2
+    diag = getattr(error.orig, "diag", None)
+    return getattr(diag, "constraint_name", None)
+
+
+def raise_for_integrity_error(
+        error: IntegrityError, constraints: dict[str, tuple[int, str]]
+) -> NoReturn:
+    """
+    Map the violated constraint to an HTTP error.
+
+    Lets create endpoints insert directly and rely on the unique and foreign
+    key constraints instead of checking with a SELECT first.
+    """
+    status_code, detail = constraints.get(
+        constraint_name(error), (400, f"Integrity error: {str(error.orig)}")
+    )
+    raise HTTPException(status_code=status_code, detail=detail) from error
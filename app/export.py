@@ -0,0 +1,158 @@
+import argparse
+import datetime
+import io
+from typing import Iterator, Optional
+
+from sqlalchemy import Integer, Select, cast, extract, select
+from sqlalchemy.engine import Engine
+
+from app.models import Book, BorrowingHistory
+from app.reports import arrow_schema, record_batch
+
+# PyArrow is only imported by the functions that build batches or files.
+
+# History rows fetched per round trip and converted per record batch, bounds the memory of an export
+EXPORT_BATCH_SIZE = 100_000
+
+# Hive-style partition columns of the Parquet dataset, e.g. branch_id=1/borrow_year=2024/part-0.parquet
+PARTITION_COLUMNS = ("branch_id", "borrow_year")
+
+
+def borrowing_history_query(year: Optional[int] = None, branch_id: Optional[int] = None) -> Select:
+    """
+    Borrowing history with the keys of the book, borrower, genre, author
+    and publisher, in storage order. Every branch's unless `branch_id` is given.
+    """
+    query = select(
+        BorrowingHistory.id,
+        BorrowingHistory.book_id,
+        BorrowingHistory.user_id,
+        Book.genre_id,
+        Book.author_id,
+        Book.publisher_id,
+        BorrowingHistory.borrow_date,
+        BorrowingHistory.return_date,
+        BorrowingHistory.branch_id,
+        cast(extract("year", BorrowingHistory.borrow_date), Integer).label("borrow_year"),
+    ).join(Book, Book.id == BorrowingHistory.book_id)
+    if branch_id is not None:
+        query = query.where(BorrowingHistory.branch_id == branch_id)
+    if year is not None:
+        query = query.where(
+            BorrowingHistory.borrow_date >= datetime.date(year, 1, 1),
+            BorrowingHistory.borrow_date < datetime.date(year + 1, 1, 1),
+        )
+    return query
+
+
+def export_schema():
+    return arrow_schema(borrowing_history_query())
+
+
+def borrowing_history_batches(
+        engine: Engine, year: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE,
+        branch_id: Optional[int] = None,
+) -> Iterator:
+    """
+    Stream the borrowing history from a server-side cursor as Arrow record
+    batches of at most `batch_size` rows.
+    """
+    schema = export_schema()
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            borrowing_history_query(year, branch_id)
+        )
+        for partition in result.partitions():
+            yield record_batch(schema, partition)
+
+
+def write_partitioned_parquet(
+        engine: Engine, base_dir: str, year: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE,
+        branch_id: Optional[int] = None,
+) -> int:
+    """
+    Write the borrowing history as a Parquet dataset partitioned by branch
+    and borrow year, replacing the partitions it writes. Returns the number
+    of rows.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = export_schema()
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for batch in borrowing_history_batches(engine, year, batch_size, branch_id):
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        pa.RecordBatchReader.from_batches(schema, counted()),
+        base_dir,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([schema.field(column) for column in PARTITION_COLUMNS]), flavor="hive"
+        ),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=batch_size,
+    )
+    return rows
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands out what was written so far, keeping the offsets Parquet records
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def encode_batches(batches: Iterator, format: str) -> Iterator[bytes]:
+    """
+    Encode record batches as an Arrow IPC stream, or as a Parquet file with
+    one row group per batch, yielding the bytes of each batch as it is done.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = export_schema()
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema) if format == "arrow" else pq.ParquetWriter(sink, schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+if __name__ == "__main__":
+    # python -m app.export /data/borrowing_history [--year 2024] [--branch 1]
+    from app.database import get_engine
+
+    parser = argparse.ArgumentParser(description="Export the borrowing history as partitioned Parquet.")
+    parser.add_argument("base_dir")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--branch", type=int)
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    count = write_partitioned_parquet(get_engine(), args.base_dir, args.year, args.batch_size, args.branch)
+    print(f"Exported {count} rows.")
@@ -0,0 +1,89 @@
+import numpy as np
+
+# 2^14 registers: about 0.8% standard error, 16 KiB once dense
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+
+_SPARSE = 0
+_DENSE = 1
+
+_U64 = np.uint64
+
+
+def _hash(values) -> np.ndarray:
+    # splitmix64 finalizer, spreads consecutive ids over all 64 bits
+    with np.errstate(over="ignore"):
+        x = np.asarray(values, dtype=np.int64).astype(_U64)
+        x = x + _U64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> _U64(30))) * _U64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> _U64(27))) * _U64(0x94D049BB133111EB)
+        return x ^ (x >> _U64(31))
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    # Vectorized int.bit_length() for uint64, by binary search over the shift
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= (_U64(1) << _U64(shift))
+        x = np.where(high, x >> _U64(shift), x)
+        length += high * shift
+    return length + (x > 0)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch of a set of integer ids.
+
+    Sketches of the same precision merge by taking the register-wise
+    maximum, so the distinct count over a date range is the count of the
+    merged daily sketches. Small sketches are stored sparse.
+    """
+
+    def __init__(self, registers: np.ndarray = None):
+        self.registers = np.zeros(REGISTERS, dtype=np.uint8) if registers is None else registers
+
+    def add(self, value: int) -> None:
+        self.add_many([value])
+
+    def add_many(self, values) -> None:
+        """
+        Add a batch of ids in a few vectorized passes.
+        """
+        hashed = _hash(values)
+        index = (hashed >> _U64(64 - PRECISION)).astype(np.intp)
+        rest = hashed & _U64((1 << (64 - PRECISION)) - 1)
+        rank = (64 - PRECISION) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        estimate = alpha * REGISTERS ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are empty
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * np.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize as (index << 8 | rank) pairs while that is smaller than
+        the dense registers.
+        """
+        index = np.flatnonzero(self.registers)
+        if len(index) * 4 < REGISTERS:
+            pairs = (index.astype("<u4") << 8) | self.registers[index]
+            return bytes([_SPARSE]) + pairs.astype("<u4").tobytes()
+        return bytes([_DENSE]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        if data[0] == _DENSE:
+            return cls(np.frombuffer(data, dtype=np.uint8, offset=1).copy())
+        pairs = np.frombuffer(data, dtype="<u4", offset=1)
+        registers = np.zeros(REGISTERS, dtype=np.uint8)
+        registers[pairs >> 8] = pairs & 0xFF
+        return cls(registers)
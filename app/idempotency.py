@@ -0,0 +1,117 @@
+import datetime
+from typing import Any, Optional
+
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.dependencies import get_db
+from app.models import IdempotencyKey
+from app.models import User as UserModel
+from auth.dependencies import get_current_user
+
+
+class IdempotentReplay(Exception):
+    """
+    Raised by the dependency when the key was already used, to answer with
+    the stored response before the handler runs.
+    """
+
+    def __init__(self, status_code: int, response_body: Any):
+        self.status_code = status_code
+        self.response_body = response_body
+
+
+def replay_stored_response(request: Request, exc: IdempotentReplay) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content=exc.response_body,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class Idempotency:
+    """
+    Idempotency-Key of the current request. Handlers call save() with their
+    response before committing, so the response is stored atomically with
+    the changes it describes.
+    """
+
+    def __init__(self, session: Session, user_id: int, key: Optional[str], request: Request):
+        self.session = session
+        self.user_id = user_id
+        self.key = key
+        self.method = request.method
+        self.path = request.url.path
+
+    def lookup(self) -> Optional[IdempotencyKey]:
+        if self.key is None:
+            return None
+        return (
+            self.session.query(IdempotencyKey)
+            .filter(
+                IdempotencyKey.user_id == self.user_id,
+                IdempotencyKey.key == self.key,
+                IdempotencyKey.expires_at > datetime.datetime.utcnow(),
+            )
+            .first()
+        )
+
+    def save(self, response: Any, status_code: int) -> None:
+        if self.key is None:
+            return
+
+        now = datetime.datetime.utcnow()
+        # Drop this user's expired keys, and with them a possible expired row for this key
+        self.session.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == self.user_id,
+            IdempotencyKey.expires_at <= now,
+        ).delete(synchronize_session=False)
+
+        self.session.add(
+            IdempotencyKey(
+                user_id=self.user_id,
+                key=self.key,
+                method=self.method,
+                path=self.path,
+                status_code=status_code,
+                response_body=jsonable_encoder(response),
+                expires_at=now + datetime.timedelta(hours=settings.idempotency_ttl_hours),
+            )
+        )
+        try:
+            self.session.flush()
+        except IntegrityError as e:
+            # A concurrent request with the same key got there first
+            self.session.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is already being processed.",
+            ) from e
+
+
+def get_idempotency(
+        request: Request,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+) -> Idempotency:
+    """
+    Read the Idempotency-Key header and replay the stored response if the
+    key was already used by this user.
+    """
+    idempotency = Idempotency(session, current_user.id, idempotency_key, request)
+
+    stored = idempotency.lookup()
+    if stored is not None:
+        if (stored.method, stored.path) != (idempotency.method, idempotency.path):
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request.",
+            )
+        raise IdempotentReplay(stored.status_code, stored.response_body)
+
+    return idempotency
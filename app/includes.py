@@ -0,0 +1,80 @@
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.book_counts import select_with_book_counts
+from app.models import Author, Genre, Publisher
+from app.schemas import (
+    AuthorResponse,
+    GenreResponse,
+    PublisherResponse,
+    AuthorListAdapter,
+    GenreListAdapter,
+    PublisherListAdapter,
+)
+from app.serialization import dump_rows
+
+# Relations that can be embedded in book listings: model, schema, list adapter, foreign key
+BOOK_RELATIONS = {
+    "author": (Author, AuthorResponse, AuthorListAdapter, "author_id"),
+    "genre": (Genre, GenreResponse, GenreListAdapter, "genre_id"),
+    "publisher": (Publisher, PublisherResponse, PublisherListAdapter, "publisher_id"),
+}
+
+
+def book_includes(
+        include: Optional[str] = Query(
+            None, description=f"Comma-separated relations to embed: {', '.join(BOOK_RELATIONS)}"
+        ),
+) -> tuple[str, ...]:
+    """
+    Read the `include=` query parameter. Returns the requested relations in a
+    fixed order, so equal requests share a cache key.
+    """
+    if include is None:
+        return ()
+
+    requested = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = requested - set(BOOK_RELATIONS)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown relations: {', '.join(sorted(unknown))}. Allowed: {', '.join(BOOK_RELATIONS)}.",
+        )
+    return tuple(name for name in BOOK_RELATIONS if name in requested)
+
+
+def include_foreign_keys(fields: tuple[str, ...], include: tuple[str, ...]) -> tuple[str, ...]:
+    # Select the foreign keys of the included relations even if not requested, embed_book_relations drops them
+    foreign_keys = [BOOK_RELATIONS[name][3] for name in include]
+    return fields + tuple(key for key in foreign_keys if key not in fields)
+
+
+def embed_book_relations(
+        session: Session, books: list[dict], include: tuple[str, ...], fields: tuple[str, ...], branch_id: int
+) -> list[dict]:
+    """
+    Embed the included relations into already dumped books, with the book
+    counts of the branch.
+
+    Each relation is loaded with one `WHERE id IN (...)` query for the whole
+    page, however many books reference it. Foreign keys that were only
+    selected for the lookup, and aren't in `fields`, are removed.
+    """
+    for name in include:
+        model, schema, adapter, foreign_key = BOOK_RELATIONS[name]
+        ids = {book[foreign_key] for book in books if book[foreign_key] is not None}
+
+        related = {}
+        if ids:
+            rows = session.execute(
+                select_with_book_counts(model, schema, branch_id).where(model.id.in_(ids))
+            ).all()
+            related = {row["id"]: row for row in dump_rows(adapter, rows)}
+
+        for book in books:
+            book[name] = related.get(book[foreign_key])
+            if foreign_key not in fields:
+                del book[foreign_key]
+    return books
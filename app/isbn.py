@@ -0,0 +1,90 @@
+import re
+from typing import Iterable, Optional
+
+# Ten or thirteen digits, optionally grouped by single hyphens or spaces.
+# The last character of an ISBN-10 may be an X, its check digit 10.
+_ISBN_PATTERN = re.compile(r"(?:\d[- ]?){9}[\dXx]|(?:\d[- ]?){12}\d")
+
+# Deletes the group separators
+_SEPARATORS = str.maketrans("", "", "- ")
+
+# Weights of the digits of an ISBN-10 and of the first 12 digits of an ISBN-13
+_WEIGHTS_10 = range(10, 0, -1)
+_WEIGHTS_13 = (1, 3) * 6
+
+INVALID_ISBN = "Invalid ISBN. Must be an ISBN-10 or ISBN-13 with a valid check digit."
+
+
+def _check_digit_13(digits: str) -> str:
+    # Check digit of the first 12 digits of an ISBN-13
+    total = sum(int(digit) * weight for digit, weight in zip(digits, _WEIGHTS_13))
+    return str(-total % 10)
+
+
+def normalize_isbn(value: str) -> str:
+    """
+    Return the 13 digits of an ISBN-10 or ISBN-13, with or without hyphens
+    or spaces, so that every way of writing a book's ISBN compares equal.
+    Raises ValueError when the format or the check digit is wrong.
+    """
+    if not _ISBN_PATTERN.fullmatch(value):
+        raise ValueError(INVALID_ISBN)
+    digits = value.translate(_SEPARATORS).upper()
+
+    if len(digits) == 10:
+        total = sum(
+            (10 if digit == "X" else int(digit)) * weight for digit, weight in zip(digits, _WEIGHTS_10)
+        )
+        if total % 11 or "X" in digits[:9]:
+            raise ValueError(INVALID_ISBN)
+        digits = "978" + digits[:9]
+        return digits + _check_digit_13(digits)
+
+    if not digits.startswith(("978", "979")) or _check_digit_13(digits) != digits[12]:
+        raise ValueError(INVALID_ISBN)
+    return digits
+
+
+def normalize_isbns(values: Iterable[str]) -> list[Optional[str]]:
+    """
+    Normalize a batch of ISBNs like `normalize_isbn`, with None in place of
+    the invalid ones. The checksums of the whole batch are computed at once
+    with NumPy, for imports of many books.
+    """
+    import numpy as np
+
+    values = list(values)
+    results: list[Optional[str]] = [None] * len(values)
+    # Positions and separator-free digits of the well-formed ISBNs, by length
+    positions: dict[int, list[int]] = {10: [], 13: []}
+    digits: dict[int, list[str]] = {10: [], 13: []}
+    for position, value in enumerate(values):
+        if _ISBN_PATTERN.fullmatch(value):
+            compact = value.translate(_SEPARATORS).upper()
+            positions[len(compact)].append(position)
+            digits[len(compact)].append(compact)
+
+    if digits[10]:
+        codes = np.frombuffer("".join(digits[10]).encode("ascii"), dtype=np.uint8).reshape(-1, 10)
+        values_10 = codes.astype(np.int64) - ord("0")
+        values_10[codes == ord("X")] = 10
+        valid = (values_10 @ np.arange(10, 0, -1)) % 11 == 0
+        # Only the check digit may be an X
+        valid &= (codes[:, :9] != ord("X")).all(axis=1)
+        # The ISBN-13 of the same book: 978, the first 9 digits and a new check digit
+        prefixed = np.hstack([np.full((len(codes), 3), [9, 7, 8]), values_10[:, :9]])
+        checks = -(prefixed @ np.array(_WEIGHTS_13)) % 10
+        for position, compact, check, ok in zip(positions[10], digits[10], checks, valid):
+            if ok:
+                results[position] = f"978{compact[:9]}{check}"
+
+    if digits[13]:
+        codes = np.frombuffer("".join(digits[13]).encode("ascii"), dtype=np.uint8).reshape(-1, 13)
+        values_13 = codes.astype(np.int64) - ord("0")
+        valid = (values_13 @ np.array(_WEIGHTS_13 + (1,))) % 10 == 0
+        valid &= (values_13[:, 0] == 9) & (values_13[:, 1] == 7) & (values_13[:, 2] >= 8)
+        for position, compact, ok in zip(positions[13], digits[13], valid):
+            if ok:
+                results[position] = compact
+
+    return results
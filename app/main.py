@@ -1,21 +1,96 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 
 from auth.routes import router as auth_router
+from app.availability import AVAILABILITY_CHANNEL, get_broadcaster
+from app.cache import INVALIDATION_CHANNEL, handle_invalidation
+from app.config import settings
+from app.database import dispose_engine, init_engine
+from app.dependencies import ReadYourWritesMiddleware
+from app.idempotency import IdempotentReplay, replay_stored_response
+from app.notifications import PgListener
+from app.rate_limit import RateLimitMiddleware
+from app.readers import ReaderSketchJob
+from app.reports import shutdown_report_pool, submit_queued_reports
 from app.routers.authors import router as author_router
 from app.routers.books import router as book_router
 from app.routers.borrow_return import router as borrow_return_router
+from app.routers.changes import router as changes_router
+from app.routers.exports import router as export_router
 from app.routers.genres import router as genre_router
+from app.routers.me import router as me_router
 from app.routers.publishers import router as publisher_router
+from app.routers.reports import router as report_router
+from app.slow_query import SlowQueryMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the engine and warm up its pool before serving traffic
+    engine = await run_in_threadpool(init_engine)
+
+    # Hear about changes committed by the other workers
+    listener = PgListener(engine)
+    listener.subscribe(INVALIDATION_CHANNEL, handle_invalidation)
+
+    # Fan borrow and return events out to this worker's availability streams
+    broadcaster = get_broadcaster()
+    broadcaster.bind(asyncio.get_running_loop())
+    listener.subscribe(AVAILABILITY_CHANNEL, broadcaster.publish)
+    listener.start()
+
+    # Keep the "borrowed together" recommendations up to date
+    recommendations = None
+    if settings.recommendations_refresh_seconds > 0:
+        # NumPy and SciPy are only imported when the job is enabled
+        from app.recommendations import RecommendationJob
+
+        recommendations = RecommendationJob(
+            engine, settings.recommendations_refresh_seconds, settings.recommendations_top_k
+        )
+        recommendations.start()
+
+    # Fold new borrowings into the distinct-reader sketches
+    reader_sketches = None
+    if settings.reader_sketches_refresh_seconds > 0:
+        reader_sketches = ReaderSketchJob(engine, settings.reader_sketches_refresh_seconds)
+        reader_sketches.start()
+
+    # Pick up the report jobs queued before a restart
+    await run_in_threadpool(submit_queued_reports, engine)
+
+    yield
+
+    shutdown_report_pool()
+    if reader_sketches is not None:
+        await run_in_threadpool(reader_sketches.stop)
+    if recommendations is not None:
+        await run_in_threadpool(recommendations.stop)
+    await run_in_threadpool(listener.stop)
+    dispose_engine()
+
+
+app = FastAPI(title="Library Management System", lifespan=lifespan)
 
-app = FastAPI(title="Library Management System")
+app.add_middleware(SlowQueryMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_exception_handler(IdempotentReplay, replay_stored_response)
 
 # Register the routers
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(author_router, tags=["author"])
 app.include_router(book_router, tags=["book"])
 app.include_router(borrow_return_router, tags=["borrow_return"])
+app.include_router(changes_router, tags=["changes"])
+app.include_router(export_router, tags=["export"])
 app.include_router(genre_router, tags=["genre"])
+app.include_router(me_router, tags=["me"])
 app.include_router(publisher_router, tags=["publisher"])
+app.include_router(report_router, tags=["report"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,14 +1,34 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Date, Boolean
+from sqlalchemy import (
+    BigInteger, Column, String, Integer, ForeignKey, Date, Boolean, DateTime, JSON, Index, LargeBinary,
+    DDL, event, func, text,
+)
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
+# Branch of the rows written before there were branches, and of single-branch installs
+DEFAULT_BRANCH_ID = 1
+
+
+class Branch(Base):
+    __tablename__ = "branches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+# Created with the table, it gets the first id
+event.listen(Branch.__table__, "after_create", DDL("INSERT INTO branches (name) VALUES ('main')"))
+
+
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # The branch whose books the user sees and borrows
+    branch_id = Column(Integer, ForeignKey("branches.id"), nullable=False, server_default=str(DEFAULT_BRANCH_ID))
 
     borrowing_history = relationship("BorrowingHistory", back_populates="user")
 
@@ -44,15 +64,62 @@ class Publisher(Base):
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # Filters of GET /books within a branch, each followed by the id to page through the matches in order.
+        # Every index of the listings leaves out deleted books, so they are never scanned.
+        Index("ix_books_branch_id_id", "branch_id", "id", postgresql_where=text("deleted_at IS NULL")),
+        Index(
+            "ix_books_branch_id_genre_id_id", "branch_id", "genre_id", "id",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_books_branch_id_author_id_id", "branch_id", "author_id", "id",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_books_branch_id_publisher_id_id", "branch_id", "publisher_id", "id",
+            postgresql_where=text("publisher_id IS NOT NULL AND deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_books_branch_id_publish_date_id", "branch_id", "publish_date", "id",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_books_branch_id_available_id", "branch_id", "id",
+            postgresql_where=text("available AND deleted_at IS NULL"),
+        ),
+        # Titles and ISBNs are unique within a branch among the books that aren't deleted,
+        # so a deleted book can be added again
+        Index(
+            "ix_books_branch_id_title", "branch_id", "title", unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_books_branch_id_isbn", "branch_id", "isbn", unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        # GET /books/isbn/{isbn}, and one book per ISBN however it is written
+        Index(
+            "ix_books_branch_id_isbn13", "branch_id", "isbn13", unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, nullable=False, unique=True)
-    isbn = Column(String, unique=True, nullable=False)
+    branch_id = Column(Integer, ForeignKey("branches.id"), nullable=False, server_default=str(DEFAULT_BRANCH_ID))
+    title = Column(String, nullable=False)
+    isbn = Column(String, nullable=False)
+    # The ISBN as 13 digits, NULL only for books stored before ISBNs were checked whose check digit is wrong
+    isbn13 = Column(String(13))
     author_id = Column(Integer, ForeignKey("authors.id"), nullable=False)
     genre_id = Column(Integer, ForeignKey("genres.id"), nullable=False)
     publisher_id = Column(Integer, ForeignKey("publishers.id"), nullable=True)
     publish_date = Column(Date)
     available = Column(Boolean, default=True)
+    # Incremented by every update, compared with If-Match to detect concurrent edits
+    version = Column(Integer, nullable=False, server_default="1")
+    # Set when the book is deleted, the row is kept for its borrowing history
+    deleted_at = Column(DateTime)
 
     author = relationship("Author", back_populates="books")
     genre = relationship("Genre", back_populates="books")
@@ -60,10 +127,141 @@ class Book(Base):
     borrowing_history = relationship("BorrowingHistory", back_populates="book")
 
 
+# Live books of an author in a branch, and those of them that are available, kept up to date
+# by the books' triggers. A row exists while the author has books in the branch.
+class AuthorBookCount(Base):
+    __tablename__ = "author_book_counts"
+    __table_args__ = (
+        # GET /authors?sort_by=book_count or available_count, most books of the branch first
+        Index(
+            "ix_author_book_counts_branch_id_book_count_author_id",
+            "branch_id", text("(-book_count)"), "author_id",
+        ),
+        Index(
+            "ix_author_book_counts_branch_id_available_count_author_id",
+            "branch_id", text("(-available_count)"), "author_id",
+        ),
+    )
+
+    branch_id = Column(Integer, ForeignKey("branches.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("authors.id"), primary_key=True)
+    book_count = Column(Integer, nullable=False)
+    available_count = Column(Integer, nullable=False)
+
+
+class GenreBookCount(Base):
+    __tablename__ = "genre_book_counts"
+
+    branch_id = Column(Integer, ForeignKey("branches.id"), primary_key=True)
+    genre_id = Column(Integer, ForeignKey("genres.id"), primary_key=True)
+    book_count = Column(Integer, nullable=False)
+    available_count = Column(Integer, nullable=False)
+
+
+class PublisherBookCount(Base):
+    __tablename__ = "publisher_book_counts"
+
+    branch_id = Column(Integer, ForeignKey("branches.id"), primary_key=True)
+    publisher_id = Column(Integer, ForeignKey("publishers.id"), primary_key=True)
+    book_count = Column(Integer, nullable=False)
+    available_count = Column(Integer, nullable=False)
+
+
+# Keeps the counts of the books' branch, author, genre and publisher in step with the books,
+# in the transaction that changes the books, whichever statement changes them.
+# Adds the counts of one book, or removes them with a delta of -1.
+BOOK_COUNTS_ADD_FUNCTION = """
+CREATE OR REPLACE FUNCTION books_add_counts(
+    book_branch_id integer, book_author_id integer, book_genre_id integer, book_publisher_id integer,
+    book_available boolean, delta integer
+) RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    available_delta integer := delta * (book_available IS TRUE)::int;
+BEGIN
+    INSERT INTO author_book_counts AS counts (branch_id, author_id, book_count, available_count)
+    VALUES (book_branch_id, book_author_id, delta, available_delta)
+    ON CONFLICT (branch_id, author_id) DO UPDATE SET
+        book_count = counts.book_count + EXCLUDED.book_count,
+        available_count = counts.available_count + EXCLUDED.available_count;
+    INSERT INTO genre_book_counts AS counts (branch_id, genre_id, book_count, available_count)
+    VALUES (book_branch_id, book_genre_id, delta, available_delta)
+    ON CONFLICT (branch_id, genre_id) DO UPDATE SET
+        book_count = counts.book_count + EXCLUDED.book_count,
+        available_count = counts.available_count + EXCLUDED.available_count;
+    IF book_publisher_id IS NOT NULL THEN
+        INSERT INTO publisher_book_counts AS counts (branch_id, publisher_id, book_count, available_count)
+        VALUES (book_branch_id, book_publisher_id, delta, available_delta)
+        ON CONFLICT (branch_id, publisher_id) DO UPDATE SET
+            book_count = counts.book_count + EXCLUDED.book_count,
+            available_count = counts.available_count + EXCLUDED.available_count;
+    END IF;
+    -- Without books left in the branch the row goes, so the counts hold only what is listed by count
+    IF delta < 0 THEN
+        DELETE FROM author_book_counts
+        WHERE branch_id = book_branch_id AND author_id = book_author_id AND book_count = 0;
+        DELETE FROM genre_book_counts
+        WHERE branch_id = book_branch_id AND genre_id = book_genre_id AND book_count = 0;
+        DELETE FROM publisher_book_counts
+        WHERE branch_id = book_branch_id AND publisher_id = book_publisher_id AND book_count = 0;
+    END IF;
+END
+$$
+"""
+
+BOOK_COUNTS_FUNCTION = """
+CREATE OR REPLACE FUNCTION books_update_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.deleted_at IS NULL THEN
+        PERFORM books_add_counts(OLD.branch_id, OLD.author_id, OLD.genre_id, OLD.publisher_id, OLD.available, -1);
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.deleted_at IS NULL THEN
+        PERFORM books_add_counts(NEW.branch_id, NEW.author_id, NEW.genre_id, NEW.publisher_id, NEW.available, 1);
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+BOOK_COUNTS_TRIGGERS = [
+    """
+    CREATE TRIGGER books_counts_insert_delete AFTER INSERT OR DELETE ON books
+    FOR EACH ROW EXECUTE FUNCTION books_update_counts()
+    """,
+    # Only when a book changes branch, author, genre, publisher, availability or is deleted
+    """
+    CREATE TRIGGER books_counts_update AFTER UPDATE OF branch_id, author_id, genre_id, publisher_id, available, deleted_at
+    ON books FOR EACH ROW
+    WHEN ((OLD.branch_id, OLD.author_id, OLD.genre_id, OLD.publisher_id, OLD.available, OLD.deleted_at IS NULL)
+          IS DISTINCT FROM
+          (NEW.branch_id, NEW.author_id, NEW.genre_id, NEW.publisher_id, NEW.available, NEW.deleted_at IS NULL))
+    EXECUTE FUNCTION books_update_counts()
+    """,
+]
+
+for statement in [BOOK_COUNTS_ADD_FUNCTION, BOOK_COUNTS_FUNCTION, *BOOK_COUNTS_TRIGGERS]:
+    event.listen(Book.__table__, "after_create", DDL(statement))
+
+
 class BorrowingHistory(Base):
     __tablename__ = "borrowing_history"
+    __table_args__ = (
+        # A user's open loans, read by borrowing and GET /me/loans
+        Index(
+            "ix_borrowing_history_open_loans", "branch_id", "user_id", "id",
+            postgresql_where=text("return_date IS NULL"),
+        ),
+        # A user's past loans, paged through by id
+        Index(
+            "ix_borrowing_history_past_loans", "branch_id", "user_id", "id",
+            postgresql_where=text("return_date IS NOT NULL"),
+        ),
+        # A book's history, paged through by id
+        Index("ix_borrowing_history_branch_id_book_id_id", "branch_id", "book_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    # The branch of the book and of the borrower
+    branch_id = Column(Integer, ForeignKey("branches.id"), nullable=False, server_default=str(DEFAULT_BRANCH_ID))
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     borrow_date = Column(Date, nullable=False)
@@ -71,3 +269,90 @@ class BorrowingHistory(Base):
 
     book = relationship("Book", back_populates="borrowing_history")
     user = relationship("User", back_populates="borrowing_history")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    method = Column(String(10), nullable=False)
+    path = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(JSON, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # GET /changes reads events in (txid, id) order
+        Index("ix_outbox_events_txid_id", "txid", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    # Id of the writing transaction, events are only served once every older transaction has ended
+    txid = Column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+    aggregate = Column(String(50), nullable=False)
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    # Branch of a book or borrowing event, NULL for the authors, genres and publishers all branches share
+    branch_id = Column(Integer)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class BookRecommendation(Base):
+    __tablename__ = "book_recommendations"
+
+    # The primary key serves a book's recommendations in rank order
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    recommended_book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    # Number of users who borrowed both books
+    score = Column(Integer, nullable=False)
+
+
+class ReaderSketch(Base):
+    __tablename__ = "reader_sketches"
+
+    # "book" or "genre", the primary key serves date ranges of one book or genre
+    scope = Column(String(10), primary_key=True)
+    scope_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    # HyperLogLog of the ids of the users who borrowed that day, see app.hll
+    sketch = Column(LargeBinary, nullable=False)
+
+
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    # Transactions before this id have been processed by the job
+    horizon = Column(BigInteger, nullable=False)
+
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        # Jobs still waiting for a worker, submitted again when the app starts
+        Index("ix_report_jobs_queued", "id", postgresql_where=text("status = 'queued'")),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(30), nullable=False)
+    format = Column(String(10), nullable=False)
+    params = Column(JSON, nullable=False)
+    # queued, running, succeeded or failed
+    status = Column(String(10), nullable=False, server_default="queued")
+    # Set by the run that claimed the job, whose outcome is the only one recorded
+    claim = Column(String(32))
+    path = Column(String)
+    row_count = Column(Integer)
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime)
+    # Updated while the job runs, a running job without recent heartbeats has lost its worker
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
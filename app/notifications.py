@@ -0,0 +1,121 @@
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Optional
+
+import psycopg2
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def notify(session: Session, channel: str, payload: Any) -> None:
+    """
+    Queue a Postgres notification in the session's transaction.
+
+    Queued notifications are sent in one statement right before commit.
+    NOTIFY is transactional: listeners only hear about it once the
+    transaction commits, and never if it is rolled back.
+    """
+    # Begin the transaction now, so that rolling it back before any SQL ran discards the queue
+    if not session.in_transaction():
+        session.begin()
+    session.info.setdefault("pending_notifications", []).append(
+        (channel, json.dumps(payload))
+    )
+
+
+@event.listens_for(Session, "before_commit")
+def _send_notifications(session):
+    pending = session.info.pop("pending_notifications", None)
+    if not pending:
+        return
+
+    params = {}
+    calls = []
+    for i, (channel, payload) in enumerate(pending):
+        params[f"channel_{i}"] = channel
+        params[f"payload_{i}"] = payload
+        calls.append(f"pg_notify(:channel_{i}, :payload_{i})")
+    session.execute(text(f"SELECT {', '.join(calls)}"), params)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_notifications(session, previous_transaction):
+    # Unlike after_rollback, also fires when no SQL ran. Rolling back a savepoint keeps the queue.
+    if previous_transaction.parent is None:
+        session.info.pop("pending_notifications", None)
+
+
+class PgListener:
+    """
+    One LISTEN connection per worker, shared by every channel the worker
+    cares about. Payloads are dispatched to the subscribed callbacks from a
+    background thread; a lost connection is reopened after `retry_seconds`.
+    """
+
+    def __init__(self, engine: Engine, retry_seconds: float = 1.0):
+        _, self._connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        self.retry_seconds = retry_seconds
+        self._handlers: dict[str, list[Callable[[Any], None]]] = defaultdict(list)
+        self._stop = threading.Event()
+        self._listening = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str, handler: Callable[[Any], None]) -> None:
+        # Subscribe before start(), channels are LISTENed to when connecting
+        self._handlers[channel].append(handler)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def wait_until_listening(self, timeout: float = 5.0) -> bool:
+        return self._listening.wait(timeout)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                self._listening.clear()
+                logger.exception("Listener connection lost, reconnecting")
+                self._stop.wait(self.retry_seconds)
+
+    def _listen(self) -> None:
+        conn = psycopg2.connect(**self._connect_kwargs)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                for channel in self._handlers:
+                    cursor.execute(f'LISTEN "{channel}"')
+            self._listening.set()
+
+            while not self._stop.is_set():
+                # Wake up regularly to notice stop()
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    message = conn.notifies.pop(0)
+                    self._dispatch(message.channel, message.payload)
+        finally:
+            self._listening.clear()
+            conn.close()
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        data = json.loads(payload)
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(data)
+            except Exception:
+                logger.exception("Handler for channel %s failed", channel)
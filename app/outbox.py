@@ -0,0 +1,46 @@
+from typing import Any, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert, literal_column
+from sqlalchemy.orm import Session
+
+from app.models import OutboxEvent
+
+
+def record_event(
+        session: Session, aggregate: str, event_type: str, payload: Any, branch_id: Optional[int] = None
+) -> None:
+    """
+    Write an event to the outbox in the session's transaction, so it is
+    published if and only if the change itself commits.
+
+    `payload` is a schema or a dict carrying the changed row's `id`.
+    `branch_id` limits the event to the consumers of a branch.
+    """
+    record_events(session, aggregate, event_type, [payload], branch_id)
+
+
+def record_events(
+        session: Session, aggregate: str, event_type: str, payloads: Iterable[Any], branch_id: Optional[int] = None
+) -> None:
+    # One INSERT for all the rows of a bulk change
+    rows = []
+    for payload in payloads:
+        data = jsonable_encoder(payload)
+        rows.append({
+            "aggregate": aggregate,
+            "aggregate_id": data["id"],
+            "event_type": event_type,
+            "payload": data,
+            "branch_id": branch_id,
+        })
+    if rows:
+        session.execute(insert(OutboxEvent), rows)
+
+
+def visible_horizon():
+    """
+    Oldest transaction still running. Events written by older transactions
+    are final: nothing can be committed before them in (txid, id) order any more.
+    """
+    return literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
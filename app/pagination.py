@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import date
+from typing import Any, Optional, Sequence
+
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_, tuple_
+
+
+def encode_cursor(scope: str, values: Sequence[Any]) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor.
+    `scope` names the ordering, so a cursor can't be reused with another one.
+    """
+    payload = [scope, [value.isoformat() if isinstance(value, date) else value for value in values]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: str, columns: Sequence) -> list:
+    """
+    Decode a cursor made by `encode_cursor` for the ordering `scope` over
+    `columns`. Raises 400 for anything else.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_scope, values = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_scope != scope or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            date.fromisoformat(value)
+            if value is not None and column.type.python_type is date
+            else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _nullable(column) -> bool:
+    # A column, or an expression of one column like -column, is as nullable as the column
+    expression = column.expression
+    return getattr(getattr(expression, "element", expression), "nullable", True)
+
+
+def keyset_after(columns: Sequence, values: Sequence[Any]):
+    """
+    Condition selecting the rows after `values` in ascending `columns` order.
+
+    The last column must be unique and not null, like a primary key. Other
+    columns may be nullable, NULLs sort last as in Postgres. Without nullable
+    columns this is a single row comparison, which an index on the same
+    columns serves as a range scan. For a descending order, sort by the
+    negated column and index the same expression.
+    """
+    if not any(_nullable(column) for column in columns[:-1]):
+        return tuple_(*columns) > tuple_(*values)
+
+    column, value = columns[0], values[0]
+    rest = keyset_after(columns[1:], values[1:])
+    if value is None:
+        return and_(column.is_(None), rest)
+    return or_(column > value, and_(column == value, rest), column.is_(None))
+
+
+def paginate(query, order_by: Sequence, scope: str, limit: int, cursor: Optional[str]):
+    """
+    Order `query` by `order_by`, continue after `cursor` and fetch one row
+    more than `limit` to know whether there is a next page. The sort key is
+    selected along as `sort_key_0`, `sort_key_1`, ...
+    """
+    if cursor is not None:
+        query = query.where(keyset_after(order_by, decode_cursor(cursor, scope, order_by)))
+    return (
+        query.add_columns(*[column.label(f"sort_key_{i}") for i, column in enumerate(order_by)])
+        .order_by(*order_by)
+        .limit(limit + 1)
+    )
+
+
+def split_page(rows: Sequence, scope: str, limit: int) -> tuple[list, Optional[str]]:
+    """
+    Split the rows of a `paginate` query into the page and the cursor of the
+    next page, None on the last page.
+    """
+    if len(rows) <= limit:
+        return list(rows), None
+
+    rows = list(rows[:limit])
+    last = rows[-1]._mapping
+    count = sum(1 for key in last.keys() if key.startswith("sort_key_"))
+    return rows, encode_cursor(scope, [last[f"sort_key_{i}"] for i in range(count)])
+
+
+class Pagination:
+    """
+    Dependency reading `limit` and `cursor` of cursor paginated list endpoints.
+    """
+
+    def __init__(
+            self,
+            limit: int = Query(20, ge=1, le=100),  # Page size, default is 20, max 100
+            cursor: Optional[str] = Query(None),  # next_cursor of the previous page
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.limit}:{self.cursor}"
+
+    def paginate(self, query, order_by: Sequence, scope: str):
+        return paginate(query, order_by, scope, self.limit, self.cursor)
+
+    def split(self, rows: Sequence, scope: str) -> tuple[list, Optional[str]]:
+        return split_page(rows, scope, self.limit)
+
+    def envelope(self, items: list, next_cursor: Optional[str]) -> dict:
+        # The response of every cursor paginated endpoint, see schemas.Page
+        return {
+            "pagination": {"limit": self.limit, "next_cursor": next_cursor},
+            "items": items,
+        }
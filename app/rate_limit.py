@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from app.config import settings
+from auth.utils import verify_token_subject
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    capacity: int  # Requests allowed in a burst
+    refill_per_second: float  # Sustained request rate
+    key_by: str = "user"  # "user" falls back to the client IP for anonymous requests
+
+
+# Policies per (method, path). Login runs bcrypt and is limited per IP,
+# circulation endpoints are limited per user.
+POLICIES = {
+    ("POST", "/auth/token"): RateLimitPolicy(capacity=10, refill_per_second=10 / 60, key_by="ip"),
+    ("POST", "/auth/signup"): RateLimitPolicy(capacity=5, refill_per_second=5 / 60, key_by="ip"),
+    ("POST", "/borrow"): RateLimitPolicy(capacity=10, refill_per_second=1),
+    ("POST", "/return"): RateLimitPolicy(capacity=10, refill_per_second=1),
+}
+
+
+class MemoryBucketStore:
+    """
+    Token buckets of this worker. Taking a token is O(1); buckets that have
+    refilled completely are dropped once the store grows past `max_buckets`.
+    """
+
+    local = True
+
+    def __init__(self, max_buckets: int = 100_000):
+        self.max_buckets = max_buckets
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, policy: RateLimitPolicy) -> tuple[bool, float]:
+        """
+        Take a token from the bucket. Return whether the request is allowed
+        and, if not, the seconds until the next token.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (policy.capacity, now))
+            tokens = min(policy.capacity, tokens + (now - updated_at) * policy.refill_per_second)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            if key not in self._buckets and len(self._buckets) >= self.max_buckets:
+                self._prune(now, policy)
+            self._buckets[key] = (tokens, now)
+
+        retry_after = 0.0 if allowed else (1 - tokens) / policy.refill_per_second
+        return allowed, retry_after
+
+    def _prune(self, now: float, policy: RateLimitPolicy) -> None:
+        self._buckets = {
+            key: (tokens, updated_at)
+            for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * policy.refill_per_second < policy.capacity
+        }
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared by all workers. Each take is one atomic script call
+    on Redis, timed by the Redis clock. Requires the optional `redis` package.
+    """
+
+    local = False
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_URL requires the 'redis' package.") from e
+        self._take = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def take(self, key: str, policy: RateLimitPolicy) -> tuple[bool, float]:
+        allowed, tokens = self._take(
+            keys=[f"rate_limit:{key}"], args=[policy.capacity, policy.refill_per_second]
+        )
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / policy.refill_per_second
+
+
+_store = None
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        _store = (
+            RedisBucketStore(settings.rate_limit_url)
+            if settings.rate_limit_url
+            else MemoryBucketStore()
+        )
+    return _store
+
+
+def reset_bucket_store() -> None:
+    global _store
+    _store = None
+
+
+def _client_key(scope, policy: RateLimitPolicy) -> str:
+    if policy.key_by == "user":
+        authorization = Headers(scope=scope).get("Authorization")
+        _, token = get_authorization_scheme_param(authorization)
+        username = verify_token_subject(token)
+        if username is not None:
+            return f"user:{username}"
+
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware rejecting requests over their route's policy with
+    429 and Retry-After, before any handler, database or bcrypt work runs.
+    """
+
+    def __init__(self, app, policies: Optional[dict] = None):
+        self.app = app
+        self.policies = POLICIES if policies is None else policies
+
+    async def __call__(self, scope, receive, send):
+        policy = None
+        if scope["type"] == "http" and settings.rate_limit_enabled:
+            policy = self.policies.get((scope["method"], scope["path"]))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{scope['method']} {scope['path']} {_client_key(scope, policy)}"
+        store = get_bucket_store()
+        if store.local:
+            allowed, retry_after = store.take(key, policy)
+        else:
+            allowed, retry_after = await run_in_threadpool(store.take, key, policy)
+
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests."},
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,236 @@
+import datetime
+import logging
+import sys
+import threading
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models import Book, BorrowingHistory, JobWatermark, OutboxEvent, ReaderSketch
+from app.outbox import visible_horizon
+
+# NumPy, through app.hll, is only imported by the functions that build or read
+# sketches, so importing the app stays cheap.
+
+logger = logging.getLogger(__name__)
+
+# Scopes of the daily distinct-reader sketches
+BOOK = "book"
+GENRE = "genre"
+
+# Sketches written per INSERT
+WRITE_CHUNK_SIZE = 500
+
+# Events read per round trip when folding in new borrowings
+READ_BATCH_SIZE = 50_000
+
+# Advisory lock taken by a fold, so that one worker at a time writes sketches
+FOLD_LOCK_ID = 4_224_202
+
+# Name of the fold's progress in job_watermarks
+FOLD_WATERMARK = "reader_sketches"
+
+
+def distinct_readers(
+        session: Session, scope: str, scope_id: int, start: datetime.date, end: datetime.date
+) -> int:
+    """
+    Estimate the distinct borrowers of a book or genre between two dates,
+    inclusive, by merging the daily sketches.
+    """
+    from app.hll import HyperLogLog
+
+    merged = HyperLogLog()
+    sketches = session.scalars(
+        select(ReaderSketch.sketch).where(
+            ReaderSketch.scope == scope,
+            ReaderSketch.scope_id == scope_id,
+            ReaderSketch.day.between(start, end),
+        )
+    )
+    for data in sketches:
+        merged.merge(HyperLogLog.from_bytes(data))
+    return merged.count()
+
+
+def _group_sketches(scope: str, ids, users, day: datetime.date):
+    # One sketch per distinct id, built from the users of its rows in one vectorized pass each
+    import numpy as np
+
+    from app.hll import HyperLogLog
+
+    order = np.argsort(ids, kind="stable")
+    ids, users = ids[order], users[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    for scope_id, group in zip(ids[starts], np.split(users, starts[1:])):
+        sketch = HyperLogLog()
+        sketch.add_many(group)
+        yield {"scope": scope, "scope_id": int(scope_id), "day": day, "sketch": sketch}
+
+
+def _day_sketches(rows: Iterable[tuple]) -> list[dict]:
+    # Sketches of the (book id, genre id, user id, day) rows, per book and per genre and day
+    import numpy as np
+
+    by_day: dict[datetime.date, list[tuple[int, int, int]]] = {}
+    for book_id, genre_id, user_id, day in rows:
+        by_day.setdefault(day, []).append((book_id, genre_id, user_id))
+
+    sketches = []
+    for day, day_rows in by_day.items():
+        books, genres, users = np.array(day_rows, dtype=np.int64).T
+        sketches.extend(_group_sketches(BOOK, books, users, day))
+        sketches.extend(_group_sketches(GENRE, genres, users, day))
+    return sketches
+
+
+def _write_sketches(session: Session, sketches: list[dict], merge: bool) -> None:
+    # Upsert the sketches, merged into the stored ones of the same book or genre and day if `merge`
+    from app.hll import HyperLogLog
+
+    for chunk_start in range(0, len(sketches), WRITE_CHUNK_SIZE):
+        chunk = sketches[chunk_start:chunk_start + WRITE_CHUNK_SIZE]
+        if merge:
+            keys = [(row["scope"], row["scope_id"], row["day"]) for row in chunk]
+            stored = {
+                (scope, scope_id, day): data
+                for scope, scope_id, day, data in session.execute(
+                    select(ReaderSketch.scope, ReaderSketch.scope_id, ReaderSketch.day, ReaderSketch.sketch)
+                    .where(tuple_(ReaderSketch.scope, ReaderSketch.scope_id, ReaderSketch.day).in_(keys))
+                )
+            }
+            for row, key in zip(chunk, keys):
+                if key in stored:
+                    row["sketch"].merge(HyperLogLog.from_bytes(stored[key]))
+
+        statement = insert(ReaderSketch).values(
+            [{**row, "sketch": row["sketch"].to_bytes()} for row in chunk]
+        )
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[ReaderSketch.scope, ReaderSketch.scope_id, ReaderSketch.day],
+            set_={"sketch": statement.excluded.sketch},
+        ))
+
+
+def fold_borrowings(session: Session) -> Optional[int]:
+    """
+    Add the borrowers of the "borrowed" outbox events written since the
+    last fold to the sketches of their books and genres, in the session's
+    transaction. Returns the number of events, or None when another worker
+    is folding.
+
+    Adding a user to a sketch twice changes nothing, so events read again
+    after a failed fold are harmless.
+    """
+    if not session.scalar(select(func.pg_try_advisory_xact_lock(FOLD_LOCK_ID))):
+        return None
+
+    # Every transaction before the horizon has ended, its events are final
+    horizon = session.scalar(select(visible_horizon()))
+    start = session.scalar(select(JobWatermark.horizon).where(JobWatermark.name == FOLD_WATERMARK)) or 0
+
+    result = session.execute(
+        select(
+            OutboxEvent.payload["book_id"].as_integer(),
+            Book.genre_id,
+            OutboxEvent.payload["user_id"].as_integer(),
+            OutboxEvent.payload["borrow_date"].as_string(),
+        )
+        .join(Book, Book.id == OutboxEvent.payload["book_id"].as_integer())
+        .where(
+            OutboxEvent.txid >= start,
+            OutboxEvent.txid < horizon,
+            OutboxEvent.aggregate == "borrowing",
+            OutboxEvent.event_type == "borrowed",
+        )
+        .execution_options(yield_per=READ_BATCH_SIZE)
+    )
+    events = 0
+    for partition in result.partitions():
+        rows = [
+            (book_id, genre_id, user_id, datetime.date.fromisoformat(day))
+            for book_id, genre_id, user_id, day in partition
+        ]
+        _write_sketches(session, _day_sketches(rows), merge=True)
+        events += len(rows)
+
+    statement = insert(JobWatermark).values(name=FOLD_WATERMARK, horizon=horizon)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[JobWatermark.name], set_={"horizon": statement.excluded.horizon}
+    ))
+    return events
+
+
+class ReaderSketchJob:
+    """
+    Folds new borrowings into the sketches every `interval` seconds in a
+    background thread. Borrowing itself never touches the sketches, so
+    borrowers of the same genre don't queue on its daily row.
+    """
+
+    def __init__(self, engine: Engine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Optional[int]:
+        with Session(self.engine) as session:
+            events = fold_borrowings(session)
+            session.commit()
+        return events
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="reader-sketches", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                events = self.run_once()
+                if events:
+                    logger.info("Folded %d borrowings into the reader sketches", events)
+            except Exception:
+                logger.exception("Folding borrowings into the reader sketches failed")
+            self._stop.wait(self.interval)
+
+
+def rebuild_reader_sketches(session: Session, start: datetime.date, end: datetime.date) -> int:
+    """
+    Recompute the sketches of the days between two dates, inclusive, from
+    the borrowing history and replace the stored ones. Meant for backfilling
+    past days. Returns the number of sketches written.
+    """
+    written = 0
+    day = start
+    while day <= end:
+        rows = session.execute(
+            select(BorrowingHistory.book_id, Book.genre_id, BorrowingHistory.user_id, BorrowingHistory.borrow_date)
+            .join(Book, Book.id == BorrowingHistory.book_id)
+            .where(BorrowingHistory.borrow_date == day)
+        ).all()
+        sketches = _day_sketches(rows)
+        _write_sketches(session, sketches, merge=False)
+        written += len(sketches)
+        day += datetime.timedelta(days=1)
+    return written
+
+
+if __name__ == "__main__":
+    # Backfill: python -m app.readers 2024-01-01 2024-12-31
+    from app.database import SessionLocal, get_engine
+
+    get_engine()
+    first, last = (datetime.date.fromisoformat(arg) for arg in sys.argv[1:3])
+    with SessionLocal() as backfill_session:
+        count = rebuild_reader_sketches(backfill_session, first, last)
+        backfill_session.commit()
+    print(f"Wrote {count} sketches.")
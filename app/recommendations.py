@@ -0,0 +1,218 @@
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.cache import BOOKS, invalidate_on_commit
+from app.models import BookRecommendation, BorrowingHistory, OutboxEvent
+from app.outbox import visible_horizon
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock held by the one worker that keeps the model and writes recommendations
+REFRESH_LOCK_ID = 4_224_201
+
+# History rows read per round trip when folding in new borrowings
+READ_BATCH_SIZE = 50_000
+
+
+def _resized(matrix: sparse.csr_matrix, shape: tuple[int, int]) -> sparse.csr_matrix:
+    # Grow a matrix to fit new user or book ids
+    if matrix.shape == shape:
+        return matrix
+    matrix = matrix.copy()
+    matrix.resize(shape)
+    return matrix
+
+
+class CooccurrenceModel:
+    """
+    Counts, for every pair of books, the users who borrowed both.
+
+    `borrowed` is the binary users x books matrix and `cooccurrence` its
+    Gram matrix `borrowedᵀ · borrowed`, both indexed by ids. New borrowings
+    `D` are folded in without recomputing the product:
+
+        (B + D)ᵀ(B + D) = BᵀB + BᵀD + DᵀB + DᵀD
+
+    Only the rows of books touched by the update are ranked again and
+    written to `book_recommendations`.
+
+    The first update reads the whole history, later ones the "borrowed"
+    outbox events of the transactions that ended since. Folding a user/book
+    pair twice changes nothing, so the two sources may overlap.
+    """
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        # Transactions from this id on haven't been folded in yet, None before the first update
+        self.horizon: Optional[int] = None
+        self.borrowed = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.cooccurrence = sparse.csr_matrix((0, 0), dtype=np.int32)
+
+    def _read_pairs(self, session: Session, horizon: int) -> np.ndarray:
+        if self.horizon is None:
+            query = select(BorrowingHistory.user_id, BorrowingHistory.book_id)
+        else:
+            query = select(
+                OutboxEvent.payload["user_id"].as_integer(),
+                OutboxEvent.payload["book_id"].as_integer(),
+            ).where(
+                OutboxEvent.txid >= self.horizon,
+                OutboxEvent.txid < horizon,
+                OutboxEvent.aggregate == "borrowing",
+                OutboxEvent.event_type == "borrowed",
+            )
+        result = session.execute(query.execution_options(yield_per=READ_BATCH_SIZE))
+        chunks = [np.array(partition, dtype=np.int64) for partition in result.partitions()]
+        return np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+    def update(self, session: Session) -> np.ndarray:
+        """
+        Fold in the borrowings made since the last update and store the new
+        top-k neighbours of the affected books. Returns their ids.
+        """
+        # Every transaction before the horizon has ended, its borrowings are final
+        horizon = session.scalar(select(visible_horizon()))
+        pairs = self._read_pairs(session, horizon)
+        self.horizon = horizon
+        if not len(pairs):
+            return np.empty(0, dtype=np.int64)
+
+        users, books = pairs.T
+        shape = (
+            max(self.borrowed.shape[0], int(users.max()) + 1),
+            max(self.borrowed.shape[1], int(books.max()) + 1),
+        )
+        borrowed = _resized(self.borrowed, shape)
+
+        # Binary matrix of the user/book pairs that are new, repeated borrowings count once
+        new = sparse.csr_matrix(
+            (np.ones(len(users), dtype=np.int32), (users, books)), shape=shape
+        )
+        new.data[:] = 1
+        new = (new - new.multiply(borrowed)).tocsr()
+        new.eliminate_zeros()
+
+        delta = (borrowed.T @ new + new.T @ borrowed + new.T @ new).tocsr()
+        self.borrowed = (borrowed + new).tocsr()
+        self.cooccurrence = (_resized(self.cooccurrence, (shape[1], shape[1])) + delta).tocsr()
+
+        changed = np.unique(delta.nonzero()[0])
+        self._store(session, changed)
+        return changed
+
+    def neighbours(self, book_id: int) -> list[tuple[int, int]]:
+        """
+        Top-k (book id, score) pairs for a book, highest score first and
+        lowest id first among ties.
+        """
+        if book_id >= self.cooccurrence.shape[0]:
+            return []
+        row = self.cooccurrence.getrow(book_id)
+        keep = row.indices != book_id
+        indices, scores = row.indices[keep], row.data[keep]
+        order = np.lexsort((indices, -scores))[:self.top_k]
+        return [(int(indices[i]), int(scores[i])) for i in order]
+
+    def _store(self, session: Session, book_ids: np.ndarray) -> None:
+        if not len(book_ids):
+            return
+        session.execute(
+            delete(BookRecommendation).where(BookRecommendation.book_id.in_(book_ids.tolist()))
+        )
+        rows = [
+            {"book_id": int(book_id), "rank": rank, "recommended_book_id": neighbour, "score": score}
+            for book_id in book_ids
+            for rank, (neighbour, score) in enumerate(self.neighbours(int(book_id)), start=1)
+        ]
+        if rows:
+            session.execute(insert(BookRecommendation), rows)
+        invalidate_on_commit(session, BOOKS)
+
+
+class RecommendationJob:
+    """
+    Refreshes the recommendations every `interval` seconds in a background
+    thread.
+
+    Only the worker holding the session-level advisory lock keeps a model,
+    and it runs every refresh on the connection holding the lock. The other
+    workers try to take the lock at each interval, so one of them takes over
+    when the leader stops, without any of them reading the history before.
+    """
+
+    def __init__(self, engine: Engine, interval: float, top_k: int):
+        self.engine = engine
+        self.interval = interval
+        self.top_k = top_k
+        self.model: Optional[CooccurrenceModel] = None
+        self._leader: Optional[Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader is not None
+
+    def _acquire_leadership(self) -> bool:
+        conn = self.engine.connect()
+        try:
+            acquired = conn.scalar(select(func.pg_try_advisory_lock(REFRESH_LOCK_ID)))
+            # The lock outlives the transaction, for as long as the connection stays open
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._leader = conn
+        self.model = CooccurrenceModel(self.top_k)
+        return True
+
+    def _resign(self) -> None:
+        # Closing the connection releases the lock, the next leader starts with a full build
+        if self._leader is not None:
+            self._leader.invalidate()
+            self._leader.close()
+        self._leader = None
+        self.model = None
+
+    def run_once(self) -> Optional[np.ndarray]:
+        if not self.is_leader and not self._acquire_leadership():
+            return None
+        try:
+            with Session(bind=self._leader) as session:
+                changed = self.model.update(session)
+                session.commit()
+        except Exception:
+            # The model may be ahead of what was stored, or the lock lost with the connection
+            self._resign()
+            raise
+        return changed
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="recommendations", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._resign()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                changed = self.run_once()
+                if changed is not None and len(changed):
+                    logger.info("Refreshed recommendations of %d books", len(changed))
+            except Exception:
+                logger.exception("Refreshing recommendations failed")
+            self._stop.wait(self.interval)
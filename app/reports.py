@@ -0,0 +1,380 @@
+import csv
+import datetime
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator, Optional, Sequence
+
+from sqlalchemy import Date, Integer, Select, create_engine, exists, func, literal, select, type_coerce, update
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.models import DEFAULT_BRANCH_ID, Author, Book, BorrowingHistory, Genre, Publisher, ReportJob, User
+from app.schemas import ReportCreate
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Rows fetched per round trip from the server-side cursor, and written per batch
+STREAM_BATCH_SIZE = 10_000
+
+# Added to the workers' nice value, so that report generation yields the CPU to the API
+WORKER_NICENESS = 10
+
+
+def _branch_id(params: dict) -> int:
+    # Jobs queued before branches were added cover the only branch there was
+    return params.get("branch_id", DEFAULT_BRANCH_ID)
+
+
+def annual_circulation(params: dict) -> Select:
+    # Borrowings and distinct borrowers of every book borrowed during the year
+    start = datetime.date(params["year"], 1, 1)
+    return (
+        select(
+            Book.id.label("book_id"),
+            Book.title,
+            Author.name.label("author"),
+            Genre.name.label("genre"),
+            func.count(BorrowingHistory.id).label("borrowings"),
+            func.count(BorrowingHistory.user_id.distinct()).label("readers"),
+        )
+        .join(BorrowingHistory, BorrowingHistory.book_id == Book.id)
+        .join(Author, Author.id == Book.author_id)
+        .join(Genre, Genre.id == Book.genre_id)
+        .where(
+            BorrowingHistory.branch_id == _branch_id(params),
+            BorrowingHistory.borrow_date >= start,
+            BorrowingHistory.borrow_date < start.replace(year=start.year + 1),
+        )
+        .group_by(Book.id, Author.name, Genre.name)
+        .order_by(func.count(BorrowingHistory.id).desc(), Book.id)
+    )
+
+
+def inventory_audit(params: dict) -> Select:
+    # Every book with its availability flag next to whether it actually is on loan
+    on_loan = exists().where(BorrowingHistory.book_id == Book.id, BorrowingHistory.return_date.is_(None))
+    return (
+        select(
+            Book.id.label("book_id"),
+            Book.isbn,
+            Book.title,
+            Author.name.label("author"),
+            Genre.name.label("genre"),
+            Publisher.name.label("publisher"),
+            Book.available,
+            on_loan.label("on_loan"),
+        )
+        .join(Author, Author.id == Book.author_id)
+        .join(Genre, Genre.id == Book.genre_id)
+        .outerjoin(Publisher, Publisher.id == Book.publisher_id)
+        .where(Book.branch_id == _branch_id(params), Book.deleted_at.is_(None))
+        .order_by(Book.id)
+    )
+
+
+def overdue(params: dict) -> Select:
+    # Open loans older than the loan period on the day the report was requested
+    as_of = datetime.date.fromisoformat(params["as_of"])
+    due = as_of - datetime.timedelta(days=params["loan_period_days"])
+    days_overdue = literal(due, Date) - BorrowingHistory.borrow_date
+    return (
+        select(
+            BorrowingHistory.id.label("loan_id"),
+            Book.id.label("book_id"),
+            Book.title,
+            User.id.label("user_id"),
+            User.username,
+            BorrowingHistory.borrow_date,
+            type_coerce(days_overdue, Integer).label("days_overdue"),
+        )
+        .join(Book, Book.id == BorrowingHistory.book_id)
+        .join(User, User.id == BorrowingHistory.user_id)
+        .where(
+            BorrowingHistory.branch_id == _branch_id(params),
+            BorrowingHistory.return_date.is_(None),
+            BorrowingHistory.borrow_date < due,
+        )
+        .order_by(BorrowingHistory.borrow_date, BorrowingHistory.id)
+    )
+
+
+REPORTS: dict[str, Callable[[dict], Select]] = {
+    "annual_circulation": annual_circulation,
+    "inventory_audit": inventory_audit,
+    "overdue": overdue,
+}
+
+
+def report_params(report: ReportCreate, branch_id: int) -> dict:
+    """
+    Parameters of a requested report, fixed when it is queued so that the
+    output doesn't depend on when a worker gets to it. Reports cover the
+    branch of the user who requested them.
+    """
+    today = datetime.date.today()
+    if report.kind == "annual_circulation":
+        return {"branch_id": branch_id, "year": report.year or today.year}
+    if report.kind == "overdue":
+        return {"branch_id": branch_id, "as_of": today.isoformat(), "loan_period_days": settings.loan_period_days}
+    return {"branch_id": branch_id}
+
+
+def _write_csv(path: str, columns: Sequence[str], batches: Iterator[list]) -> int:
+    rows = 0
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def arrow_schema(query: Select):
+    """
+    Arrow schema of a query's result, from the SQL types of its columns.
+    """
+    import pyarrow as pa
+
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), bool: pa.bool_(), datetime.date: pa.date32()}
+    return pa.schema(
+        [(column.name, types.get(column.type.python_type, pa.string())) for column in query.selected_columns]
+    )
+
+
+def record_batch(schema, rows: Sequence[Sequence]):
+    """
+    Arrow record batch of a batch of result rows, converted column by column.
+    """
+    import pyarrow as pa
+
+    columns = zip(*rows) if rows else [[] for _ in schema]
+    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(path: str, schema, batches: Iterator[list]) -> int:
+    """
+    Write batches of rows to a Parquet file one record batch at a time, so
+    memory is bounded by the batch size. Returns the number of rows.
+    """
+    import pyarrow.parquet as pq
+
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_batch(record_batch(schema, batch))
+            rows += len(batch)
+    return rows
+
+
+def generate_report(
+        engine: Engine, job_id: int, claim: str, kind: str, format: str, params: dict, report_dir: str
+):
+    """
+    Stream a report's rows from a server-side cursor into its output file.
+    Returns the path and the number of rows.
+
+    The files are named after the claim, so a job run twice, e.g. requeued
+    while its worker was stuck, never writes to or replaces the other run's.
+    """
+    query = REPORTS[kind](params)
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"{job_id}-{claim}.{format}")
+    partial = os.path.join(report_dir, f".{job_id}-{claim}.{format}.partial")
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(query)
+        if format == "parquet":
+            rows = write_parquet(partial, arrow_schema(query), result.partitions())
+        else:
+            rows = _write_csv(partial, list(result.keys()), result.partitions())
+    # Readers only ever see complete files
+    os.replace(partial, path)
+    return path, rows
+
+
+# Engine of the worker process, created by its initializer
+_worker_engine: Optional[Engine] = None
+
+
+def _init_worker(database_url: URL) -> None:
+    global _worker_engine
+    os.nice(WORKER_NICENESS)
+    # One connection per worker, only while a report runs
+    _worker_engine = create_engine(database_url, poolclass=NullPool)
+
+
+def _send_heartbeats(job_id: int, claim: str, stop: threading.Event) -> None:
+    # Tells the API workers that the job's worker is alive, until the report is done
+    while not stop.wait(settings.report_heartbeat_seconds):
+        try:
+            with Session(_worker_engine) as session:
+                session.execute(
+                    update(ReportJob)
+                    .where(ReportJob.id == job_id, ReportJob.claim == claim)
+                    .values(heartbeat_at=func.now())
+                )
+                session.commit()
+        except Exception:
+            logger.warning("Report job %d heartbeat failed", job_id, exc_info=True)
+
+
+def run_report(job_id: int, report_dir: str) -> None:
+    """
+    Claim a queued job and generate its report, recording the outcome on
+    the job. Runs in a worker process.
+
+    The job's heartbeat is updated while the report runs. The outcome is
+    only recorded if the job is still this run's claim, not requeued since.
+    """
+    claim = uuid.uuid4().hex
+    with Session(_worker_engine) as session:
+        job = session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.status == QUEUED)
+            .values(status=RUNNING, claim=claim, started_at=func.now(), heartbeat_at=func.now())
+            .returning(ReportJob.kind, ReportJob.format, ReportJob.params)
+        ).first()
+        session.commit()
+    # Another worker has it, or it's done
+    if job is None:
+        return
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_send_heartbeats, args=(job_id, claim, stop), daemon=True)
+    heartbeat.start()
+    path = None
+    try:
+        path, rows = generate_report(_worker_engine, job_id, claim, job.kind, job.format, job.params, report_dir)
+        outcome = {"status": SUCCEEDED, "path": path, "row_count": rows}
+    except Exception as exc:
+        logger.exception("Report job %d failed", job_id)
+        outcome = {"status": FAILED, "error": str(exc)[:1000]}
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    with Session(_worker_engine) as session:
+        finished = session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.claim == claim, ReportJob.status == RUNNING)
+            .values(finished_at=func.now(), **outcome)
+        ).rowcount
+        session.commit()
+    # The job was requeued and claimed again, the other run's outcome stands
+    if not finished and path is not None:
+        os.remove(path)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_report_pool(database_url: URL) -> ProcessPoolExecutor:
+    """
+    Return this API worker's report pool, starting it on first use.
+
+    Reports run in separate processes, so they never hold the GIL of the
+    API's request threads, and at most `report_workers` of them run at once.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.report_workers,
+                # The API process has threads of its own, which fork doesn't copy safely
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(database_url,),
+            )
+        return _pool
+
+
+def _job_done(engine: Engine, pool: ProcessPoolExecutor, job_id: int, future: Future) -> None:
+    global _pool
+    if future.cancelled() or future.exception() is None:
+        return
+    if not isinstance(future.exception(), BrokenProcessPool):
+        logger.error("Report job %d could not run", job_id, exc_info=future.exception())
+    else:
+        # A worker died, e.g. killed for its memory use. Later jobs go to a new pool.
+        with _pool_lock:
+            if _pool is pool:
+                logger.error("Report worker died, restarting the pool")
+                _pool = None
+
+    with Session(engine) as session:
+        # The job the worker was running is not retried, it would likely kill the next one too
+        session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.status == RUNNING)
+            .values(status=FAILED, error="The report worker stopped unexpectedly.", finished_at=func.now())
+        )
+        session.commit()
+        status = session.scalar(select(ReportJob.status).where(ReportJob.id == job_id))
+
+    # Jobs that were still waiting in the broken pool run in the new one
+    if status == QUEUED and isinstance(future.exception(), BrokenProcessPool):
+        submit_report(engine, job_id)
+
+
+def submit_report(engine: Engine, job_id: int) -> None:
+    """
+    Queue a committed job on the report pool.
+    """
+    global _pool
+    pool = get_report_pool(engine.url)
+    try:
+        future = pool.submit(run_report, job_id, os.path.abspath(settings.report_dir))
+    except BrokenProcessPool:
+        # A worker died since the pool was returned
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        submit_report(engine, job_id)
+        return
+    future.add_done_callback(lambda done: _job_done(engine, pool, job_id, done))
+
+
+def submit_queued_reports(engine: Engine) -> None:
+    """
+    Queue the jobs left waiting, e.g. by a restart, and the running jobs
+    whose worker sent no heartbeat for `report_stale_minutes`, assumed gone.
+    Workers claim each job once, whichever API worker submitted it.
+    """
+    stale = func.now() - datetime.timedelta(minutes=settings.report_stale_minutes)
+    with Session(engine) as session:
+        session.execute(
+            update(ReportJob)
+            .where(ReportJob.status == RUNNING, func.coalesce(ReportJob.heartbeat_at, ReportJob.started_at) < stale)
+            .values(status=QUEUED, claim=None, started_at=None, heartbeat_at=None)
+        )
+        session.commit()
+        job_ids = session.scalars(
+            select(ReportJob.id).where(ReportJob.status == QUEUED).order_by(ReportJob.id)
+        ).all()
+    for job_id in job_ids:
+        submit_report(engine, job_id)
+
+
+def shutdown_report_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            # Jobs not started yet stay queued in the database
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -1,22 +1,164 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
-from app.dependencies import get_db
-from app.models import Book, Author
+from app.book_counts import own_columns, select_with_book_counts
+from app.bulk import BULK_MAX_ITEMS, bulk_upsert_by_name
+from app.cache import BOOKS, REFERENCE, get_cache, invalidate_on_commit
+from app.dependencies import get_db, get_read_db
+from app.includes import book_includes, embed_book_relations, include_foreign_keys
+from app.models import Book, Author, AuthorBookCount
 from app.models import User as UserModel
-from app.schemas import BookResponse, AuthorCreate, AuthorResponse
+from app.outbox import record_event
+from app.pagination import Pagination, decode_cursor
+from app.routers.books import branch_books
+from app.schemas import BulkUpsertResult, BookResponse, AuthorCreate, AuthorListAdapter, AuthorResponse, Page
+from app.serialization import (
+    dump_rows,
+    json_response,
+    projection_adapter,
+    response_columns,
+    sparse_fields,
+)
 from auth.dependencies import get_current_user
 
 router = APIRouter()
 
+# Orderings of GET /authors, each ending with the id so that it is total.
+# Counts are negated to list the most books first, their indexes are on the same expressions.
+AUTHOR_SORT_KEYS = {
+    None: (Author.id,),
+    "name": (Author.name, Author.id),
+    "book_count": (-AuthorBookCount.book_count, AuthorBookCount.author_id),
+    "available_count": (-AuthorBookCount.available_count, AuthorBookCount.author_id),
+}
 
-@router.get("/authors/{id}/books", response_model=List[BookResponse], status_code=200)
+
+def authors_by_count(session: Session, pagination: Pagination, sort_by: str, branch_id: int) -> list:
+    """
+    Fetch a page of authors with the most books of the branch first, in the
+    rows of `pagination.paginate`.
+
+    The authors counted in the branch are read in order from the index of the
+    counts table. The others follow by id, with a sort key of 0, so a cursor
+    tells which of the two a page continues.
+    """
+    count = getattr(AuthorBookCount, sort_by)
+    order_by = AUTHOR_SORT_KEYS[sort_by]
+    after = decode_cursor(pagination.cursor, sort_by, order_by) if pagination.cursor else None
+
+    rows = []
+    if after is None or after[0] < 0:
+        query = pagination.paginate(
+            select(
+                *own_columns(Author, AuthorResponse), AuthorBookCount.book_count, AuthorBookCount.available_count
+            )
+            .select_from(AuthorBookCount)
+            .join(Author, Author.id == AuthorBookCount.author_id)
+            .where(AuthorBookCount.branch_id == branch_id, -count < 0),
+            order_by,
+            sort_by,
+        )
+        rows = session.execute(query).all()
+
+    if len(rows) <= pagination.limit:
+        query = select_with_book_counts(Author, AuthorResponse, branch_id).where(func.coalesce(count, 0) == 0)
+        if after is not None and after[0] == 0:
+            query = query.where(Author.id > after[1])
+        rows += session.execute(
+            query.add_columns(literal(0).label("sort_key_0"), Author.id.label("sort_key_1"))
+            .order_by(Author.id)
+            .limit(pagination.limit + 1 - len(rows))
+        ).all()
+    return rows
+
+
+@router.get("/authors", response_model=Page[AuthorResponse], status_code=200)
+def get_authors(
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
+        sort_by: Optional[str] = Query(None, enum=["name", "book_count", "available_count"]),
+):
+    """
+    Retrieve the authors in the library, one page at a time.
+
+    Parameters
+    ----------
+    - **limit**: Number of authors per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
+    - **sort_by**: `name`, or `book_count` or `available_count` for the authors with the most books
+      of the user's branch first. By id by default.
+
+    Returns
+    -------
+    - **return**: A page of the authors, each with the number of its books in the user's branch and of
+      those available.
+    """
+
+    def load_authors():
+        scope = sort_by or "id"
+        if sort_by in ("book_count", "available_count"):
+            rows = authors_by_count(session, pagination, sort_by, current_user.branch_id)
+        else:
+            query = pagination.paginate(
+                select_with_book_counts(Author, AuthorResponse, current_user.branch_id),
+                AUTHOR_SORT_KEYS[sort_by],
+                scope,
+            )
+            rows = session.execute(query).all()
+        authors, next_cursor = pagination.split(rows, scope)
+
+        if not authors:
+            raise HTTPException(status_code=404, detail="No authors found.")
+
+        return pagination.envelope(dump_rows(AuthorListAdapter, authors), next_cursor)
+
+    key = f"{current_user.branch_id}:authors:{sort_by}:{pagination.cache_key}"
+    return json_response(get_cache().get_or_set(REFERENCE, key, load_authors, session=session))
+
+
+@router.get("/authors/{id}", response_model=AuthorResponse, status_code=200)
+def get_author(
+        id: int,
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Retrieve a single author by ID.
+
+    Parameters
+    ----------
+    - **id**: The ID of the author.
+
+    Returns
+    -------
+    - **return**: The author's details, with the counts of the user's branch.
+    """
+
+    def load_author():
+        author = session.execute(
+            select_with_book_counts(Author, AuthorResponse, current_user.branch_id).where(Author.id == id)
+        ).one_or_none()
+        if author is None:
+            raise HTTPException(status_code=404, detail="Author not found")
+
+        return AuthorResponse.model_validate(author).model_dump()
+
+    return json_response(get_cache().get_or_set(REFERENCE, f"{current_user.branch_id}:author:{id}", load_author, session=session))
+
+
+@router.get("/authors/{id}/books", response_model=Page[BookResponse], status_code=200)
 def get_author_books(
         id: int,
-        session: Session = Depends(get_db),
+        session: Session = Depends(get_read_db),
         current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
+        fields: tuple[str, ...] = Depends(sparse_fields(BookResponse)),
+        include: tuple[str, ...] = Depends(book_includes),
 ):
     """
     Retrieve all books written by a special author by ID.
@@ -24,19 +166,36 @@ def get_author_books(
     Parameters
     ----------
     - **id**: The ID of the author.
+    - **limit**: Number of books per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
+    - **fields**: Comma-separated fields to return, e.g. `id,title`. All by default.
+    - **include**: Comma-separated relations to embed in each book: author, genre, publisher.
 
     Returns
     -------
-    - **return**: A list of all books written by the author
+    - **return**: A page of the books written by the author
     """
-    # Check if author exists.
-    author = session.query(Author).filter(Author.id == id).first()
-    if not author:
-        raise HTTPException(status_code=404, detail="Author not found")
 
-    books = session.query(Book).filter(Book.author_id == id).all()
+    def load_books():
+        # Check if author exists.
+        author = session.query(Author).filter(Author.id == id).first()
+        if not author:
+            raise HTTPException(status_code=404, detail="Author not found")
+
+        columns = include_foreign_keys(fields, include)
+        query = pagination.paginate(
+            select(*response_columns(Book, BookResponse, columns))
+            .where(branch_books(current_user.branch_id), Book.author_id == id),
+            (Book.id,),
+            "id",
+        )
+        books, next_cursor = pagination.split(session.execute(query).all(), "id")
+
+        books = dump_rows(projection_adapter(BookResponse, columns), books)
+        return pagination.envelope(embed_book_relations(session, books, include, fields, current_user.branch_id), next_cursor)
 
-    return books
+    key = f"{current_user.branch_id}:author:{id}:{pagination.cache_key}:{','.join(fields)}:{','.join(include)}"
+    return json_response(get_cache().get_or_set(BOOKS, key, load_books, session=session))
 
 
 @router.post("/authors", response_model=AuthorResponse, status_code=201)
@@ -68,20 +227,66 @@ def create_author(
         -------
         - **return**: The created author's details.
         """
-    # Check that author's name is not already exists
-    existing_author = session.query(Author).filter(Author.name == author.name).first()
-    if existing_author:
+    # Insert unless the name is taken, in a single statement
+    new_author = session.execute(
+        insert(Author)
+        .values(name=author.name, birthdate=author.birthdate)
+        .on_conflict_do_nothing(index_elements=[Author.name])
+        .returning(*own_columns(Author, AuthorResponse))
+    ).one_or_none()
+
+    if new_author is None:
         raise HTTPException(
             status_code=400, detail=f"Author {author.name} already exists."
         )
 
-    new_author = Author(
-        name=author.name,
-        birthdate=author.birthdate,
+    record_event(session, "author", "created", AuthorResponse.model_validate(new_author))
+    invalidate_on_commit(session, REFERENCE)
+    session.commit()
+
+    return new_author
+
+
+@router.put("/authors/bulk", response_model=List[BulkUpsertResult], status_code=200)
+def bulk_upsert_authors(
+        authors: List[AuthorCreate] = Body(..., max_length=BULK_MAX_ITEMS),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Create or update many authors at once, matched by name.
+
+    Request Body
+    ------------
+    A list of up to 10000 authors:
+
+    - **name** (string): The full name of the author. Used to match existing authors.
+    - **birthdate** (date): The birthdate of the author. Must be valid date in past.
+
+    Example Request Body
+    --------------------
+
+    ```json
+    [
+      {"name": "Jane Austen", "birthdate": "1775-12-16"},
+      {"name": "Mary Shelley", "birthdate": "1797-08-30"}
+    ]
+    ```
+
+    Returns
+    -------
+    - **return**: The id and name of every author in the request.
+    """
+    mapping = bulk_upsert_by_name(
+        session,
+        Author,
+        [author.model_dump() for author in authors],
+        aggregate="author",
     )
 
-    session.add(new_author)
+    # Updated rows may be embedded in cached book pages
+    invalidate_on_commit(session, REFERENCE)
+    invalidate_on_commit(session, BOOKS)
     session.commit()
-    session.refresh(new_author)
 
-    return new_author
+    return json_response(mapping)
@@ -1,31 +1,176 @@
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date
+from typing import NoReturn, Optional, List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, exists, func, insert, update
+from sqlalchemy.orm import Session, joinedload, load_only
 from sqlalchemy.exc import IntegrityError, DataError
 from sqlalchemy.future import select
 from psycopg2.errors import UniqueViolation
 
-from app.dependencies import get_db
-from app.models import Book, Genre, Author, BorrowingHistory
+from app.availability import availability_events, get_broadcaster
+from app.cache import BOOKS, REFERENCE, get_cache, history_namespace, invalidate_on_commit
+from app.dependencies import get_db, get_read_db
+from app.errors import raise_for_integrity_error
+from app.idempotency import Idempotency, get_idempotency
+from app.includes import book_includes, embed_book_relations, include_foreign_keys
+from app.isbn import INVALID_ISBN, normalize_isbn
+from app.models import Book, Author, BookRecommendation, BorrowingHistory
 from app.models import User as UserModel
+from app.outbox import record_event
+from app.pagination import Pagination, paginate, split_page
+from app.readers import BOOK, distinct_readers
 from app.schemas import (
     BookCreate,
     BookResponse,
     BookResponsePagination,
+    BookUpdate,
+    BookListAdapter,
     BorrowingHistoryResponse,
+    DistinctReadersResponse,
+    Page,
+    RecommendationResponse,
+)
+from app.serialization import (
+    dump_rows,
+    json_response,
+    projection_adapter,
+    response_columns,
+    sparse_fields,
 )
 
-from auth.dependencies import get_current_user
+from auth.dependencies import get_current_user, get_stream_user
 
 router = APIRouter()
 
+# Errors reported for the constraints a new book can violate
+BOOK_CONSTRAINTS = {
+    "books_author_id_fkey": (404, "Author not found."),
+    "books_genre_id_fkey": (404, "Genre not found."),
+    "books_publisher_id_fkey": (404, "Publisher not found."),
+    "ix_books_branch_id_title": (400, "A book with this title already exists."),
+    "ix_books_branch_id_isbn": (400, "A book with this ISBN already exists."),
+    "ix_books_branch_id_isbn13": (400, "A book with this ISBN already exists."),
+}
+
+# Orderings of GET /books, each ending with the id so that it is total
+BOOK_SORT_KEYS = {
+    None: (Book.id,),
+    "title": (Book.title, Book.id),
+    "author": (Author.name, Book.id),
+    "publish_date": (Book.publish_date, Book.id),
+}
+
+# Relationships of a borrowing record, joined only when requested
+HISTORY_RELATIONSHIPS = {"user": BorrowingHistory.user, "book": BorrowingHistory.book}
+
+
+def branch_books(branch_id: int):
+    # The books of a branch that aren't deleted, the condition of the partial indexes that lead with branch_id
+    return and_(Book.branch_id == branch_id, Book.deleted_at.is_(None))
+
+
+def live_book_exists(session: Session, id: int, branch_id: int) -> bool:
+    return session.scalar(select(exists().where(Book.id == id, branch_books(branch_id))))
+
+
+def book_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def if_match_versions(if_match: Optional[str]) -> Optional[list[int]]:
+    """
+    Versions of the book the client has, from its If-Match header, or None
+    for `*`, any version. Weak and unknown ETags match no version.
+    """
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="The If-Match header is required.")
+    if if_match.strip() == "*":
+        return None
+    tags = (tag.strip() for tag in if_match.split(","))
+    return [int(tag[1:-1]) for tag in tags if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit()]
+
+
+def raise_for_unchanged_book(
+        session: Session, id: int, branch_id: int, versions: Optional[list[int]]
+) -> NoReturn:
+    # A conditional UPDATE matched no row: the book is gone, the client's version is stale, or it is on loan
+    version = session.scalar(select(Book.version).where(Book.id == id, branch_books(branch_id)))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Book not found.")
+    if versions is not None and version not in versions:
+        raise HTTPException(
+            status_code=412, detail="The book was changed by someone else.", headers={"ETag": book_etag(version)}
+        )
+    raise HTTPException(status_code=409, detail="The book is on loan.")
+
+
+@router.get("/books/availability/stream", response_class=StreamingResponse, status_code=200)
+async def stream_availability(current_user: UserModel = Depends(get_stream_user)):
+    """
+    Stream the borrow and return events of the user's branch as server-sent events.
+
+    Each event is sent once the borrowing or return is committed, as
+    `event: availability` with data like `{"book_id": 1, "event": "borrowed", "branch_id": 1}`.
+    Browsers' EventSource can't send an Authorization header, so the token
+    may also be passed in the `access_token` query parameter or cookie.
+
+    Returns
+    -------
+    - **return**: A `text/event-stream` that stays open until the client disconnects.
+    """
+    return StreamingResponse(
+        availability_events(get_broadcaster(), current_user.branch_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/books/isbn/{isbn}", response_model=BookResponse, status_code=200)
+def get_book_by_isbn(
+        isbn: str,
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Retrieve a book by its ISBN, e.g. as read by a barcode scanner.
+
+    Parameters
+    ----------
+    - **isbn**: An ISBN-10 or ISBN-13, with or without hyphens or spaces.
+
+    Returns
+    -------
+    - **return**: The book's details.
+    """
+    try:
+        isbn13 = normalize_isbn(isbn)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=INVALID_ISBN)
+
+    def load_book():
+        # Point lookup on the unique isbn13 index
+        book = session.execute(
+            select(*response_columns(Book, BookResponse))
+            .where(branch_books(current_user.branch_id), Book.isbn13 == isbn13)
+        ).first()
+        if book is None:
+            raise HTTPException(status_code=404, detail="Book not found.")
+        return dump_rows(BookListAdapter, [book])[0]
+
+    return json_response(get_cache().get_or_set(
+        BOOKS, f"{current_user.branch_id}:isbn:{isbn13}", load_book, session=session
+    ))
+
 
-@router.get("/books/{id}/history", response_model=List[BorrowingHistoryResponse], status_code=200)
+@router.get("/books/{id}/history", response_model=Page[BorrowingHistoryResponse], status_code=200)
 def get_borrowing_history(
         id: int,
-        session: Session = Depends(get_db),
+        session: Session = Depends(get_read_db),
         current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
+        fields: tuple[str, ...] = Depends(sparse_fields(BorrowingHistoryResponse)),
 ):
     """
     Retrieve the borrowing history of a specific book by ID.
@@ -33,77 +178,219 @@ def get_borrowing_history(
     Parameters
     ----------
     - **id**: The id of the book whose history needs to be retrieved
+    - **limit**: Number of records per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
+    - **fields**: Comma-separated fields to return, e.g. `id,borrow_date,return_date`. All by default.
+
+    Returns
+    -------
+    - **return**: A page of borrowing records, oldest first, including borrower details and borrow/return_dates
+    """
+
+    def load_history():
+        # Check if book exists
+        if not live_book_exists(session, id, current_user.branch_id):
+            raise HTTPException(status_code=404, detail="Book not found.")
+
+        # Get all history of book, loading only the requested columns and
+        # joining borrowers and the book in the same query when requested
+        columns = [
+            getattr(BorrowingHistory, name) for name in fields if name not in HISTORY_RELATIONSHIPS
+        ]
+        options = [load_only(BorrowingHistory.id, *columns)]
+        options += [
+            joinedload(relationship)
+            for name, relationship in HISTORY_RELATIONSHIPS.items()
+            if name in fields
+        ]
+        query = pagination.paginate(
+            select(BorrowingHistory).options(*options).where(
+                BorrowingHistory.branch_id == current_user.branch_id, BorrowingHistory.book_id == id
+            ),
+            (BorrowingHistory.id,),
+            "id",
+        )
+        rows, next_cursor = pagination.split(session.execute(query).all(), "id")
+
+        book_history = [row.BorrowingHistory for row in rows]
+        return pagination.envelope(
+            dump_rows(projection_adapter(BorrowingHistoryResponse, fields), book_history),
+            next_cursor,
+        )
+
+    key = f"{current_user.branch_id}:{pagination.cache_key}:{','.join(fields)}"
+    return json_response(get_cache().get_or_set(history_namespace(id), key, load_history, session=session))
+
+
+@router.get("/books/{id}/recommendations", response_model=List[RecommendationResponse], status_code=200)
+def get_recommendations(
+        id: int,
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Retrieve the books most often borrowed by the users who borrowed this book.
+
+    Recommendations are refreshed periodically in the background, so recent
+    borrowings show up after a few minutes.
+
+    Parameters
+    ----------
+    - **id**: The id of the book to get recommendations for
+
+    Returns
+    -------
+    - **return**: Up to 10 books, each with the number of users who borrowed both books.
+    """
+
+    def load_recommendations():
+        # The stored top-k neighbours, in rank order from the primary key
+        rows = session.execute(
+            select(BookRecommendation.score, *response_columns(Book, BookResponse))
+            .join(Book, Book.id == BookRecommendation.recommended_book_id)
+            .where(BookRecommendation.book_id == id, branch_books(current_user.branch_id))
+            .order_by(BookRecommendation.rank)
+        ).all()
+
+        # Check if book exists
+        if not rows and not live_book_exists(session, id, current_user.branch_id):
+            raise HTTPException(status_code=404, detail="Book not found.")
+
+        books = dump_rows(BookListAdapter, rows)
+        return [{"book": book, "score": row.score} for book, row in zip(books, rows)]
+
+    return json_response(
+        get_cache().get_or_set(
+            BOOKS, f"{current_user.branch_id}:recommendations:{id}", load_recommendations, session=session
+        )
+    )
+
+
+@router.get("/books/{id}/readers", response_model=DistinctReadersResponse, status_code=200)
+def get_book_readers(
+        id: int,
+        start: date,
+        end: date,
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Estimate how many distinct users borrowed a book between two dates.
+
+    Parameters
+    ----------
+    - **id**: The id of the book
+    - **start**, **end**: The date range, inclusive.
 
     Returns
     -------
-    - **return**: A list of borrowing records, including borrower details and borrow/return_dates
+    - **return**: The estimated number of distinct readers, within about 1%.
     """
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+
     # Check if book exists
-    book_history = session.query(Book).filter(Book.id == id).first()
-    if not book_history:
+    if not live_book_exists(session, id, current_user.branch_id):
         raise HTTPException(status_code=404, detail="Book not found.")
 
-    # Get all history of book
-    book_history = (
-        session.query(BorrowingHistory).filter(BorrowingHistory.book_id == id).all()
-    )
-    return book_history
+    return json_response({
+        "start": start,
+        "end": end,
+        "distinct_readers": distinct_readers(session, BOOK, id, start, end),
+    })
 
 
 @router.get("/books", response_model=BookResponsePagination, status_code=200)
 def get_books(
-        session: Session = Depends(get_db),
+        session: Session = Depends(get_read_db),
         current_user: UserModel = Depends(get_current_user),
         page: int = Query(1, ge=1),  # Page number, default is 1
         size: int = Query(10, ge=1, le=100),  # Page size, default is 10, max 100
+        cursor: Optional[str] = Query(None),  # next_cursor of the previous page
         sort_by: Optional[str] = Query(None, enum=["title", "author", "publish_date"]),
+        genre_id: Optional[int] = Query(None),
+        author_id: Optional[int] = Query(None),
+        publisher_id: Optional[int] = Query(None),
+        available: Optional[bool] = Query(None),
+        published_from: Optional[date] = Query(None),
+        published_to: Optional[date] = Query(None),
+        fields: tuple[str, ...] = Depends(sparse_fields(BookResponse)),
+        include: tuple[str, ...] = Depends(book_includes),
 ):
     """
-    Retrieve a paginated list of books with optional sorting by title, author, or publish_date
+    Retrieve a paginated list of books with optional filtering and sorting by title, author, or publish_date
 
     Parameters
     ----------
-    - **page**: Page number to retrieve (default is 1).
+    - **page**: Page number to retrieve (default is 1). Ignored when a cursor is given.
     - **size**: Number of tasks per page (default is 10, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
     - **sort_by**: Field to sort by (title, author, or publish_date).
+    - **genre_id**, **author_id**, **publisher_id**: Only books with this genre, author or publisher.
+    - **available**: Only available (true) or unavailable (false) books.
+    - **published_from**, **published_to**: Only books published in this date range, inclusive.
+    - **fields**: Comma-separated fields to return, e.g. `id,title`. All by default.
+    - **include**: Comma-separated relations to embed in each book: author, genre, publisher.
 
     Returns
     -------
     - **return**: A list of books with pagination and optional sorting.
     """
 
-    offset = (page - 1) * size  # Calculate the offset for pagination
-    query = select(Book)
-    if sort_by:
-        if sort_by == "title":
-            query = query.order_by(Book.title)
-        elif sort_by == "author":
-            query = query.join(Author).order_by(Author.name)
-        elif sort_by == "publish_date":
-            query = query.order_by(Book.publish_date)
+    def load_page():
+        columns = include_foreign_keys(fields, include)
+        # The branch's books, found through the partial indexes that lead with the branch
+        query = select(*response_columns(Book, BookResponse, columns)).where(branch_books(current_user.branch_id))
+        if sort_by == "author":
+            query = query.join(Author)
 
-    # apply pagination
-    query = query.offset(offset).limit(size)
+        # Filters on columns leading the books indexes
+        if genre_id is not None:
+            query = query.where(Book.genre_id == genre_id)
+        if author_id is not None:
+            query = query.where(Book.author_id == author_id)
+        if publisher_id is not None:
+            query = query.where(Book.publisher_id == publisher_id)
+        if available is not None:
+            query = query.where(Book.available == available)
+        if published_from is not None:
+            query = query.where(Book.publish_date >= published_from)
+        if published_to is not None:
+            query = query.where(Book.publish_date <= published_to)
 
-    result = session.execute(query)
-    books = result.scalars().all()
+        # apply pagination, continuing after the cursor or skipping whole pages
+        scope = sort_by or "id"
+        if cursor is None:
+            query = query.offset((page - 1) * size)
+        query = paginate(query, BOOK_SORT_KEYS[sort_by], scope, size, cursor)
 
-    if not books:
-        raise HTTPException(status_code=404, detail="No books found.")
+        books, next_cursor = split_page(session.execute(query).all(), scope, size)
 
-    book_responses = [BookResponse.from_orm(book) for book in books]
+        if not books:
+            raise HTTPException(status_code=404, detail="No books found.")
 
-    # Build pagination info
-    pagination_info = {
-        "page": page,
-        "size": size,
-        "total": len(books),
-    }
+        # Build pagination info
+        pagination_info = {
+            "page": page,
+            "size": size,
+            "total": len(books),
+            "next_cursor": next_cursor,
+        }
 
-    return {
-        "pagination": pagination_info,
-        "tasks": book_responses,
-    }
+        tasks = dump_rows(projection_adapter(BookResponse, columns), books)
+        return {
+            "pagination": pagination_info,
+            "tasks": embed_book_relations(session, tasks, include, fields, current_user.branch_id),
+        }
+
+    key = ":".join(
+        str(value)
+        for value in (
+            current_user.branch_id, page, size, cursor, sort_by, genre_id, author_id, publisher_id, available,
+            published_from, published_to, ",".join(fields), ",".join(include),
+        )
+    )
+    return json_response(get_cache().get_or_set(BOOKS, key, load_page, session=session))
 
 
 @router.post("/books", response_model=BookResponse, status_code=201)
@@ -111,15 +398,20 @@ def create_book(
         book: BookCreate,
         session: Session = Depends(get_db),
         current_user: UserModel = Depends(get_current_user),
+        idempotency: Idempotency = Depends(get_idempotency),
 ):
     """
     Add new book to the library.
 
+    Headers
+    -------
+    - **Idempotency-Key** (string): Optional. A retry with the same key replays the first response.
+
     Request Body
     ------------
 
     - **title** (string): The title of the book.
-    - **isbn** (string): The isbn of the book. ISBN format is validated.
+    - **isbn** (string): The isbn of the book, an ISBN-10 or ISBN-13. Its check digit is validated.
     - **author_id** (integer): The ID of the book's author. Author must exist in the database
     - **genre_id** (integer): The ID of the book's genre. Genre must exist in the database
     - **publisher_id** (integer): The ID of the book's publisher. Optional field.
@@ -132,7 +424,7 @@ def create_book(
     ```json
     {
       "title": "New book",
-      "isbn": "0-19-853453-5",
+      "isbn": "0-19-853453-1",
       "author_id": 1,
       "genre_id": 1,
       "publisher_id": null,
@@ -144,35 +436,25 @@ def create_book(
     -------
     - **return**: The created book's details.
     """
-    # Check if author exists.
-    author = session.query(Author).filter(Author.id == book.author_id).first()
-    if not author:
-        raise HTTPException(status_code=404, detail="Author not found.")
-
-    # Check if genre exists.
-    genre = session.query(Genre).filter(Genre.id == book.genre_id).first()
-    if not genre:
-        raise HTTPException(status_code=404, detail="Genre not found.")
-
-    # Create the new book record
-    new_book = Book(
-        title=book.title,
-        isbn=book.isbn,
-        author_id=book.author_id,
-        genre_id=book.genre_id,
-        publisher_id=book.publisher_id,
-        publish_date=book.publish_date,
-        available=book.available,
-    )
+    # Insert directly, a missing author, genre or publisher violates its foreign key
     try:
-        session.add(new_book)
+        new_book = session.execute(
+            insert(Book)
+            .values(**book.model_dump(), isbn13=normalize_isbn(book.isbn), branch_id=current_user.branch_id)
+            .returning(*response_columns(Book, BookResponse))
+        ).one()
+        response = BookResponse.model_validate(new_book)
+        idempotency.save(response, status_code=201)
+        record_event(session, "book", "created", response, current_user.branch_id)
+        invalidate_on_commit(session, BOOKS)
+        # The book counts of its author, genre and publisher changed
+        invalidate_on_commit(session, REFERENCE)
         session.commit()
-        session.refresh(new_book)
+    except HTTPException:
+        raise
     except IntegrityError as e:
         session.rollback()  # Roll back the session in case of error
-        raise HTTPException(
-            status_code=400, detail=f"Integrity error: {str(e)}"
-        ) from e
+        raise_for_integrity_error(e, BOOK_CONSTRAINTS)
     except DataError as e:
         session.rollback()
         raise HTTPException(
@@ -190,3 +472,139 @@ def create_book(
         ) from e
 
     return new_book
+
+
+@router.get("/books/{id}", response_model=BookResponse, status_code=200)
+def get_book(
+        id: int,
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Retrieve a book by ID.
+
+    Parameters
+    ----------
+    - **id**: The ID of the book.
+
+    Returns
+    -------
+    - **return**: The book's details, with its version also in the `ETag` header for `If-Match`.
+    """
+
+    def load_book():
+        book = session.execute(
+            select(*response_columns(Book, BookResponse))
+            .where(Book.id == id, branch_books(current_user.branch_id))
+        ).first()
+        if book is None:
+            raise HTTPException(status_code=404, detail="Book not found.")
+        return dump_rows(BookListAdapter, [book])[0]
+
+    book = get_cache().get_or_set(BOOKS, f"{current_user.branch_id}:book:{id}", load_book, session=session)
+    return json_response(book, headers={"ETag": book_etag(book["version"])})
+
+
+@router.patch("/books/{id}", response_model=BookResponse, status_code=200)
+def update_book(
+        id: int,
+        changes: BookUpdate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Change some fields of a book.
+
+    The change is only made if the book is still at the version the client
+    read, so that concurrent edits don't overwrite each other.
+
+    Headers
+    -------
+    - **If-Match** (string): Required. The `ETag` of the book as last read, or `*` for any version.
+
+    Request Body
+    ------------
+    Any of the fields of `POST /books`. Fields that are left out keep their value.
+
+    Returns
+    -------
+    - **return**: The updated book, with its new version in the `ETag` header.
+      412 if the book was changed since it was read.
+    """
+    versions = if_match_versions(if_match)
+    values = changes.model_dump(exclude_unset=True)
+    if "isbn" in values:
+        values["isbn13"] = normalize_isbn(values["isbn"])
+
+    # Checking the version and writing happen in one statement, no row is locked in between
+    statement = (
+        update(Book)
+        .where(Book.id == id, branch_books(current_user.branch_id))
+        .values(**values, version=Book.version + 1)
+        .returning(*response_columns(Book, BookResponse))
+    )
+    if versions is not None:
+        statement = statement.where(Book.version.in_(versions))
+
+    try:
+        book = session.execute(statement).first()
+        if book is None:
+            raise_for_unchanged_book(session, id, current_user.branch_id, versions)
+        updated = BookResponse.model_validate(book)
+        record_event(session, "book", "updated", updated, current_user.branch_id)
+        invalidate_on_commit(session, BOOKS)
+        # The book counts of its author, genre and publisher changed
+        invalidate_on_commit(session, REFERENCE)
+        # Borrowing records embed the book
+        invalidate_on_commit(session, history_namespace(id))
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise_for_integrity_error(e, BOOK_CONSTRAINTS)
+
+    response.headers["ETag"] = book_etag(updated.version)
+    return updated
+
+
+@router.delete("/books/{id}", status_code=204)
+def delete_book(
+        id: int,
+        if_match: Optional[str] = Header(None),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Delete a book. It disappears from the listings, its borrowing history is
+    kept, and a book with the same title or ISBN can be added again.
+
+    Headers
+    -------
+    - **If-Match** (string): Required. The `ETag` of the book as last read, or `*` for any version.
+
+    Returns
+    -------
+    - **return**: No content. 412 if the book was changed since it was read, 409 if it is on loan.
+    """
+    versions = if_match_versions(if_match)
+    on_loan = exists().where(BorrowingHistory.book_id == Book.id, BorrowingHistory.return_date.is_(None))
+
+    statement = (
+        update(Book)
+        .where(Book.id == id, branch_books(current_user.branch_id), ~on_loan)
+        .values(deleted_at=func.now(), version=Book.version + 1)
+        .returning(Book.id)
+    )
+    if versions is not None:
+        statement = statement.where(Book.version.in_(versions))
+
+    if session.execute(statement).first() is None:
+        raise_for_unchanged_book(session, id, current_user.branch_id, versions)
+
+    record_event(session, "book", "deleted", {"id": id}, current_user.branch_id)
+    invalidate_on_commit(session, BOOKS)
+    invalidate_on_commit(session, REFERENCE)
+    invalidate_on_commit(session, history_namespace(id))
+    session.commit()
+    return Response(status_code=204)
@@ -4,7 +4,11 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from sqlalchemy.orm import Session
 
+from app.availability import notify_availability
+from app.cache import history_namespace, invalidate_on_commit
 from app.dependencies import get_db
+from app.idempotency import Idempotency, get_idempotency
+from app.outbox import record_event
 from app.models import Book, BorrowingHistory
 from app.models import User as UserModel
 from app.schemas import (
@@ -25,10 +29,15 @@ def borrow_book(
     borrow_data: BorrowingHistoryCreate,
     session: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user),
+    idempotency: Idempotency = Depends(get_idempotency),
 ):
     """
     Borrow a book from the library.
 
+    Headers
+    -------
+    - **Idempotency-Key** (string): Optional. A retry with the same key replays the first response.
+
     Request Body
     ------------
     - **book_id** (integer): The ID of the book to be borrowed.
@@ -45,13 +54,18 @@ def borrow_book(
     -------
     - **return**: A detailed record of the borrowing event.
     """
-    # Check if the book exists and available
-    book = session.query(Book).filter(Book.id == borrow_data.book_id).first()
+    # Check if the book exists in the user's branch and available
+    book = session.query(Book).filter(
+        Book.id == borrow_data.book_id,
+        Book.branch_id == current_user.branch_id,
+        Book.deleted_at.is_(None),
+    ).first()
     if not book or not book.available:
         raise HTTPException(status_code=400, detail="Book is not available for borrowing.")
 
     # Check if user has already borrowed the same book and hasn't returned it yet
     active_borrow = session.query(BorrowingHistory).filter(
+        BorrowingHistory.branch_id == current_user.branch_id,
         BorrowingHistory.user_id == current_user.id,
         BorrowingHistory.book_id == borrow_data.book_id,
         BorrowingHistory.return_date.is_(None)
@@ -64,6 +78,7 @@ def borrow_book(
     borrowed_books = (
         session.query(BorrowingHistory)
         .filter(
+            BorrowingHistory.branch_id == current_user.branch_id,
             BorrowingHistory.user_id == current_user.id,
             BorrowingHistory.return_date.is_(None),
         )
@@ -78,6 +93,7 @@ def borrow_book(
 
     # Borrow book
     new_borrow = BorrowingHistory(
+        branch_id=current_user.branch_id,
         book_id=borrow_data.book_id,
         user_id=current_user.id,
         borrow_date=datetime.date.today(),
@@ -85,8 +101,21 @@ def borrow_book(
 
     try:
         session.add(new_borrow)
+        session.flush()
+        idempotency.save(BorrowingHistoryResponse.model_validate(new_borrow), status_code=201)
+        invalidate_on_commit(session, history_namespace(borrow_data.book_id))
+        notify_availability(session, borrow_data.book_id, "borrowed", current_user.branch_id)
+        record_event(session, "borrowing", "borrowed", {
+            "id": new_borrow.id,
+            "book_id": new_borrow.book_id,
+            "user_id": new_borrow.user_id,
+            "borrow_date": new_borrow.borrow_date,
+            "return_date": None,
+        }, current_user.branch_id)
         session.commit()
         session.refresh(new_borrow)
+    except HTTPException:
+        raise
     except Exception as e:
         session.rollback()
         raise HTTPException(
@@ -101,10 +130,15 @@ def return_book(
     return_data: ReturnRequestCreate,
     session: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user),
+    idempotency: Idempotency = Depends(get_idempotency),
 ):
     """
     Return a borrowed book to the library.
 
+    Headers
+    -------
+    - **Idempotency-Key** (string): Optional. A retry with the same key replays the first response.
+
     Request Body
     ------------
     - **book_id** (integer): The ID of the book being returned.
@@ -126,6 +160,7 @@ def return_book(
     borrowing_record = (
         session.query(BorrowingHistory)
         .filter(
+            BorrowingHistory.branch_id == current_user.branch_id,
             BorrowingHistory.book_id == return_data.book_id,
             BorrowingHistory.user_id == current_user.id,
             BorrowingHistory.return_date.is_(None),
@@ -138,12 +173,17 @@ def return_book(
 
     borrowing_record.return_date = return_data.return_date
 
-    session.commit()
-
-    return ReturnRequestResponse(
+    response = ReturnRequestResponse(
         id=borrowing_record.id,
         book_id=borrowing_record.book_id,
         user_id=borrowing_record.user_id,
         borrow_date=borrowing_record.borrow_date,
         return_date=borrowing_record.return_date,
     )
+    idempotency.save(response, status_code=201)
+    invalidate_on_commit(session, history_namespace(borrowing_record.book_id))
+    notify_availability(session, borrowing_record.book_id, "returned", current_user.branch_id)
+    record_event(session, "borrowing", "returned", response, current_user.branch_id)
+    session.commit()
+
+    return response
@@ -0,0 +1,71 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.dependencies import get_read_db
+from app.models import OutboxEvent
+from app.models import User as UserModel
+from app.outbox import visible_horizon
+from app.pagination import encode_cursor, paginate
+from app.schemas import ChangeEvent, ChangeEventListAdapter, ChangesResponse
+from app.serialization import dump_rows, json_response, response_columns
+from auth.dependencies import get_current_user
+
+router = APIRouter()
+
+# Order of the change feed, by writing transaction then by event
+CHANGES_ORDER = (OutboxEvent.txid, OutboxEvent.id)
+
+
+@router.get("/changes", response_model=ChangesResponse, status_code=200)
+def get_changes(
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+        since: Optional[str] = Query(None),  # next_cursor of the previous batch
+        limit: int = Query(100, ge=1, le=1000),  # Batch size, default is 100, max 1000
+):
+    """
+    Retrieve the changes made to the library since a cursor, oldest first.
+
+    Every create, bulk upsert, borrowing and return writes an event in the same
+    transaction as the change. Only the events of the user's branch are served,
+    along with those of the authors, genres and publishers. Consumers keep the returned `next_cursor` and
+    pass it as `since` to get the following events, even when a batch is empty.
+
+    Parameters
+    ----------
+    - **since**: The `next_cursor` of the previous batch. Start from the first event when omitted.
+    - **limit**: Number of events per batch (default is 100, max 1000).
+
+    Returns
+    -------
+    - **return**: A batch of events, the cursor to continue from and whether more events are ready.
+    """
+    # Only serve events of finished transactions, so none can appear behind the cursor later
+    query = paginate(
+        select(*response_columns(OutboxEvent, ChangeEvent)).where(
+            OutboxEvent.txid < visible_horizon(),
+            # The user's branch, and the authors, genres and publishers all branches share
+            or_(OutboxEvent.branch_id == current_user.branch_id, OutboxEvent.branch_id.is_(None)),
+        ),
+        CHANGES_ORDER,
+        "changes",
+        limit,
+        since,
+    )
+    rows = session.execute(query).all()
+
+    has_more, rows = len(rows) > limit, rows[:limit]
+    next_cursor = since
+    if rows:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor("changes", [last["sort_key_0"], last["sort_key_1"]])
+
+    return json_response({
+        "events": dump_rows(ChangeEventListAdapter, rows),
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    })
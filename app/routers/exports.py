@@ -0,0 +1,51 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+
+from sqlalchemy.orm import Session
+
+from app.dependencies import get_read_db
+from app.models import User as UserModel
+from auth.dependencies import get_current_user
+
+router = APIRouter()
+
+MEDIA_TYPES = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+
+
+@router.get("/exports/borrowing-history", status_code=200)
+def export_borrowing_history(
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+        year: Optional[int] = Query(None, ge=1, le=9998),  # Borrow year, the partition of the Parquet dataset
+        format: Literal["arrow", "parquet"] = Query("arrow"),
+):
+    """
+    Stream the borrowing history of the user's branch, with the keys of the
+    book, borrower, genre, author and publisher, for analytics.
+
+    Rows are read from a server-side cursor and sent 100,000 at a time, so
+    the export runs in bounded memory whatever the size of the table.
+
+    Parameters
+    ----------
+    - **year**: Only export the borrowings of that year.
+    - **format**: `arrow` (default) for an Arrow IPC stream, or `parquet` for a Parquet file
+      with one row group per batch.
+
+    Returns
+    -------
+    - **return**: The rows, as an Arrow stream or a Parquet file.
+    """
+    # PyArrow is only imported when an export is requested
+    from app.export import borrowing_history_batches, encode_batches
+
+    # The export reads on its own connection while the response streams, after the session is closed
+    engine = session.get_bind().engine
+    filename = f"borrowing_history{'' if year is None else f'-{year}'}.{format}"
+    return StreamingResponse(
+        encode_batches(borrowing_history_batches(engine, year, branch_id=current_user.branch_id), format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,35 +1,99 @@
+from datetime import date
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
-from app.dependencies import get_db
+from app.book_counts import own_columns, select_with_book_counts
+from app.bulk import BULK_MAX_ITEMS, bulk_upsert_by_name
+from app.cache import BOOKS, REFERENCE, get_cache, invalidate_on_commit
+from app.dependencies import get_db, get_read_db
 from app.models import Genre
 from app.models import User as UserModel
-from app.schemas import GenreResponse, GenreCreate
+from app.outbox import record_event
+from app.pagination import Pagination
+from app.readers import GENRE, distinct_readers
+from app.schemas import (
+    BulkUpsertResult,
+    DistinctReadersResponse,
+    GenreResponse,
+    GenreCreate,
+    GenreListAdapter,
+    Page,
+)
+from app.serialization import dump_rows, json_response
 from auth.dependencies import get_current_user
 
 router = APIRouter()
 
 
-@router.get("/genres", response_model=List[GenreResponse], status_code=200)
+@router.get("/genres", response_model=Page[GenreResponse], status_code=200)
 def get_genres(
-        session: Session = Depends(get_db),
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
+):
+    """
+    Retrieve the genres in the library, one page at a time.
+
+    Parameters
+    ----------
+    - **limit**: Number of genres per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
+
+    Returns
+    -------
+    - **return**: A page of the genres in the library, with the counts of the user's branch.
+    """
+
+    def load_genres():
+        query = pagination.paginate(
+            select_with_book_counts(Genre, GenreResponse, current_user.branch_id), (Genre.id,), "id"
+        )
+        genres, next_cursor = pagination.split(session.execute(query).all(), "id")
+
+        if not genres:
+            raise HTTPException(status_code=404, detail="No genres found.")
+
+        return pagination.envelope(dump_rows(GenreListAdapter, genres), next_cursor)
+
+    key = f"{current_user.branch_id}:genres:{pagination.cache_key}"
+    return json_response(get_cache().get_or_set(REFERENCE, key, load_genres, session=session))
+
+
+@router.get("/genres/{id}/readers", response_model=DistinctReadersResponse, status_code=200)
+def get_genre_readers(
+        id: int,
+        start: date,
+        end: date,
+        session: Session = Depends(get_read_db),
         current_user: UserModel = Depends(get_current_user),
 ):
     """
-    Retrieve all genres in the library.
+    Estimate how many distinct users borrowed books of a genre between two dates.
+
+    Parameters
+    ----------
+    - **id**: The id of the genre
+    - **start**, **end**: The date range, inclusive.
 
     Returns
     -------
-    - **return**: A list of all genres in the library.
+    - **return**: The estimated number of distinct readers, within about 1%.
     """
-    genres = session.query(Genre).all()
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
 
-    if not genres:
-        raise HTTPException(status_code=404, detail="No genres found.")
+    # Check if genre exists
+    if session.get(Genre, id) is None:
+        raise HTTPException(status_code=404, detail="Genre not found.")
 
-    return genres
+    return json_response({
+        "start": start,
+        "end": end,
+        "distinct_readers": distinct_readers(session, GENRE, id, start, end),
+    })
 
 
 @router.post("/genres", response_model=GenreResponse, status_code=201)
@@ -58,16 +122,65 @@ def create_genre(
     -------
     - **return**: The created genre's details.
     """
-    genres = session.query(Genre).filter(Genre.name == genre_data.name.lower()).first()
-
-    if genres:
+    # Insert unless the name is taken, in a single statement
+    new_genre = session.execute(
+        insert(Genre)
+        .values(name=genre_data.name.lower())
+        .on_conflict_do_nothing(index_elements=[Genre.name])
+        .returning(*own_columns(Genre, GenreResponse))
+    ).one_or_none()
+
+    if new_genre is None:
         raise HTTPException(
             status_code=400, detail=f"Genre '{genre_data.name}' already exists."
         )
 
-    new_genre = Genre(name=genre_data.name.lower())
-    session.add(new_genre)
+    record_event(session, "genre", "created", GenreResponse.model_validate(new_genre))
+    invalidate_on_commit(session, REFERENCE)
     session.commit()
-    session.refresh(new_genre)
 
     return new_genre
+
+
+@router.put("/genres/bulk", response_model=List[BulkUpsertResult], status_code=200)
+def bulk_upsert_genres(
+        genres: List[GenreCreate] = Body(..., max_length=BULK_MAX_ITEMS),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Create or update many genres at once, matched by name.
+
+    Request Body
+    ------------
+    A list of up to 10000 genres:
+
+    - **name** (string): The name of the genre. Used to match existing genres.
+
+    Example Request Body
+    --------------------
+
+    ```json
+    [
+      {"name": "Science Fiction"},
+      {"name": "Poetry"}
+    ]
+    ```
+
+    Returns
+    -------
+    - **return**: The id and name of every genre in the request.
+    """
+    mapping = bulk_upsert_by_name(
+        session,
+        Genre,
+        [{"name": genre.name.lower()} for genre in genres],
+        aggregate="genre",
+    )
+
+    # Updated rows may be embedded in cached book pages
+    invalidate_on_commit(session, REFERENCE)
+    invalidate_on_commit(session, BOOKS)
+    session.commit()
+
+    return json_response(mapping)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+
+from app.dependencies import get_read_db
+from app.models import BorrowingHistory
+from app.models import User as UserModel
+from app.pagination import Pagination
+from app.routers.borrow_return import MAX_BORROW_LIMIT
+from app.schemas import LoanListAdapter, LoansResponse
+from app.serialization import dump_rows, json_response
+from auth.dependencies import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/me/loans", response_model=LoansResponse, status_code=200)
+def get_my_loans(
+        session: Session = Depends(get_read_db),
+        current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
+):
+    """
+    Retrieve the current user's loans and how many more books they can borrow.
+
+    Parameters
+    ----------
+    - **limit**: Number of past loans per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page of past loans, to continue after it.
+
+    Returns
+    -------
+    - **return**: The open loan count, the remaining borrow allowance, all active loans
+      and a page of past loans, oldest first.
+    """
+    # Active loans are few, bounded by the borrow limit, and come from the open-loan index
+    active = session.execute(
+        select(BorrowingHistory)
+        .options(joinedload(BorrowingHistory.book))
+        .where(
+            BorrowingHistory.branch_id == current_user.branch_id,
+            BorrowingHistory.user_id == current_user.id,
+            BorrowingHistory.return_date.is_(None),
+        )
+        .order_by(BorrowingHistory.id)
+    ).scalars().all()
+
+    query = pagination.paginate(
+        select(BorrowingHistory)
+        .options(joinedload(BorrowingHistory.book))
+        .where(
+            BorrowingHistory.branch_id == current_user.branch_id,
+            BorrowingHistory.user_id == current_user.id,
+            BorrowingHistory.return_date.is_not(None),
+        ),
+        (BorrowingHistory.id,),
+        "id",
+    )
+    rows, next_cursor = pagination.split(session.execute(query).all(), "id")
+    past = [row.BorrowingHistory for row in rows]
+
+    return json_response({
+        "open_loans": len(active),
+        "borrow_limit": MAX_BORROW_LIMIT,
+        "remaining_allowance": max(MAX_BORROW_LIMIT - len(active), 0),
+        "active": dump_rows(LoanListAdapter, active),
+        "past": pagination.envelope(dump_rows(LoanListAdapter, past), next_cursor),
+    })
@@ -1,38 +1,59 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, DataError
 from psycopg2.errors import UniqueViolation
 
-from app.dependencies import get_db
+from app.book_counts import own_columns, select_with_book_counts
+from app.bulk import BULK_MAX_ITEMS, bulk_upsert_by_name
+from app.cache import BOOKS, REFERENCE, get_cache, invalidate_on_commit
+from app.dependencies import get_db, get_read_db
 from app.models import Publisher
 from app.models import User as UserModel
-from app.schemas import PublisherCreate, PublisherResponse
+from app.outbox import record_event
+from app.pagination import Pagination
+from app.schemas import BulkUpsertResult, PublisherCreate, PublisherResponse, PublisherListAdapter, Page
+from app.serialization import dump_rows, json_response
 from auth.dependencies import get_current_user
 
 router = APIRouter()
 
 
-@router.get("/publishers", response_model=List[PublisherResponse], status_code=200)
+@router.get("/publishers", response_model=Page[PublisherResponse], status_code=200)
 def get_publishers(
-        session: Session = Depends(get_db),
+        session: Session = Depends(get_read_db),
         current_user: UserModel = Depends(get_current_user),
+        pagination: Pagination = Depends(),
 ):
     """
-    Retrieve all publishers in the library.
+    Retrieve the publishers in the library, one page at a time.
+
+    Parameters
+    ----------
+    - **limit**: Number of publishers per page (default is 20, max 100).
+    - **cursor**: The `next_cursor` of the previous page, to continue after it.
 
     Returns
     -------
-    - **return**: A list of all publishers in the library.
+    - **return**: A page of the publishers in the library, with the counts of the user's branch.
     """
-    publishers = session.query(Publisher).all()
 
-    if not publishers:
-        raise HTTPException(status_code=404, detail="No publishers found.")
+    def load_publishers():
+        query = pagination.paginate(
+            select_with_book_counts(Publisher, PublisherResponse, current_user.branch_id), (Publisher.id,), "id"
+        )
+        publishers, next_cursor = pagination.split(session.execute(query).all(), "id")
+
+        if not publishers:
+            raise HTTPException(status_code=404, detail="No publishers found.")
+
+        return pagination.envelope(dump_rows(PublisherListAdapter, publishers), next_cursor)
 
-    return publishers
+    key = f"{current_user.branch_id}:publishers:{pagination.cache_key}"
+    return json_response(get_cache().get_or_set(REFERENCE, key, load_publishers, session=session))
 
 
 @router.post("/publishers", response_model=PublisherResponse, status_code=201)
@@ -63,25 +84,17 @@ def create_publisher(
     -------
     - **return**: The created publisher's details.
     """
-    publisher = (
-        session.query(Publisher)
-        .filter(Publisher.name == publisher_data.name.lower())
-        .first()
-    )
-
-    if publisher:
-        raise HTTPException(
-            status_code=400, detail=f"Publisher '{publisher_data.name}' already exists."
-        )
-
-    new_publisher = Publisher(
-        name=publisher_data.name.lower(),
-        established_year=publisher_data.established_year,
-    )
+    # Insert unless the name is taken, in a single statement
     try:
-        session.add(new_publisher)
-        session.commit()
-        session.refresh(new_publisher)
+        new_publisher = session.execute(
+            insert(Publisher)
+            .values(
+                name=publisher_data.name.lower(),
+                established_year=publisher_data.established_year,
+            )
+            .on_conflict_do_nothing(index_elements=[Publisher.name])
+            .returning(*own_columns(Publisher, PublisherResponse))
+        ).one_or_none()
     except IntegrityError as e:
         session.rollback()  # Roll back the session in case of error
         raise HTTPException(
@@ -109,4 +122,61 @@ def create_publisher(
             status_code=500, detail=f"An unexpected error occurred: {str(e)}"
         ) from e
 
+    if new_publisher is None:
+        raise HTTPException(
+            status_code=400, detail=f"Publisher '{publisher_data.name}' already exists."
+        )
+
+    record_event(session, "publisher", "created", PublisherResponse.model_validate(new_publisher))
+    invalidate_on_commit(session, REFERENCE)
+    session.commit()
+
     return new_publisher
+
+
+@router.put("/publishers/bulk", response_model=List[BulkUpsertResult], status_code=200)
+def bulk_upsert_publishers(
+        publishers: List[PublisherCreate] = Body(..., max_length=BULK_MAX_ITEMS),
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Create or update many publishers at once, matched by name.
+
+    Request Body
+    ------------
+    A list of up to 10000 publishers:
+
+    - **name** (string): The name of the publisher. Used to match existing publishers.
+    - **established_year** (integer): The year the publisher was established.
+
+    Example Request Body
+    --------------------
+
+    ```json
+    [
+      {"name": "Penguin Books", "established_year": 1935},
+      {"name": "Faber and Faber", "established_year": 1929}
+    ]
+    ```
+
+    Returns
+    -------
+    - **return**: The id and name of every publisher in the request.
+    """
+    mapping = bulk_upsert_by_name(
+        session,
+        Publisher,
+        [
+            {"name": publisher.name.lower(), "established_year": publisher.established_year}
+            for publisher in publishers
+        ],
+        aggregate="publisher",
+    )
+
+    # Updated rows may be embedded in cached book pages
+    invalidate_on_commit(session, REFERENCE)
+    invalidate_on_commit(session, BOOKS)
+    session.commit()
+
+    return json_response(mapping)
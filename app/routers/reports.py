@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from sqlalchemy.orm import Session
+
+from app.dependencies import get_db
+from app.models import ReportJob
+from app.models import User as UserModel
+from app.reports import SUCCEEDED, report_params, submit_report
+from app.schemas import ReportCreate, ReportResponse
+from auth.dependencies import get_current_user
+
+router = APIRouter()
+
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+def get_own_report(session: Session, id: int, current_user: UserModel) -> ReportJob:
+    job = session.get(ReportJob, id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Report not found.")
+    return job
+
+
+@router.post("/reports", response_model=ReportResponse, status_code=202)
+def create_report(
+        report: ReportCreate,
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Queue a report on the user's branch. It is generated in the background,
+    poll `GET /reports/{id}` for its status.
+
+    Request Body
+    ------------
+    - **kind** (string): `annual_circulation`, `inventory_audit` or `overdue`.
+    - **format** (string): `csv` (default) or `parquet`.
+    - **year** (integer): Optional. Year of the annual circulation report, the current one by default.
+
+    Returns
+    -------
+    - **return**: The queued job.
+    """
+    job = ReportJob(
+        user_id=current_user.id,
+        kind=report.kind,
+        format=report.format,
+        params=report_params(report, current_user.branch_id),
+    )
+    session.add(job)
+    # The worker must see the job when it claims it
+    session.commit()
+    session.refresh(job)
+
+    submit_report(session.get_bind(), job.id)
+    return ReportResponse.model_validate(job)
+
+
+@router.get("/reports/{id}", response_model=ReportResponse, status_code=200)
+def get_report(
+        id: int,
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Retrieve the status of one of the current user's reports.
+
+    Parameters
+    ----------
+    - **id**: The ID of the report.
+
+    Returns
+    -------
+    - **return**: The job, with its status: `queued`, `running`, `succeeded` or `failed`.
+    """
+    return ReportResponse.model_validate(get_own_report(session, id, current_user))
+
+
+@router.get("/reports/{id}/download", status_code=200)
+def download_report(
+        id: int,
+        session: Session = Depends(get_db),
+        current_user: UserModel = Depends(get_current_user),
+):
+    """
+    Download a finished report.
+
+    Parameters
+    ----------
+    - **id**: The ID of the report.
+
+    Returns
+    -------
+    - **return**: The CSV or Parquet file.
+    """
+    job = get_own_report(session, id, current_user)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Report is {job.status}.")
+    return FileResponse(
+        job.path, media_type=MEDIA_TYPES[job.format], filename=f"{job.kind}-{job.id}.{job.format}"
+    )
@@ -1,8 +1,10 @@
-import re
-from datetime import date
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Any, Generic, Literal, Optional, List, TypeVar
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator, model_validator
+
+from app.isbn import normalize_isbn
+from app.models import DEFAULT_BRANCH_ID
 
 
 class UserBase(BaseModel):
@@ -11,17 +13,18 @@ class UserBase(BaseModel):
 
 class UserCreate(UserBase):
     password: str
+    branch_id: int = DEFAULT_BRANCH_ID
 
 
 class UserResponse(UserBase):
     id: int
     username: str
+    branch_id: int = DEFAULT_BRANCH_ID
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
-class BookCreate(BaseModel):
+class BookBase(BaseModel):
     title: str
     isbn: str
     author_id: int
@@ -30,14 +33,12 @@ class BookCreate(BaseModel):
     publish_date: date
     available: bool = True
 
+
+class BookCreate(BookBase):
     @field_validator("isbn")
     def validate_isbn(cls, v):
-        # ISBN-10 or ISBN-13 regex pattern
-        isbn_pattern = re.compile(
-            r"^(97(8|9)?[\s-]?)?\d{1,5}[\s-]?\d{1,7}[\s-]?\d{1,6}[\s-]?\d{1}$|^(97(8|9)?[\s-]?)?\d{9}(\d|X)$"
-        )
-        if not isbn_pattern.match(v):
-            raise ValueError("Invalid ISBN format. Must be ISBN-10 or ISBN-13.")
+        # ISBN-10 or ISBN-13, checked against its check digit
+        normalize_isbn(v)
         return v
 
     @field_validator("publish_date")
@@ -47,18 +48,51 @@ class BookCreate(BaseModel):
         return v
 
 
-class BookResponse(BookCreate):
+class BookUpdate(BaseModel):
+    # Only the fields that are sent are changed
+    title: Optional[str] = None
+    isbn: Optional[str] = None
+    author_id: Optional[int] = None
+    genre_id: Optional[int] = None
+    publisher_id: Optional[int] = None
+    publish_date: Optional[date] = None
+    available: Optional[bool] = None
+
+    @field_validator("isbn")
+    def validate_isbn(cls, v):
+        if v is not None:
+            normalize_isbn(v)
+        return v
+
+    @field_validator("publish_date")
+    def validate_publish_date(cls, v):
+        if v is not None and v >= date.today():
+            raise ValueError("Publish date must be in the past.")
+        return v
+
+    @model_validator(mode="after")
+    def validate_not_null(self):
+        for name in self.model_fields_set - {"publisher_id", "publish_date"}:
+            if getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null.")
+        return self
+
+
+# Not validated like BookCreate: books stored before ISBNs were checked are still served
+class BookResponse(BookBase):
     id: int
+    branch_id: int = DEFAULT_BRANCH_ID
+    isbn13: Optional[str] = None
+    version: int = 1
 
-    class Config:
-        orm_mode = True
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PaginationInfo(BaseModel):
     page: int
     size: int
     total: int
+    next_cursor: Optional[str] = None
 
 
 class BookResponsePagination(BaseModel):
@@ -66,6 +100,19 @@ class BookResponsePagination(BaseModel):
     tasks: List[BookResponse]
 
 
+T = TypeVar("T")
+
+
+class CursorPagination(BaseModel):
+    limit: int
+    next_cursor: Optional[str] = None
+
+
+class Page(BaseModel, Generic[T]):
+    pagination: CursorPagination
+    items: List[T]
+
+
 class AuthorCreate(BaseModel):
     name: str
     birthdate: date
@@ -76,15 +123,15 @@ class AuthorCreate(BaseModel):
             raise ValueError("Birthdate cannot be in the future.")
         return v
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AuthorResponse(AuthorCreate):
     id: int
+    book_count: int = 0
+    available_count: int = 0
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PublisherCreate(BaseModel):
@@ -97,36 +144,40 @@ class PublisherCreate(BaseModel):
             raise ValueError("Established year must be in past.")
         return v
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PublisherResponse(PublisherCreate):
     id: int
+    book_count: int = 0
+    available_count: int = 0
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class GenreCreate(BaseModel):
     name: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class GenreResponse(GenreCreate):
     id: int
+    book_count: int = 0
+    available_count: int = 0
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+
+class BulkUpsertResult(BaseModel):
+    id: int
+    name: str
 
 
 class BorrowingHistoryCreate(BaseModel):
     book_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class BorrowingHistoryResponse(BaseModel):
@@ -136,16 +187,31 @@ class BorrowingHistoryResponse(BaseModel):
     borrow_date: date
     return_date: Optional[date] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LoanResponse(BaseModel):
+    id: int
+    book: BookResponse
+    borrow_date: date
+    return_date: Optional[date] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LoansResponse(BaseModel):
+    open_loans: int
+    borrow_limit: int
+    remaining_allowance: int
+    active: List[LoanResponse]
+    past: Page[LoanResponse]
 
 
 class ReturnRequestCreate(BaseModel):
     book_id: int
     return_date: date = date.today()
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ReturnRequestResponse(BaseModel):
@@ -155,5 +221,63 @@ class ReturnRequestResponse(BaseModel):
     borrow_date: date
     return_date: date
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class RecommendationResponse(BaseModel):
+    book: BookResponse
+    score: int
+
+
+class DistinctReadersResponse(BaseModel):
+    start: date
+    end: date
+    distinct_readers: int
+
+
+class ChangeEvent(BaseModel):
+    id: int
+    aggregate: str
+    aggregate_id: int
+    event_type: str
+    payload: dict[str, Any]
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ChangesResponse(BaseModel):
+    events: List[ChangeEvent]
+    next_cursor: Optional[str] = None
+    has_more: bool
+
+
+class ReportCreate(BaseModel):
+    kind: Literal["annual_circulation", "inventory_audit", "overdue"]
+    format: Literal["csv", "parquet"] = "csv"
+    # Year of the annual circulation report, the current one by default
+    year: Optional[int] = Field(None, ge=1, le=9998)
+
+
+class ReportResponse(BaseModel):
+    id: int
+    kind: str
+    format: str
+    params: dict[str, Any]
+    status: str
+    row_count: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Adapters used by list endpoints to validate and dump whole result sets at once
+BookListAdapter = TypeAdapter(List[BookResponse])
+AuthorListAdapter = TypeAdapter(List[AuthorResponse])
+GenreListAdapter = TypeAdapter(List[GenreResponse])
+PublisherListAdapter = TypeAdapter(List[PublisherResponse])
+LoanListAdapter = TypeAdapter(List[LoanResponse])
+ChangeEventListAdapter = TypeAdapter(List[ChangeEvent])
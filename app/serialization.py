@@ -0,0 +1,77 @@
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+
+def response_columns(model, schema: type[BaseModel], fields: Optional[Sequence[str]] = None) -> list:
+    """
+    Return the model columns needed to build `schema`, so list queries select
+    only what the response carries instead of whole ORM objects. `fields`
+    narrows the selection to a sparse fieldset.
+    """
+    return [getattr(model, name) for name in (fields or schema.model_fields)]
+
+
+def sparse_fields(schema: type[BaseModel]) -> Callable[..., tuple[str, ...]]:
+    """
+    Build a dependency reading the `fields=` query parameter: a comma-separated
+    subset of the schema's fields. Returns the requested fields in schema
+    order, or all of them when the parameter is absent.
+    """
+    allowed = tuple(schema.model_fields)
+
+    def dependency(
+            fields: Optional[str] = Query(
+                None, description=f"Comma-separated subset of: {', '.join(allowed)}"
+            ),
+    ) -> tuple[str, ...]:
+        if fields is None:
+            return allowed
+
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested - set(allowed)
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}.",
+            )
+        return tuple(name for name in allowed if name in requested)
+
+    return dependency
+
+
+@lru_cache(maxsize=256)
+def projection_adapter(schema: type[BaseModel], fields: tuple[str, ...]) -> TypeAdapter:
+    """
+    TypeAdapter for a list of `schema` narrowed to `fields`, built once per
+    field set. Values come from the database, so only types are checked.
+    """
+    if fields == tuple(schema.model_fields):
+        return TypeAdapter(List[schema])
+
+    projection = create_model(
+        f"{schema.__name__}Projection",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, ...) for name in fields},
+    )
+    return TypeAdapter(List[projection])
+
+
+def dump_rows(adapter: TypeAdapter, rows: Sequence[Any]) -> list:
+    """
+    Validate a whole result set in one pass and dump it to plain Python objects.
+    """
+    return adapter.dump_python(adapter.validate_python(rows))
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[dict] = None) -> ORJSONResponse:
+    """
+    Write already validated content with orjson.
+
+    Returning a response directly also skips FastAPI's second validation
+    against `response_model`, which is kept on the route for the docs only.
+    """
+    return ORJSONResponse(content=content, status_code=status_code, headers=headers)
@@ -0,0 +1,144 @@
+import logging
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger("app.slow_query")
+
+# ASGI scope of the request currently being served. The router fills in
+# "route" and "endpoint" on the same dict, so they are visible by the time
+# the handler runs its queries.
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+# Plans are captured off the request path, one at a time, so a burst of slow
+# queries never doubles the load on the database.
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+EXPLAIN_OPTION = "slow_query_explain"
+
+# SELECTs that must not run twice: row locks would wait for the original
+# transaction and then block its neighbours, notifications and advisory locks
+# have side effects.
+_UNSAFE_TO_EXPLAIN = re.compile(
+    r"\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b|\bpg_notify\b|\bpg_(try_)?advisory",
+    re.IGNORECASE,
+)
+
+
+class SlowQueryMiddleware:
+    """
+    Pure ASGI middleware that exposes the current request to the query listeners.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+def _describe_request() -> tuple[str, str]:
+    # Return the route path and the qualified name of the handler, if known
+    scope = _request_scope.get()
+    if scope is None:
+        return "-", "-"
+
+    route = scope.get("route")
+    endpoint = scope.get("endpoint")
+    route_path = getattr(route, "path", scope.get("path", "-"))
+    handler = (
+        f"{endpoint.__module__}.{endpoint.__qualname__}" if endpoint is not None else "-"
+    )
+    return f"{scope.get('method', '-')} {route_path}", handler
+
+
+def _capture_plan(engine: Engine, statement: str, parameters, route: str, handler: str):
+    # EXPLAIN ANALYZE executes the statement again, so only SELECTs get here
+    # and the transaction is always rolled back.
+    try:
+        with engine.connect() as conn:
+            conn.execution_options(**{EXPLAIN_OPTION: True})
+            result = conn.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            )
+            plan = "\n".join(row[0] for row in result)
+            conn.rollback()
+    except Exception:
+        logger.exception("Could not capture plan for slow query in %s (%s)", route, handler)
+        return
+
+    logger.warning(
+        "Plan for slow query in %s (%s):\n%s\n%s", route, handler, statement, plan
+    )
+
+
+def _can_explain(statement: str) -> bool:
+    # EXPLAIN ANALYZE runs the statement on another connection, only plain reads are safe
+    return statement.lstrip()[:6].upper() == "SELECT" and not _UNSAFE_TO_EXPLAIN.search(statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+
+    if conn.get_execution_options().get(EXPLAIN_OPTION):
+        return
+    if elapsed_ms < settings.slow_query_threshold_ms:
+        return
+
+    route, handler = _describe_request()
+    logger.warning(
+        "Slow query (%.1f ms) in %s (%s): %s | parameters: %r",
+        elapsed_ms,
+        route,
+        handler,
+        statement,
+        parameters,
+    )
+
+    if (
+        _can_explain(statement)
+        and not executemany
+        and random.random() < settings.slow_query_explain_sample_rate
+    ):
+        _explain_executor.submit(
+            _capture_plan, conn.engine, statement, parameters, route, handler
+        )
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        start_times = context.connection.info.get("query_start_time")
+        if start_times:
+            start_times.pop()
+
+
+def install_slow_query_log(engine: Engine) -> None:
+    """
+    Time every statement on the engine and log those slower than the threshold.
+    """
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
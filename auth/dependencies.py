@@ -1,15 +1,22 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
-from app.models import User
+from app.cache import PRINCIPALS, get_cache
+from app.models import DEFAULT_BRANCH_ID, User
 from app.config import settings
 from auth.models import TokenData
 from auth.utils import verify_password
 from app.dependencies import get_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
+
+# Cookie an EventSource can carry the access token in, as it can't send headers
+ACCESS_TOKEN_COOKIE = "access_token"
 
 
 # Get a user from the database by username
@@ -34,6 +41,8 @@ def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
 
     try:
         payload = jwt.decode(
@@ -46,8 +55,36 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
+    # Serve the principal from the cache, users are looked up once per TTL
+    cache = get_cache()
+    principal = cache.get(PRINCIPALS, token_data.username)
+    if principal is not None:
+        # Principals cached before there were branches are of the default branch
+        return User(
+            id=principal["id"],
+            username=principal["username"],
+            branch_id=principal.get("branch_id", DEFAULT_BRANCH_ID),
+        )
+
     user = get_user(db, username=token_data.username)
     if user is None:
         raise credentials_exception
 
+    cache.set(
+        PRINCIPALS,
+        user.username,
+        {"id": user.id, "username": user.username, "branch_id": user.branch_id},
+        settings.principal_cache_ttl_seconds,
+    )
     return user
+
+
+# Get the currently logged-in user of an event stream, whose token may also be
+# in the access_token query parameter or cookie since EventSource can't set headers
+def get_stream_user(
+    request: Request,
+    db: Session = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+) -> User:
+    return get_current_user(db, token or access_token or request.cookies.get(ACCESS_TOKEN_COOKIE))
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from app.errors import raise_for_integrity_error
 from app.models import User
 from app.schemas import UserCreate, UserResponse
 from .utils import create_access_token, get_password_hash
-from .dependencies import authenticate_user, get_db, get_user
+from .dependencies import authenticate_user, get_db
 from .models import Token
 
 router = APIRouter()
@@ -35,14 +38,21 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     """
     Endpoint to register a new user.
     """
-    db_user = get_user(db, username=user.username)
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-
     hashed_password = get_password_hash(user.password)
-    db_user = User(username=user.username, hashed_password=hashed_password)
 
-    db.add(db_user)
+    # Insert unless the username is taken, in a single statement
+    try:
+        db_user = db.execute(
+            insert(User)
+            .values(username=user.username, hashed_password=hashed_password, branch_id=user.branch_id)
+            .on_conflict_do_nothing(index_elements=[User.username])
+            .returning(User.id, User.username, User.branch_id)
+        ).one_or_none()
+    except IntegrityError as e:
+        db.rollback()
+        raise_for_integrity_error(e, {"users_branch_id_fkey": (404, "Branch not found.")})
+    if db_user is None:
+        raise HTTPException(status_code=400, detail="Username already registered")
+
     db.commit()
-    db.refresh(db_user)
     return db_user
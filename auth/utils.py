@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
-from typing import Union
-from jose import jwt
+from typing import Optional, Union
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.config import settings
 
@@ -31,3 +31,24 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
         to_encode, settings.secret_key, algorithm=settings.algorithm
     )
     return encoded_jwt
+
+
+# Read the subject of a token without verifying it, for routing decisions only
+def get_token_subject(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+# Read the subject of a token after verifying its signature and expiry
+def verify_token_subject(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    return payload.get("sub")
@@ -0,0 +1,75 @@
+"""
+Microbenchmark: CPU spent serializing one 100-item page of books.
+
+Compares the previous path (per-object `from_orm`, validation against the
+response model, `jsonable_encoder` and `json.dumps`) with the batch path used
+by the list endpoints (one TypeAdapter pass over selected rows and orjson).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serialization
+"""
+import json
+import timeit
+from collections import namedtuple
+from datetime import date
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import Book
+from app.schemas import BookListAdapter, BookResponse, BookResponsePagination
+from app.serialization import dump_rows, json_response
+
+PAGE_SIZE = 100
+ROUNDS = 200
+
+BookRow = namedtuple("BookRow", list(BookResponse.model_fields))
+
+
+def make_page():
+    books, rows = [], []
+    for i in range(1, PAGE_SIZE + 1):
+        values = dict(
+            title=f"Book {i}",
+            isbn="0-19-853453-1",
+            author_id=i % 7 + 1,
+            genre_id=i % 5 + 1,
+            publisher_id=None,
+            publish_date=date(2001, 1, 1),
+            available=True,
+            id=i,
+        )
+        books.append(Book(**values))
+        rows.append(BookRow(**{name: values[name] for name in BookRow._fields}))
+    return books, rows
+
+
+def orm_path(books):
+    responses = [BookResponse.model_validate(book) for book in books]
+    content = {
+        "pagination": {"page": 1, "size": PAGE_SIZE, "total": len(books)},
+        "tasks": responses,
+    }
+    validated = BookResponsePagination.model_validate(content)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def batch_path(rows):
+    content = {
+        "pagination": {"page": 1, "size": PAGE_SIZE, "total": len(rows), "next_cursor": None},
+        "tasks": dump_rows(BookListAdapter, rows),
+    }
+    return json_response(content).body
+
+
+def main():
+    books, rows = make_page()
+    assert json.loads(orm_path(books)) == json.loads(batch_path(rows))
+
+    for name, func, arg in (("orm", orm_path, books), ("batch", batch_path, rows)):
+        best = min(timeit.repeat(lambda: func(arg), number=ROUNDS, repeat=5))
+        print(f"{name:>6}: {best / ROUNDS * 1e6:8.1f} us per {PAGE_SIZE}-item page")
+
+
+if __name__ == "__main__":
+    main()
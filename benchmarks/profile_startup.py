@@ -0,0 +1,56 @@
+"""
+Import-time profile of the application.
+
+Imports `app.main` in a fresh interpreter with `-X importtime` and an empty
+environment (no database settings, no reachable database), then prints the
+total import time and the slowest modules imported directly by it.
+
+Run from the repository root:
+
+    python -m benchmarks.profile_startup
+"""
+import os
+import subprocess
+import sys
+
+TOP = 15
+
+
+def profile_import(module: str = "app.main") -> tuple[int, list[tuple[int, str]]]:
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": os.getcwd()}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Children are reported before their parent, one indent level deeper
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                return int(cumulative), children
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    raise RuntimeError(f"{module} not found in the import profile")
+
+
+def main():
+    total, children = profile_import()
+
+    print(f"import app.main: {total / 1000:.1f} ms")
+    for us, name in sorted(children, reverse=True)[:TOP]:
+        print(f"{us / 1000:10.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,20 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.cache import get_cache
 from app.database import Base
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.main import app
 from app.config import settings
+from app.rate_limit import reset_bucket_store
+from app.slow_query import install_slow_query_log
 
 # Define the test database engine
 SQLALCHEMY_TEST_DATABASE_URL = f"postgresql+psycopg2://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.test_db_name}"
 
 # Create the test database engine
 engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL)
+install_slow_query_log(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create a TestClient to send requests to the FastAPI
@@ -30,6 +34,7 @@ def override_get_db():
 
 # Override the default get_db dependency to use the test database
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -37,9 +42,11 @@ def setup_and_teardown():
     """
     Fixture to set up and tear down the test database.
     """
-    # Setup: Clear the test database
+    # Setup: Clear the test database, the cache and the rate limits
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    get_cache().clear()
+    reset_bucket_store()
     yield
     # Teardown: Clear the test database after each test
     Base.metadata.drop_all(bind=engine)
@@ -84,7 +91,7 @@ def create_book(create_user):
 
     book_data = {
         "title": "New book",
-        "isbn": "0-19-853453-5",
+        "isbn": "0-19-853453-1",
         "author_id": author_response.json()["id"],
         "genre_id": genre_response.json()["id"],
         "publisher_id": None,
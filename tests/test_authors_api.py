@@ -1,7 +1,8 @@
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
 from app.main import app
-from tests.conftest import create_user, create_book
+from tests.conftest import create_user, create_book, engine
 
 client = TestClient(app)
 
@@ -36,6 +37,30 @@ def test_create_author_duplicate(create_user):
     }
 
 
+def test_create_author_single_statement(create_user):
+    """
+    Test case that creating an author touches the authors table with one INSERT only.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        author_data = {"name": "Jane Austen", "birthdate": "1960-01-01"}
+        headers = {"Authorization": f"Bearer {create_user}"}
+        client.post("/authors", json=author_data, headers=headers)
+        response = client.post("/authors", json=author_data, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 400
+    author_statements = [s for s in statements if "authors" in s]
+    assert len(author_statements) == 2
+    assert all(s.startswith("INSERT INTO authors") for s in author_statements)
+
+
 def test_create_author_with_invalid_data(create_user):
     """
     Test case for creating author with invalid data.
@@ -47,6 +72,31 @@ def test_create_author_with_invalid_data(create_user):
     assert response.status_code == 422
 
 
+def test_get_author(create_user):
+    """
+    Test case for retrieving a single author.
+    """
+    author_data = {"name": "Test Author", "birthdate": "1965-07-05"}
+    created = client.post(
+        "/authors", json=author_data, headers={"Authorization": f"Bearer {create_user}"}
+    ).json()
+
+    response = client.get(
+        f"/authors/{created['id']}", headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 200
+    assert response.json() == created
+
+
+def test_get_author_not_found(create_user):
+    """
+    Test case for retrieving an author that doesn't exist.
+    """
+    response = client.get("/authors/1", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Author not found"}
+
+
 def test_get_author_no_books(create_user):
     """
     Test case for retrieving no books written by an author.
@@ -72,3 +122,117 @@ def test_get_author_books(create_user, create_book):
     assert create_book["title"] == create_book["title"]
     assert create_book["isbn"] == create_book["isbn"]
     assert create_book["author_id"] == author_id
+
+
+def test_get_author_books_sparse_fields(create_user, create_book):
+    """
+    Test case for retrieving an author's books narrowed to the requested fields.
+    """
+    author_id = create_book["author_id"]
+    response = client.get(
+        f"/authors/{author_id}/books?fields=isbn",
+        headers={"Authorization": f"Bearer {create_user}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["items"] == [{"isbn": create_book["isbn"]}]
+
+
+def test_get_author_books_include(create_user, create_book):
+    """
+    Test case for embedding the author and genre in an author's books.
+    """
+    author_id = create_book["author_id"]
+    response = client.get(
+        f"/authors/{author_id}/books?fields=id&include=genre,author",
+        headers={"Authorization": f"Bearer {create_user}"},
+    )
+
+    assert response.status_code == 200
+    book = response.json()["items"][0]
+    assert book["author"]["id"] == author_id
+    assert book["genre"]["id"] == create_book["genre_id"]
+    # The foreign keys were only read to load the relations
+    assert set(book) == {"id", "author", "genre"}
+
+
+def test_bulk_upsert_authors(create_user):
+    """
+    Test case for creating and updating authors in bulk.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    existing = client.post(
+        "/authors", json={"name": "Jane Austen", "birthdate": "1960-01-01"}, headers=headers
+    ).json()
+
+    response = client.put(
+        "/authors/bulk",
+        json=[
+            {"name": "Jane Austen", "birthdate": "1775-12-16"},
+            {"name": "Mary Shelley", "birthdate": "1797-08-30"},
+            {"name": "Mary Shelley", "birthdate": "1797-08-30"},
+        ],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    mapping = {item["name"]: item["id"] for item in response.json()}
+    assert len(response.json()) == 2
+    assert mapping["Jane Austen"] == existing["id"]
+
+    books = client.get(f"/authors/{mapping['Mary Shelley']}/books", headers=headers)
+    assert books.status_code == 200
+
+
+def test_book_counts(create_user, create_book):
+    """
+    Test case that the book counts follow books being added, changed and deleted.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    author_id, genre_id = create_book["author_id"], create_book["genre_id"]
+    other_id = client.post(
+        "/authors", json={"name": "Mary Shelley", "birthdate": "1797-08-30"}, headers=headers
+    ).json()["id"]
+
+    def counts(path):
+        body = client.get(path, headers=headers).json()
+        return body["book_count"], body["available_count"]
+
+    assert counts(f"/authors/{author_id}") == (1, 1)
+    assert client.get("/genres", headers=headers).json()["items"][0]["book_count"] == 1
+
+    book_data = {**create_book, "title": "Another book", "isbn": "0-19-853454-X", "available": False}
+    del book_data["id"]
+    second = client.post("/books", json=book_data, headers=headers).json()
+    assert counts(f"/authors/{author_id}") == (2, 1)
+
+    client.patch(f"/books/{second['id']}", json={"author_id": other_id, "available": True},
+                 headers={**headers, "If-Match": "*"})
+    assert counts(f"/authors/{author_id}") == (1, 1)
+    assert counts(f"/authors/{other_id}") == (1, 1)
+
+    client.delete(f"/books/{create_book['id']}", headers={**headers, "If-Match": "*"})
+    assert counts(f"/authors/{author_id}") == (0, 0)
+    assert client.get("/genres", headers=headers).json()["items"][0]["book_count"] == 1
+
+
+def test_get_authors_sorted_by_book_count(create_user, create_book):
+    """
+    Test case for paging through the authors with the most books first.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    for name in ["Mary Shelley", "Emily Bronte"]:
+        client.post("/authors", json={"name": name, "birthdate": "1800-01-01"}, headers=headers)
+
+    names = []
+    url = "/authors?sort_by=book_count&limit=1"
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        names += [author["name"] for author in response.json()["items"]]
+        cursor = response.json()["pagination"]["next_cursor"]
+        url = f"/authors?sort_by=book_count&limit=1&cursor={cursor}" if cursor else None
+
+    assert names == ["Jane Austen", "Mary Shelley", "Emily Bronte"]
+
+    response = client.get("/authors?sort_by=name", headers=headers)
+    assert [author["name"] for author in response.json()["items"]] == ["Emily Bronte", "Jane Austen", "Mary Shelley"]
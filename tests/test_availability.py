@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.availability import AVAILABILITY_CHANNEL, AvailabilityBroadcaster, availability_events
+from app.main import app
+from app.notifications import PgListener
+from auth.dependencies import get_stream_user
+from tests.conftest import TestingSessionLocal, create_user, create_book, engine
+
+client = TestClient(app)
+
+
+def test_broadcaster_fans_out_from_another_thread():
+    """
+    Test case that an event published by the listener thread reaches every subscriber.
+    """
+
+    async def scenario():
+        broadcaster = AvailabilityBroadcaster()
+        broadcaster.bind(asyncio.get_running_loop())
+        first, second = broadcaster.subscribe(), broadcaster.subscribe()
+
+        thread = threading.Thread(target=broadcaster.publish, args=({"book_id": 1},))
+        thread.start()
+        thread.join()
+
+        return await first.get(), await second.get()
+
+    assert asyncio.run(scenario()) == ({"book_id": 1}, {"book_id": 1})
+
+
+def test_broadcaster_disconnects_slow_subscriber():
+    """
+    Test case that a subscriber with a full queue is dropped and its stream ended.
+    """
+
+    async def scenario():
+        broadcaster = AvailabilityBroadcaster(queue_size=1)
+        broadcaster.bind(asyncio.get_running_loop())
+        queue = broadcaster.subscribe()
+
+        broadcaster.publish({"book_id": 1})
+        broadcaster.publish({"book_id": 2})
+        await asyncio.sleep(0)
+
+        return broadcaster.subscriber_count, await queue.get()
+
+    assert asyncio.run(scenario()) == (0, None)
+
+
+def test_availability_events():
+    """
+    Test case for the server-sent events written to a subscriber.
+    """
+
+    async def scenario():
+        broadcaster = AvailabilityBroadcaster()
+        broadcaster.bind(asyncio.get_running_loop())
+        events = availability_events(broadcaster, 1, keepalive=0.01)
+
+        chunks = [await events.__anext__(), await events.__anext__()]
+        # Another branch's event is skipped
+        broadcaster.publish({"book_id": 2, "event": "borrowed", "branch_id": 2})
+        broadcaster.publish({"book_id": 1, "event": "borrowed", "branch_id": 1})
+        while not chunks[-1].startswith("event:"):
+            chunks.append(await events.__anext__())
+
+        await events.aclose()
+        return chunks, broadcaster.subscriber_count
+
+    chunks, subscriber_count = asyncio.run(scenario())
+    assert chunks[0] == "retry: 3000\n\n"
+    assert chunks[1] == ": keep-alive\n\n"
+    assert chunks[-1] == 'event: availability\ndata: {"book_id": 1, "event": "borrowed", "branch_id": 1}\n\n'
+    assert subscriber_count == 0
+
+
+def test_borrow_and_return_notify_availability(create_user, create_book):
+    """
+    Test case that borrowing and returning a book announce it on the availability channel.
+    """
+    received = []
+    delivered = threading.Event()
+
+    def handler(message):
+        received.append(message)
+        if len(received) == 2:
+            delivered.set()
+
+    listener = PgListener(engine)
+    listener.subscribe(AVAILABILITY_CHANNEL, handler)
+    listener.start()
+    try:
+        assert listener.wait_until_listening()
+
+        headers = {"Authorization": f"Bearer {create_user}"}
+        client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+        client.post("/return", json={"book_id": create_book["id"]}, headers=headers)
+
+        assert delivered.wait(5)
+        assert received == [
+            {"book_id": create_book["id"], "event": "borrowed", "branch_id": 1},
+            {"book_id": create_book["id"], "event": "returned", "branch_id": 1},
+        ]
+    finally:
+        listener.stop()
+
+
+
+def test_availability_stream_requires_token(create_user):
+    """
+    Test case that the stream needs a token, which EventSource can pass in the query string or a cookie.
+    """
+    assert client.get("/books/availability/stream").status_code == 401
+    assert client.get("/books/availability/stream?access_token=forged").status_code == 401
+
+    without_cookie = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    with_cookie = Request({
+        "type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", f"access_token={create_user}".encode())]
+    })
+    with TestingSessionLocal() as db:
+        assert get_stream_user(without_cookie, db, None, create_user).username == "testuser"
+        assert get_stream_user(with_cookie, db, None, None).username == "testuser"
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
 from app.main import app
-from tests.conftest import create_user, create_book
+from app.models import Book
+from tests.conftest import create_user, create_book, engine, TestingSessionLocal
 
 client = TestClient(app)
 
@@ -17,6 +19,62 @@ def test_get_book_history(create_user, create_book):
     assert response.status_code == 200
 
 
+def test_get_book_history_with_borrow(create_user, create_book):
+    """
+    Test case for retrieving history with the borrower and book embedded.
+    """
+    book_id = create_book["id"]
+    client.post(
+        "/borrow", json={"book_id": book_id}, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    response = client.get(
+        f"/books/{book_id}/history", headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 200
+    history = response.json()["items"]
+    assert len(history) == 1
+    assert history[0]["user"]["username"] == "testuser"
+    assert history[0]["book"] == create_book
+    assert history[0]["return_date"] is None
+
+
+def test_get_book_history_after_borrow_and_return(create_user, create_book):
+    """
+    Test case that borrowing and returning refresh every cached page and fieldset of the history.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    book_id = create_book["id"]
+    assert client.get(f"/books/{book_id}/history", headers=headers).json()["items"] == []
+    assert client.get(f"/books/{book_id}/history?fields=id", headers=headers).json()["items"] == []
+
+    assert client.post("/borrow", json={"book_id": book_id}, headers=headers).status_code == 201
+    history = client.get(f"/books/{book_id}/history", headers=headers).json()["items"]
+    assert len(history) == 1
+    assert history[0]["return_date"] is None
+    assert len(client.get(f"/books/{book_id}/history?fields=id", headers=headers).json()["items"]) == 1
+
+    assert client.post("/return", json={"book_id": book_id}, headers=headers).status_code == 201
+    history = client.get(f"/books/{book_id}/history", headers=headers).json()["items"]
+    assert history[0]["return_date"] is not None
+
+
+def test_get_book_history_sparse_fields(create_user, create_book):
+    """
+    Test case for retrieving history narrowed to a few fields, without the joined borrower and book.
+    """
+    book_id = create_book["id"]
+    client.post(
+        "/borrow", json={"book_id": book_id}, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    response = client.get(
+        f"/books/{book_id}/history?fields=return_date,id",
+        headers={"Authorization": f"Bearer {create_user}"},
+    )
+    assert response.status_code == 200
+    assert list(response.json()["items"][0]) == ["id", "return_date"]
+    assert response.json()["items"][0]["return_date"] is None
+
+
 def test_get_no_book_history(create_user):
     """
     Test case for retrieving the borrowing history but with wrong book_id.
@@ -36,6 +94,147 @@ def test_get_books(create_user, create_book):
     assert response.status_code == 200
     assert len(response.json()) > 0
     assert isinstance(response.json()["tasks"], list)
+    assert response.json()["tasks"][0] == create_book
+
+
+def test_get_books_sparse_fields(create_user, create_book):
+    """
+    Test case for retrieving books narrowed to the requested fields.
+    """
+    response = client.get(
+        "/books?fields=title,id&sort_by=author", headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 200
+    assert response.json()["tasks"] == [{"id": create_book["id"], "title": create_book["title"]}]
+
+    # A different fieldset is not served from the cached page
+    response = client.get("/books?sort_by=author", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.json()["tasks"] == [create_book]
+
+
+def test_get_books_unknown_fields(create_user):
+    """
+    Test case for requesting fields that books don't have.
+    """
+    response = client.get(
+        "/books?fields=title,password", headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Unknown fields: password.")
+
+
+def test_get_books_include(create_user, create_book):
+    """
+    Test case for embedding related rows in books, one query per relation.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(
+            "/books?include=author,genre,publisher", headers={"Authorization": f"Bearer {create_user}"}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    # The publisher is null, so there is nothing to load for it
+    assert len([s for s in statements if "FROM authors" in s]) == 1
+    assert len([s for s in statements if "FROM genres" in s]) == 1
+    assert not [s for s in statements if "FROM publishers" in s]
+    book = response.json()["tasks"][0]
+    assert book["author"]["id"] == create_book["author_id"]
+    assert book["genre"]["id"] == create_book["genre_id"]
+    assert book["publisher"] is None
+
+
+def test_get_books_unknown_include(create_user):
+    """
+    Test case for requesting a relation that books don't have.
+    """
+    response = client.get("/books?include=user", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.status_code == 400
+
+
+def add_books(token, book, titles_and_dates):
+    # Add books by the fixture book's author and genre
+    isbns = ["0-19-853455-8", "0-19-853456-6"]
+    for isbn, (title, publish_date) in zip(isbns, titles_and_dates):
+        response = client.post(
+            "/books",
+            json={
+                "title": title,
+                "isbn": isbn,
+                "author_id": book["author_id"],
+                "genre_id": book["genre_id"],
+                "publish_date": publish_date,
+            },
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 201
+
+
+def test_get_books_filters(create_user, create_book):
+    """
+    Test case for filtering books by genre, availability and publish date range.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    add_books(create_user, create_book, [("Old book", "1990-05-01"), ("Older book", "1980-05-01")])
+    other_genre = client.post("/genres", json={"name": "Poetry"}, headers=headers).json()
+
+    response = client.get(
+        f"/books?genre_id={create_book['genre_id']}&available=true"
+        "&published_from=1985-01-01&published_to=2000-01-01&fields=title",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["tasks"] == [{"title": "Old book"}]
+
+    response = client.get(f"/books?genre_id={other_genre['id']}", headers=headers)
+    assert response.status_code == 404
+
+
+def test_get_books_keyset_pagination(create_user, create_book):
+    """
+    Test case for paging through sorted books with cursors, including a book without publish date.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    add_books(create_user, create_book, [("Old book", "1990-05-01"), ("Older book", "1980-05-01")])
+    with TestingSessionLocal() as session:
+        session.add(Book(
+            title="Undated book", isbn="0-19-853457-4",
+            author_id=create_book["author_id"], genre_id=create_book["genre_id"],
+        ))
+        session.commit()
+
+    titles = []
+    url = "/books?sort_by=publish_date&size=1&fields=title"
+    while url and len(titles) < 5:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        titles += [book["title"] for book in response.json()["tasks"]]
+        cursor = response.json()["pagination"]["next_cursor"]
+        url = f"/books?sort_by=publish_date&size=1&fields=title&cursor={cursor}" if cursor else None
+
+    assert titles == ["Older book", "Old book", "New book", "Undated book"]
+
+
+def test_get_books_invalid_cursor(create_user, create_book):
+    """
+    Test case for cursors that are malformed or come from another ordering.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    response = client.get("/books?cursor=not-a-cursor", headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor."}
+
+    add_books(create_user, create_book, [("Old book", "1990-05-01")])
+    cursor = client.get("/books?size=1", headers=headers).json()["pagination"]["next_cursor"]
+    response = client.get(f"/books?size=1&sort_by=title&cursor={cursor}", headers=headers)
+    assert response.status_code == 400
 
 
 def test_get_books_no_data(create_user):
@@ -58,7 +257,7 @@ def test_create_book_author_not_found(create_user):
 
     book_data = {
         "title": "Another Book",
-        "isbn": "0-19-853454-3",
+        "isbn": "0-19-853454-X",
         "author_id": 999,  # Invalid author ID
         "genre_id": genre_response.json()["id"],
         "publisher_id": None,
@@ -83,7 +282,7 @@ def test_create_book_genre_not_found(create_user):
 
     book_data = {
         "title": "Another Book",
-        "isbn": "0-19-853454-3",
+        "isbn": "0-19-853454-X",
         "author_id": author_response.json()["id"],
         "genre_id": 999,  # Invalid author ID
         "publisher_id": None,
@@ -95,3 +294,169 @@ def test_create_book_genre_not_found(create_user):
     )
     assert response.status_code == 404
     assert response.json() == {"detail": "Genre not found."}
+
+
+def test_create_book_publisher_not_found(create_user, create_book):
+    """
+    Test case with wrong publisher_id
+    """
+    book_data = {**create_book, "title": "Another Book", "isbn": "0-19-853454-X", "publisher_id": 999}
+    del book_data["id"]
+
+    response = client.post(
+        "/books", json=book_data, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Publisher not found."}
+
+
+def test_create_book_duplicate_title(create_user, create_book):
+    """
+    Test case for creating a book with a title that already exists.
+    """
+    book_data = {**create_book, "isbn": "0-19-853454-X"}
+    del book_data["id"]
+
+    response = client.post(
+        "/books", json=book_data, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "A book with this title already exists."}
+
+
+def test_create_book_invalid_isbn_check_digit(create_user, create_book):
+    """
+    Test case for creating a book whose ISBN has a wrong check digit.
+    """
+    book_data = {**create_book, "title": "Another Book", "isbn": "0-19-853454-3"}
+    del book_data["id"]
+
+    response = client.post(
+        "/books", json=book_data, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 422
+
+
+def test_create_book_duplicate_isbn_other_notation(create_user, create_book):
+    """
+    Test case for creating a book with an existing ISBN written differently.
+    """
+    book_data = {**create_book, "title": "Another Book", "isbn": "978 0 19 853453 2"}
+    del book_data["id"]
+
+    response = client.post(
+        "/books", json=book_data, headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "A book with this ISBN already exists."}
+
+
+def test_get_book_by_isbn(create_user, create_book):
+    """
+    Test case for looking a book up by its ISBN in any notation.
+    """
+    assert create_book["isbn13"] == "9780198534532"
+    for isbn in ["0-19-853453-1", "0198534531", "9780198534532"]:
+        response = client.get(f"/books/isbn/{isbn}", headers={"Authorization": f"Bearer {create_user}"})
+        assert response.status_code == 200
+        assert response.json() == create_book
+
+    response = client.get("/books/isbn/0198534558", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.status_code == 404
+
+    response = client.get("/books/isbn/0198534543", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.status_code == 400
+
+
+def test_get_books_with_unchecked_isbn(create_user, create_book):
+    """
+    Test case that a book stored before ISBNs were checked is still listed.
+    """
+    with TestingSessionLocal() as session:
+        session.add(Book(
+            title="Old catalogue book", isbn="0-19-853458-5", publish_date=create_book["publish_date"],
+            author_id=create_book["author_id"], genre_id=create_book["genre_id"],
+        ))
+        session.commit()
+
+    response = client.get("/books?sort_by=title", headers={"Authorization": f"Bearer {create_user}"})
+    assert response.status_code == 200
+    assert [(book["isbn"], book["isbn13"]) for book in response.json()["tasks"]] == [
+        ("0-19-853453-1", "9780198534532"), ("0-19-853458-5", None),
+    ]
+
+
+def test_update_book(create_user, create_book):
+    """
+    Test case for updating a book with the version it was read at, and again with a stale one.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    book_id = create_book["id"]
+    response = client.get(f"/books/{book_id}", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == '"1"'
+
+    response = client.patch(
+        f"/books/{book_id}", json={"title": "Renamed book", "isbn": "0-19-853454-X"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+    assert response.json() == {
+        **create_book, "title": "Renamed book", "isbn": "0-19-853454-X", "isbn13": "9780198534549", "version": 2,
+    }
+    assert client.get(f"/books/{book_id}", headers=headers).json()["title"] == "Renamed book"
+
+    # Someone else's edit made in between is not overwritten
+    response = client.patch(f"/books/{book_id}", json={"available": False}, headers={**headers, "If-Match": etag})
+    assert response.status_code == 412
+    assert response.headers["ETag"] == '"2"'
+
+    response = client.patch(f"/books/{book_id}", json={"available": False}, headers=headers)
+    assert response.status_code == 428
+
+    response = client.patch(f"/books/{book_id}", json={"title": None}, headers={**headers, "If-Match": "*"})
+    assert response.status_code == 422
+
+    response = client.patch("/books/999", json={"available": False}, headers={**headers, "If-Match": "*"})
+    assert response.status_code == 404
+
+
+def test_delete_book(create_user, create_book):
+    """
+    Test case for deleting a book: it leaves the listings and its title and ISBN can be used again.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    book_id = create_book["id"]
+    response = client.delete(f"/books/{book_id}", headers={**headers, "If-Match": '"2"'})
+    assert response.status_code == 412
+
+    response = client.delete(f"/books/{book_id}", headers={**headers, "If-Match": '"1"'})
+    assert response.status_code == 204
+
+    assert client.get(f"/books/{book_id}", headers=headers).status_code == 404
+    assert client.get("/books", headers=headers).status_code == 404
+    assert client.get(f"/books/isbn/{create_book['isbn']}", headers=headers).status_code == 404
+    assert client.delete(f"/books/{book_id}", headers={**headers, "If-Match": "*"}).status_code == 404
+    response = client.post("/borrow", json={"book_id": book_id}, headers=headers)
+    assert response.status_code == 400
+
+    book_data = {**create_book}
+    del book_data["id"]
+    response = client.post("/books", json=book_data, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["id"] != book_id
+
+
+def test_delete_book_on_loan(create_user, create_book):
+    """
+    Test case for deleting a book that is on loan.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    book_id = create_book["id"]
+    client.post("/borrow", json={"book_id": book_id}, headers=headers)
+
+    response = client.delete(f"/books/{book_id}", headers={**headers, "If-Match": '"1"'})
+    assert response.status_code == 409
+    assert response.json() == {"detail": "The book is on loan."}
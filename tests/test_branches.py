@@ -0,0 +1,142 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import Branch
+from tests.conftest import TestingSessionLocal, create_user, create_book
+
+client = TestClient(app)
+
+
+def branch_user(username: str = "eastreader") -> dict:
+    """
+    Add a second branch and sign up a user of it.
+    Returns the authorization headers of the user.
+    """
+    with TestingSessionLocal() as session:
+        branch = Branch(name="east")
+        session.add(branch)
+        session.commit()
+        branch_id = branch.id
+
+    user_data = {"username": username, "password": "testpassword", "branch_id": branch_id}
+    response = client.post("/auth/signup", json=user_data)
+    assert response.status_code == 201
+    assert response.json()["branch_id"] == branch_id
+    response = client.post("/auth/token", data={"username": username, "password": "testpassword"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_signup_default_branch():
+    """
+    Test case that users join the main branch unless another is given.
+    """
+    response = client.post("/auth/signup", json={"username": "testuser", "password": "testpassword"})
+    assert response.status_code == 201
+    assert response.json()["branch_id"] == 1
+
+
+def test_signup_unknown_branch():
+    """
+    Test case for signing up to a branch that doesn't exist.
+    """
+    user_data = {"username": "testuser", "password": "testpassword", "branch_id": 999}
+    response = client.post("/auth/signup", json=user_data)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Branch not found."}
+
+
+def test_books_of_other_branch_hidden(create_book):
+    """
+    Test case that a user neither sees nor borrows the books of another branch.
+    """
+    headers = branch_user()
+    assert create_book["branch_id"] == 1
+
+    response = client.get("/books", headers=headers)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "No books found."}
+
+    assert client.get(f"/books/{create_book['id']}", headers=headers).status_code == 404
+    assert client.get(f"/books/isbn/{create_book['isbn13']}", headers=headers).status_code == 404
+    assert client.get(f"/authors/{create_book['author_id']}/books", headers=headers).json()["items"] == []
+
+    response = client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Book is not available for borrowing."}
+
+    # The author and genre are shared, the book's event is not
+    events = client.get("/changes", headers=headers).json()["events"]
+    assert [event["aggregate"] for event in events] == ["author", "genre"]
+
+
+def test_same_book_in_two_branches(create_book):
+    """
+    Test case that titles and ISBNs are unique within a branch only.
+    """
+    headers = branch_user()
+    book_data = {
+        "title": create_book["title"],
+        "isbn": create_book["isbn"],
+        "author_id": create_book["author_id"],
+        "genre_id": create_book["genre_id"],
+        "publisher_id": None,
+        "publish_date": "2024-10-14",
+    }
+    response = client.post("/books", json=book_data, headers=headers)
+    assert response.status_code == 201
+    book = response.json()
+    assert book["branch_id"] != create_book["branch_id"]
+
+    response = client.get(f"/books/isbn/{create_book['isbn13']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == book["id"]
+
+    # Borrowing from the user's own branch
+    response = client.post("/borrow", json={"book_id": book["id"]}, headers=headers)
+    assert response.status_code == 201
+    assert client.get("/me/loans", headers=headers).json()["active"][0]["book"]["id"] == book["id"]
+
+    # Still a duplicate within the branch
+    response = client.post("/books", json=book_data, headers=headers)
+    assert response.status_code == 400
+
+
+def test_book_counts_per_branch(create_user, create_book):
+    """
+    Test case that authors and genres count the books of the user's branch only.
+    """
+    main = {"Authorization": f"Bearer {create_user}"}
+    headers = branch_user()
+    author_id = create_book["author_id"]
+    other_id = client.post(
+        "/authors", json={"name": "Mary Shelley", "birthdate": "1797-08-30"}, headers=headers
+    ).json()["id"]
+
+    def counts(path, headers):
+        body = client.get(path, headers=headers).json()
+        return body["book_count"], body["available_count"]
+
+    assert counts(f"/authors/{author_id}", main) == (1, 1)
+    assert counts(f"/authors/{author_id}", headers) == (0, 0)
+    assert client.get("/genres", headers=headers).json()["items"][0]["book_count"] == 0
+
+    # Both authors without books in the branch, by id
+    response = client.get("/authors?sort_by=book_count", headers=headers)
+    assert [author["name"] for author in response.json()["items"]] == ["Jane Austen", "Mary Shelley"]
+
+    book_data = {**create_book, "publisher_id": None, "available": False}
+    del book_data["id"]
+    response = client.post("/books", json={**book_data, "author_id": other_id}, headers=headers)
+    assert response.status_code == 201
+    assert counts(f"/authors/{other_id}", headers) == (1, 0)
+    assert counts(f"/authors/{other_id}", main) == (0, 0)
+    assert counts(f"/authors/{author_id}", main) == (1, 1)
+
+    response = client.get("/authors?sort_by=book_count", headers=headers)
+    assert [author["name"] for author in response.json()["items"]] == ["Mary Shelley", "Jane Austen"]
+    response = client.get("/authors?sort_by=book_count", headers=main)
+    assert [author["name"] for author in response.json()["items"]] == ["Jane Austen", "Mary Shelley"]
+
+    # Embedded authors carry the counts of the branch too
+    response = client.get("/books?include=author", headers=headers)
+    assert response.json()["tasks"][0]["author"]["book_count"] == 1
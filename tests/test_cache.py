@@ -0,0 +1,267 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.cache import (
+    BOOKS,
+    INVALIDATION_CHANNEL,
+    REFERENCE,
+    LocalCache,
+    get_cache,
+    invalidate_on_commit,
+)
+from app.config import settings
+from app.database import REPLICA_SESSION
+from app.main import app
+from app.notifications import PgListener
+from tests.conftest import TestingSessionLocal, create_user, engine
+
+client = TestClient(app)
+
+
+def test_local_cache_get_set_and_expiry():
+    """
+    Test case for storing, reading and expiring entries.
+    """
+    cache = LocalCache()
+    cache.set("ns", "a", [1, 2], ttl=60)
+    cache.set("ns", "b", [3], ttl=-1)
+    assert cache.get("ns", "a") == [1, 2]
+    assert cache.get("ns", "b") is None
+    assert cache.get("other", "a") is None
+
+
+def test_local_cache_invalidation():
+    """
+    Test case for invalidating a single key and a whole namespace.
+    """
+    cache = LocalCache()
+    cache.set("ns", "a", 1, ttl=60)
+    cache.set("ns", "b", 2, ttl=60)
+    cache.invalidate("ns", "a")
+    assert cache.get("ns", "a") is None
+    assert cache.get("ns", "b") == 2
+
+    cache.invalidate("ns")
+    assert cache.get("ns", "b") is None
+
+
+def test_value_produced_during_invalidation_not_cached():
+    """
+    Test case that a value computed while the namespace was invalidated is not served.
+    """
+    cache = LocalCache()
+
+    def producer():
+        cache.invalidate("ns")
+        return "stale"
+
+    assert cache.get_or_set("ns", "a", producer, ttl=60) == "stale"
+    assert cache.get("ns", "a") is None
+
+
+def test_value_read_from_replica_cached_for_replicas():
+    """
+    Test case that a value produced on a replica session is served to replica reads only.
+    """
+    cache = LocalCache()
+    with TestingSessionLocal(info={REPLICA_SESSION: True}) as replica, TestingSessionLocal() as primary:
+        assert cache.get_or_set(BOOKS, "a", lambda: "replica", ttl=60, session=replica) == "replica"
+        assert cache.get_or_set(BOOKS, "a", lambda: "again", ttl=60, session=replica) == "replica"
+        assert cache.get(BOOKS, "a") is None
+
+        # A primary read, e.g. right after a write, doesn't get the possibly lagging value
+        assert cache.get_or_set(BOOKS, "a", lambda: "primary", ttl=60, session=primary) == "primary"
+        assert cache.get_or_set(BOOKS, "a", lambda: "again", ttl=60, session=replica) == "primary"
+
+        cache.invalidate(BOOKS)
+        assert cache.get_or_set(BOOKS, "a", lambda: "new", ttl=60, session=replica) == "new"
+
+
+def test_concurrent_misses_coalesced():
+    """
+    Test case that concurrent misses of the same entry run the producer once and share its value.
+    """
+    cache = LocalCache()
+    calls = []
+    release = threading.Event()
+
+    def producer():
+        calls.append(1)
+        release.wait(5)
+        return ["page"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_set(BOOKS, "a", producer, ttl=60)))
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    # Let the others join the flight before it lands
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [["page"]] * 20
+    assert cache.get(BOOKS, "a") == ["page"]
+
+
+def test_coalesced_miss_shares_error():
+    """
+    Test case that the requests waiting on a failed producer get its error, and the next miss retries.
+    """
+    cache = LocalCache()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise LookupError("not found")
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_set(BOOKS, "a", failing, ttl=60)
+        except LookupError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join()
+    waiter.join()
+
+    # Each request raises its own copy
+    assert len(errors) == 2 and errors[0] is not errors[1]
+    assert [e.args for e in errors] == [("not found",)] * 2
+    assert cache.get_or_set(BOOKS, "a", lambda: "retried", ttl=60) == "retried"
+
+
+def test_coalesced_miss_stops_waiting(monkeypatch):
+    """
+    Test case that a request waiting on a stuck producer for too long produces the value itself.
+    """
+    monkeypatch.setattr(settings, "cache_wait_seconds", 0.1)
+    cache = LocalCache()
+    started, release = threading.Event(), threading.Event()
+
+    def stuck():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_set(BOOKS, "a", stuck, ttl=60)))
+    leader.start()
+    assert started.wait(5)
+    assert cache.get_or_set(BOOKS, "a", lambda: "own", ttl=60) == "own"
+    release.set()
+    leader.join()
+    assert results == ["late"]
+
+
+def test_replica_and_primary_misses_not_coalesced():
+    """
+    Test case that a read on the primary doesn't wait for, or get, a concurrent replica read.
+    """
+    cache = LocalCache()
+    started, release = threading.Event(), threading.Event()
+
+    def replica_producer():
+        started.set()
+        release.wait(5)
+        return "replica"
+
+    with TestingSessionLocal(info={REPLICA_SESSION: True}) as replica, TestingSessionLocal() as primary:
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(cache.get_or_set(BOOKS, "a", replica_producer, ttl=60, session=replica))
+        )
+        thread.start()
+        assert started.wait(5)
+        assert cache.get_or_set(BOOKS, "a", lambda: "primary", ttl=60, session=primary) == "primary"
+        release.set()
+        thread.join()
+        assert results == ["replica"]
+
+
+def test_local_cache_bounded():
+    """
+    Test case that the oldest entries are evicted past the size limit.
+    """
+    cache = LocalCache(max_entries=2)
+    for key in "abc":
+        cache.set("ns", key, key, ttl=60)
+    assert cache.get("ns", "a") is None
+    assert cache.get("ns", "c") == "c"
+
+
+def test_create_genre_invalidates_cached_list(create_user):
+    """
+    Test case that a cached genre list is refreshed once a new genre is committed.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    client.post("/genres", json={"name": "Science Fiction"}, headers=headers)
+    assert len(client.get("/genres", headers=headers).json()["items"]) == 1
+    assert get_cache().get(REFERENCE, "1:genres:20:None") is not None
+
+    client.post("/genres", json={"name": "Poetry"}, headers=headers)
+    assert len(client.get("/genres", headers=headers).json()["items"]) == 2
+
+
+def test_rollback_keeps_cache():
+    """
+    Test case that invalidations of a rolled back transaction are dropped,
+    even when no SQL ran before the rollback.
+    """
+    get_cache().set(REFERENCE, "genres", ["cached"], ttl=60)
+    session = TestingSessionLocal()
+    try:
+        invalidate_on_commit(session, REFERENCE)
+        session.rollback()
+        # Nothing is left over for the session's next transaction
+        session.commit()
+    finally:
+        session.close()
+    assert get_cache().get(REFERENCE, "genres") == ["cached"]
+
+
+def test_invalidation_broadcast_to_listeners():
+    """
+    Test case that other workers hear committed invalidations only.
+    """
+    received = []
+    delivered = threading.Event()
+
+    def handler(message):
+        received.append(message)
+        delivered.set()
+
+    listener = PgListener(engine)
+    listener.subscribe(INVALIDATION_CHANNEL, handler)
+    listener.start()
+    try:
+        assert listener.wait_until_listening()
+
+        session = TestingSessionLocal()
+        try:
+            invalidate_on_commit(session, REFERENCE, "rolled-back")
+            session.rollback()
+            invalidate_on_commit(session, REFERENCE, "genres")
+            session.commit()
+        finally:
+            session.close()
+
+        assert delivered.wait(5)
+        assert received == [{"namespace": REFERENCE, "key": "genres"}]
+    finally:
+        listener.stop()
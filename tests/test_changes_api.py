@@ -0,0 +1,68 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.outbox import record_event
+from tests.conftest import TestingSessionLocal, create_user, create_book
+
+client = TestClient(app)
+
+
+def test_get_changes(create_user, create_book):
+    """
+    Test case for the events written by creating, borrowing and returning, in commit order.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    client.post("/return", json={"book_id": create_book["id"]}, headers=headers)
+
+    response = client.get("/changes", headers=headers)
+    assert response.status_code == 200
+    changes = response.json()
+    assert [(event["aggregate"], event["event_type"]) for event in changes["events"]] == [
+        ("author", "created"),
+        ("genre", "created"),
+        ("book", "created"),
+        ("borrowing", "borrowed"),
+        ("borrowing", "returned"),
+    ]
+    assert changes["events"][2]["payload"] == create_book
+    assert changes["has_more"] is False
+
+    # Nothing new since the cursor, which stays valid
+    response = client.get(f"/changes?since={changes['next_cursor']}", headers=headers)
+    assert response.json() == {"events": [], "next_cursor": changes["next_cursor"], "has_more": False}
+
+
+def test_get_changes_in_batches(create_user, create_book):
+    """
+    Test case for reading the changes in batches with the cursor.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    first = client.get("/changes?limit=2", headers=headers).json()
+    assert len(first["events"]) == 2
+    assert first["has_more"] is True
+
+    second = client.get(f"/changes?limit=2&since={first['next_cursor']}", headers=headers).json()
+    assert [event["aggregate"] for event in second["events"]] == ["book"]
+    assert second["has_more"] is False
+
+
+def test_get_changes_waits_for_open_transactions(create_user):
+    """
+    Test case that events committed after an older, still open transaction are held back,
+    so that a consumer's cursor never skips the older transaction's events.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    session = TestingSessionLocal()
+    try:
+        record_event(session, "genre", "created", {"id": 100, "name": "slow"})
+
+        client.post("/genres", json={"name": "Poetry"}, headers=headers)
+        assert client.get("/changes", headers=headers).json()["events"] == []
+
+        session.commit()
+    finally:
+        session.close()
+
+    events = client.get("/changes", headers=headers).json()["events"]
+    assert [event["payload"]["name"] for event in events] == ["slow", "poetry"]
@@ -0,0 +1,84 @@
+import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from fastapi.testclient import TestClient
+
+from app.export import borrowing_history_batches, write_partitioned_parquet
+from app.main import app
+from app.models import BorrowingHistory, User
+from tests.conftest import TestingSessionLocal, create_user, create_book, engine
+
+client = TestClient(app)
+
+EXPORT_COLUMNS = [
+    "id", "book_id", "user_id", "genre_id", "author_id", "publisher_id", "borrow_date", "return_date", "branch_id",
+    "borrow_year",
+]
+
+
+def add_history(book: dict):
+    """
+    Add three borrowings of the book in 2023 and two in 2024.
+    """
+    with TestingSessionLocal() as session:
+        user = User(username="reader", hashed_password="x")
+        session.add(user)
+        session.flush()
+        for borrow_date in ["2023-03-01", "2023-06-01", "2023-12-31", "2024-01-01", "2024-02-01"]:
+            day = datetime.date.fromisoformat(borrow_date)
+            session.add(BorrowingHistory(
+                book_id=book["id"], user_id=user.id, borrow_date=day, return_date=day + datetime.timedelta(days=7)
+            ))
+        session.commit()
+
+
+def test_batches_bounded_by_batch_size(create_book):
+    """
+    Test case that the history is streamed in record batches of at most the batch size.
+    """
+    add_history(create_book)
+    batches = list(borrowing_history_batches(engine, batch_size=2))
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+    assert batches[0].schema.names == EXPORT_COLUMNS
+    assert batches[0].column("genre_id").to_pylist() == [create_book["genre_id"]] * 2
+
+
+def test_write_partitioned_parquet(create_book, tmp_path):
+    """
+    Test case for the Parquet dataset partitioned by branch and borrow year.
+    """
+    add_history(create_book)
+    assert write_partitioned_parquet(engine, str(tmp_path), batch_size=2) == 5
+    assert [path.name for path in tmp_path.iterdir()] == ["branch_id=1"]
+    assert sorted(path.name for path in (tmp_path / "branch_id=1").iterdir()) == ["borrow_year=2023", "borrow_year=2024"]
+
+    dataset = ds.dataset(tmp_path, format="parquet", partitioning="hive")
+    table = dataset.to_table(filter=ds.field("borrow_year") == 2024)
+    assert sorted(table.column("borrow_date").to_pylist()) == [datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)]
+
+    # Exporting a year again replaces its partition only
+    assert write_partitioned_parquet(engine, str(tmp_path), year=2023) == 3
+    assert ds.dataset(tmp_path, format="parquet", partitioning="hive").count_rows() == 5
+
+
+def test_export_endpoint(create_user, create_book):
+    """
+    Test case for streaming the history as Arrow and as Parquet.
+    """
+    add_history(create_book)
+    headers = {"Authorization": f"Bearer {create_user}"}
+
+    response = client.get("/exports/borrowing-history", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 5
+    assert table.column_names == EXPORT_COLUMNS
+
+    response = client.get("/exports/borrowing-history?year=2023&format=parquet", headers=headers)
+    assert response.status_code == 200
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.column("borrow_year").to_pylist() == [2023] * 3
+    assert table.column("book_id").to_pylist() == [create_book["id"]] * 3
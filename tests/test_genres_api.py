@@ -55,5 +55,38 @@ def test_get_genres_with_data(create_user):
     )
     response = client.get("/genres", headers={"Authorization": f"Bearer {create_user}"})
     assert response.status_code == 200
-    assert len(response.json()) == 1
-    assert response.json()[0]["name"] == genre_data["name"].lower()
+    assert len(response.json()["items"]) == 1
+    assert response.json()["items"][0]["name"] == genre_data["name"].lower()
+    assert response.json()["pagination"] == {"limit": 20, "next_cursor": None}
+
+
+def test_get_genres_paginated(create_user):
+    """
+    Test case for paging through genres with limit and cursor.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    for name in ["Poetry", "Drama", "Satire"]:
+        client.post("/genres", json={"name": name}, headers=headers)
+
+    first = client.get("/genres?limit=2", headers=headers).json()
+    assert [genre["name"] for genre in first["items"]] == ["poetry", "drama"]
+
+    cursor = first["pagination"]["next_cursor"]
+    second = client.get(f"/genres?limit=2&cursor={cursor}", headers=headers).json()
+    assert [genre["name"] for genre in second["items"]] == ["satire"]
+    assert second["pagination"] == {"limit": 2, "next_cursor": None}
+
+
+def test_bulk_upsert_genres(create_user):
+    """
+    Test case for creating genres in bulk, matching existing names case-insensitively.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    existing = client.post("/genres", json={"name": "Poetry"}, headers=headers).json()
+
+    response = client.put(
+        "/genres/bulk", json=[{"name": "POETRY"}, {"name": "Science Fiction"}], headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()[0] == {"id": existing["id"], "name": "poetry"}
+    assert len(client.get("/genres", headers=headers).json()["items"]) == 2
@@ -0,0 +1,48 @@
+import numpy as np
+
+from app.hll import REGISTERS, HyperLogLog
+
+
+def test_hll_small_counts_are_exact():
+    """
+    Test case that small sets are counted exactly and duplicates are ignored.
+    """
+    sketch = HyperLogLog()
+    for value in [1, 2, 3, 2, 1]:
+        sketch.add(value)
+    assert sketch.count() == 3
+    assert HyperLogLog().count() == 0
+
+
+def test_hll_large_count_error():
+    """
+    Test case that a large set is estimated within a few percent.
+    """
+    sketch = HyperLogLog()
+    sketch.add_many(np.arange(200_000))
+    assert abs(sketch.count() / 200_000 - 1) < 0.03
+
+
+def test_hll_merge_counts_the_union():
+    """
+    Test case that merging two sketches estimates the size of the union.
+    """
+    first, second = HyperLogLog(), HyperLogLog()
+    first.add_many(np.arange(0, 30_000))
+    second.add_many(np.arange(20_000, 50_000))
+    assert abs(first.merge(second).count() / 50_000 - 1) < 0.03
+
+
+def test_hll_serialization_round_trip():
+    """
+    Test case that sparse and dense sketches survive serialization.
+    """
+    small, large = HyperLogLog(), HyperLogLog()
+    small.add_many(range(100))
+    large.add_many(range(100_000))
+
+    assert len(small.to_bytes()) < 500
+    assert len(large.to_bytes()) == REGISTERS + 1
+    for sketch in (small, large):
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        assert np.array_equal(restored.registers, sketch.registers)
@@ -0,0 +1,100 @@
+import datetime
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import BorrowingHistory, IdempotencyKey
+from tests.conftest import TestingSessionLocal, create_user, create_book
+
+client = TestClient(app)
+
+
+def count_borrows():
+    session = TestingSessionLocal()
+    try:
+        return session.query(BorrowingHistory).count()
+    finally:
+        session.close()
+
+
+def test_borrow_retry_replays_response(create_user, create_book):
+    """
+    Test case that a retried borrow returns the first response without borrowing again.
+    """
+    headers = {"Authorization": f"Bearer {create_user}", "Idempotency-Key": "borrow-1"}
+    first = client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    retry = client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert count_borrows() == 1
+
+
+def test_create_book_retry_replays_response(create_user, create_book):
+    """
+    Test case that a retried book creation replays the stored book.
+    """
+    headers = {"Authorization": f"Bearer {create_user}", "Idempotency-Key": "book-1"}
+    book_data = {**create_book, "title": "Another book", "isbn": "0-19-853454-X"}
+    del book_data["id"]
+
+    first = client.post("/books", json=book_data, headers=headers)
+    retry = client.post("/books", json=book_data, headers=headers)
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+
+
+def test_key_reused_for_other_request(create_user, create_book):
+    """
+    Test case that a key used on one endpoint cannot be replayed on another.
+    """
+    headers = {"Authorization": f"Bearer {create_user}", "Idempotency-Key": "same-key"}
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    response = client.post(
+        "/return", json={"book_id": create_book["id"], "return_date": "2024-10-20"}, headers=headers
+    )
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Idempotency-Key was already used for a different request."}
+
+
+def test_failed_request_not_stored(create_user):
+    """
+    Test case that an error response is not stored, so the retry runs again.
+    """
+    headers = {"Authorization": f"Bearer {create_user}", "Idempotency-Key": "failing"}
+    client.post("/borrow", json={"book_id": 1}, headers=headers)
+    session = TestingSessionLocal()
+    try:
+        assert session.query(IdempotencyKey).count() == 0
+    finally:
+        session.close()
+
+
+def test_expired_key_executes_again(create_user, create_book):
+    """
+    Test case that a key past its TTL no longer replays.
+    """
+    headers = {"Authorization": f"Bearer {create_user}", "Idempotency-Key": "old"}
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    client.post(
+        "/return",
+        json={"book_id": create_book["id"], "return_date": "2024-10-20"},
+        headers={"Authorization": f"Bearer {create_user}"},
+    )
+
+    session = TestingSessionLocal()
+    try:
+        session.query(IdempotencyKey).update(
+            {IdempotencyKey.expires_at: datetime.datetime.utcnow() - datetime.timedelta(seconds=1)}
+        )
+        session.commit()
+    finally:
+        session.close()
+
+    response = client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    assert count_borrows() == 2
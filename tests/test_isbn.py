@@ -0,0 +1,39 @@
+import pytest
+
+from app.isbn import normalize_isbn, normalize_isbns
+
+
+def test_normalize_isbn():
+    """
+    Test case that every notation of an ISBN gives the same 13 digits.
+    """
+    for isbn in ["0-19-853453-1", "0198534531", "0 19 853453 1", "978-0-19-853453-2", "9780198534532"]:
+        assert normalize_isbn(isbn) == "9780198534532"
+    assert normalize_isbn("0-19-853454-x") == "9780198534549"
+    assert normalize_isbn("979-10-90636-07-1") == "9791090636071"
+
+
+def test_normalize_isbn_invalid():
+    """
+    Test case that wrong check digits and malformed ISBNs are rejected.
+    """
+    for isbn in ["0-19-853453-5", "978-0-19-853453-1", "0--19-853453-1", "-0198534531", "X198534531",
+                 "9770198534533", "01985345", ""]:
+        with pytest.raises(ValueError):
+            normalize_isbn(isbn)
+
+
+def test_normalize_isbns_matches_normalize_isbn():
+    """
+    Test case that a batch is normalized like its ISBNs one at a time.
+    """
+    isbns = ["0-19-853453-1", "0-19-853453-5", "0-19-853454-X", "9780198534556", "978-0-19-853456-5",
+             "X198534531", "not an isbn", "979-10-90636-07-1"]
+    expected = []
+    for isbn in isbns:
+        try:
+            expected.append(normalize_isbn(isbn))
+        except ValueError:
+            expected.append(None)
+    assert normalize_isbns(isbns) == expected
+    assert normalize_isbns([]) == []
@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.borrow_return import MAX_BORROW_LIMIT
+from tests.conftest import create_user, create_book
+
+client = TestClient(app)
+
+
+def test_get_my_loans_empty(create_user):
+    """
+    Test case for a user without any loans.
+    """
+    response = client.get("/me/loans", headers={"Authorization": f"Bearer {create_user}"})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "open_loans": 0,
+        "borrow_limit": MAX_BORROW_LIMIT,
+        "remaining_allowance": MAX_BORROW_LIMIT,
+        "active": [],
+        "past": {"pagination": {"limit": 20, "next_cursor": None}, "items": []},
+    }
+
+
+def test_get_my_loans(create_user, create_book):
+    """
+    Test case for active and paginated past loans after borrowing and returning.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    book_id = create_book["id"]
+    for _ in range(2):
+        client.post("/borrow", json={"book_id": book_id}, headers=headers)
+        client.post("/return", json={"book_id": book_id}, headers=headers)
+    client.post("/borrow", json={"book_id": book_id}, headers=headers)
+
+    response = client.get("/me/loans?limit=1", headers=headers)
+    assert response.status_code == 200
+    loans = response.json()
+    assert loans["open_loans"] == 1
+    assert loans["remaining_allowance"] == MAX_BORROW_LIMIT - 1
+    assert [loan["book"] for loan in loans["active"]] == [create_book]
+    assert loans["active"][0]["return_date"] is None
+    assert len(loans["past"]["items"]) == 1
+
+    cursor = loans["past"]["pagination"]["next_cursor"]
+    response = client.get(f"/me/loans?limit=1&cursor={cursor}", headers=headers)
+    past = response.json()["past"]
+    assert len(past["items"]) == 1
+    assert past["items"][0]["id"] > loans["past"]["items"][0]["id"]
+    assert past["pagination"]["next_cursor"] is None
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
 
+from app.bulk import bulk_upsert_by_name
 from app.main import app
-from tests.conftest import create_user
+from app.models import Publisher
+from tests.conftest import TestingSessionLocal, create_user
 
 client = TestClient(app)
 
@@ -81,5 +83,39 @@ def test_get_publishers_with_data(create_user):
         "/publishers", headers={"Authorization": f"Bearer {create_user}"}
     )
     assert response.status_code == 200
-    assert len(response.json()) == 1
-    assert response.json()[0]["name"] == publisher_data["name"].lower()
+    assert len(response.json()["items"]) == 1
+    assert response.json()["items"][0]["name"] == publisher_data["name"].lower()
+
+
+def test_bulk_upsert_publishers(create_user):
+    """
+    Test case for updating existing publishers in bulk.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    client.post(
+        "/publishers", json={"name": "Penguin Books", "established_year": 1900}, headers=headers
+    )
+
+    response = client.put(
+        "/publishers/bulk",
+        json=[{"name": "Penguin Books", "established_year": 1935}],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    publishers = client.get("/publishers", headers=headers).json()["items"]
+    assert publishers == [{"name": "penguin books", "established_year": 1935, "id": 1, "book_count": 0, "available_count": 0}]
+
+
+def test_bulk_upsert_in_chunks():
+    """
+    Test case that large requests are split into several statements.
+    """
+    session = TestingSessionLocal()
+    try:
+        rows = [{"name": f"publisher {i}", "established_year": 1900 + i} for i in range(5)]
+        mapping = bulk_upsert_by_name(session, Publisher, rows, chunk_size=2)
+        session.commit()
+        assert [item["name"] for item in mapping] == [row["name"] for row in rows]
+        assert session.query(Publisher).count() == 5
+    finally:
+        session.close()
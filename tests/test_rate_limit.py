@@ -0,0 +1,84 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.rate_limit import POLICIES, MemoryBucketStore, RateLimitPolicy
+from tests.conftest import create_user, create_book
+
+client = TestClient(app)
+
+
+def test_bucket_allows_burst_then_rejects():
+    """
+    Test case that a bucket allows its capacity and then reports the wait.
+    """
+    store = MemoryBucketStore()
+    policy = RateLimitPolicy(capacity=2, refill_per_second=0.5)
+    assert store.take("key", policy) == (True, 0.0)
+    assert store.take("key", policy) == (True, 0.0)
+
+    allowed, retry_after = store.take("key", policy)
+    assert not allowed
+    assert 0 < retry_after <= 2
+    assert store.take("other", policy)[0]
+
+
+def test_bucket_refills():
+    """
+    Test case that tokens come back at the policy's rate.
+    """
+    store = MemoryBucketStore()
+    policy = RateLimitPolicy(capacity=1, refill_per_second=1000)
+    assert store.take("key", policy)[0]
+    assert not store.take("key", policy)[0]
+
+    # One token is back after a millisecond
+    time.sleep(0.005)
+    assert store.take("key", policy)[0]
+
+
+def test_bucket_store_pruned():
+    """
+    Test case that refilled buckets are dropped when the store is full.
+    """
+    store = MemoryBucketStore(max_buckets=2)
+    policy = RateLimitPolicy(capacity=1, refill_per_second=1000)
+    store.take("a", policy)
+    store.take("b", policy)
+    time.sleep(0.005)
+    store.take("c", policy)
+    assert set(store._buckets) == {"c"}
+
+
+def test_login_rate_limited(monkeypatch):
+    """
+    Test case that login attempts over the limit get 429 without checking credentials.
+    """
+    monkeypatch.setitem(
+        POLICIES, ("POST", "/auth/token"), RateLimitPolicy(capacity=2, refill_per_second=0.01, key_by="ip")
+    )
+    login_data = {"username": "nobody", "password": "wrong"}
+    assert client.post("/auth/token", data=login_data).status_code == 401
+    assert client.post("/auth/token", data=login_data).status_code == 401
+
+    response = client.post("/auth/token", data=login_data)
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests."}
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_borrow_rate_limited_per_user(create_user, create_book, monkeypatch):
+    """
+    Test case that borrow limits apply per user.
+    """
+    monkeypatch.setitem(POLICIES, ("POST", "/borrow"), RateLimitPolicy(capacity=1, refill_per_second=0.01))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    assert client.post("/borrow", json={"book_id": 1}, headers=headers).status_code == 201
+    assert client.post("/borrow", json={"book_id": 1}, headers=headers).status_code == 429
+
+    # Another user has a bucket of their own
+    client.post("/auth/signup", json={"username": "other", "password": "secret"})
+    token = client.post("/auth/token", data={"username": "other", "password": "secret"}).json()["access_token"]
+    response = client.post("/borrow", json={"book_id": 1}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201
@@ -0,0 +1,87 @@
+import datetime
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import BorrowingHistory, User
+from app.readers import BOOK, GENRE, ReaderSketchJob, distinct_readers, rebuild_reader_sketches
+from tests.conftest import TestingSessionLocal, create_user, create_book, engine
+
+client = TestClient(app)
+
+
+def test_borrowing_counts_distinct_readers(create_user, create_book):
+    """
+    Test case that the job folds borrowings into the book's and genre's sketches, each reader once.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    job = ReaderSketchJob(engine, interval=60)
+    today = datetime.date.today().isoformat()
+
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    client.post("/return", json={"book_id": create_book["id"]}, headers=headers)
+    # Borrowing leaves the sketches to the job
+    response = client.get(
+        f"/books/{create_book['id']}/readers?start={today}&end={today}", headers=headers
+    )
+    assert response.json()["distinct_readers"] == 0
+    assert job.run_once() == 1
+
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+    assert job.run_once() == 1
+    assert job.run_once() == 0
+
+    response = client.get(
+        f"/books/{create_book['id']}/readers?start={today}&end={today}", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json() == {"start": today, "end": today, "distinct_readers": 1}
+
+    response = client.get(
+        f"/genres/{create_book['genre_id']}/readers?start={today}&end={today}", headers=headers
+    )
+    assert response.json()["distinct_readers"] == 1
+
+
+def test_rebuild_and_merge_over_date_range(create_book):
+    """
+    Test case for backfilling daily sketches and merging them over a date range.
+    """
+    first_day = datetime.date(2024, 3, 1)
+    with TestingSessionLocal() as session:
+        users = [User(username=f"reader{i}", hashed_password="x") for i in range(30)]
+        session.add_all(users)
+        session.flush()
+        # Readers 0-19 on the first day, 10-29 on the next one
+        for day, readers in [(0, users[:20]), (1, users[10:])]:
+            session.add_all(
+                BorrowingHistory(
+                    user_id=user.id, book_id=create_book["id"],
+                    borrow_date=first_day + datetime.timedelta(days=day),
+                )
+                for user in readers
+            )
+        session.commit()
+
+        written = rebuild_reader_sketches(session, first_day, first_day + datetime.timedelta(days=6))
+        session.commit()
+
+        assert written == 4
+        assert distinct_readers(session, BOOK, create_book["id"], first_day, first_day) == 20
+        assert distinct_readers(
+            session, GENRE, create_book["genre_id"], first_day, first_day + datetime.timedelta(days=1)
+        ) == 30
+
+
+def test_readers_invalid_requests(create_user, create_book):
+    """
+    Test case for an inverted date range and a missing book.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    response = client.get(
+        f"/books/{create_book['id']}/readers?start=2024-02-01&end=2024-01-01", headers=headers
+    )
+    assert response.status_code == 400
+
+    response = client.get("/books/9999/readers?start=2024-01-01&end=2024-02-01", headers=headers)
+    assert response.status_code == 404
@@ -0,0 +1,147 @@
+import datetime
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import Book, BookRecommendation, BorrowingHistory, User
+from app.outbox import record_event
+from app.recommendations import CooccurrenceModel, RecommendationJob
+from tests.conftest import TestingSessionLocal, create_user, create_book, engine
+
+client = TestClient(app)
+
+
+def seed_books_and_readers(book):
+    """
+    Add three more books by the fixture book's author and four readers.
+    Returns the ids of all four books and of the readers.
+    """
+    with TestingSessionLocal() as session:
+        books = [
+            Book(
+                title=f"Book {i}", isbn=isbn,
+                author_id=book["author_id"], genre_id=book["genre_id"],
+                publish_date=datetime.date(2000, 1, 1),
+            )
+            for i, isbn in enumerate(["0-19-853455-8", "0-19-853456-6", "0-19-853457-4"])
+        ]
+        users = [User(username=f"reader{i}", hashed_password="x") for i in range(4)]
+        session.add_all(books + users)
+        session.commit()
+        return [book["id"]] + [b.id for b in books], [u.id for u in users]
+
+
+def borrow(session, user_id, book_id, outbox=False):
+    loan = BorrowingHistory(user_id=user_id, book_id=book_id, borrow_date=datetime.date.today())
+    session.add(loan)
+    session.flush()
+    if outbox:
+        record_event(session, "borrowing", "borrowed", {"id": loan.id, "user_id": user_id, "book_id": book_id})
+
+
+def stored_recommendations():
+    with TestingSessionLocal() as session:
+        rows = session.query(BookRecommendation).order_by(
+            BookRecommendation.book_id, BookRecommendation.rank
+        ).all()
+        return [(row.book_id, row.recommended_book_id, row.score) for row in rows]
+
+
+def test_recommendations_full_build(create_user, create_book):
+    """
+    Test case for building the co-occurrence counts from the whole history.
+    """
+    books, users = seed_books_and_readers(create_book)
+    with TestingSessionLocal() as session:
+        # Readers 0 and 1 borrowed books 0 and 1, reader 2 books 0 and 2, reader 0 twice book 0
+        for user, book in [(0, 0), (0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 2)]:
+            borrow(session, users[user], books[book])
+        session.commit()
+
+        model = CooccurrenceModel(top_k=10)
+        model.update(session)
+        session.commit()
+
+    assert model.neighbours(books[0]) == [(books[1], 2), (books[2], 1)]
+    assert stored_recommendations() == [
+        (books[0], books[1], 2),
+        (books[0], books[2], 1),
+        (books[1], books[0], 2),
+        (books[2], books[0], 1),
+    ]
+
+    response = client.get(
+        f"/books/{books[0]}/recommendations", headers={"Authorization": f"Bearer {create_user}"}
+    )
+    assert response.status_code == 200
+    assert [(item["book"]["id"], item["score"]) for item in response.json()] == [
+        (books[1], 2), (books[2], 1),
+    ]
+
+
+def test_recommendations_incremental_update(create_book):
+    """
+    Test case that folding in new borrowings from the outbox matches a full rebuild.
+    """
+    books, users = seed_books_and_readers(create_book)
+    job = RecommendationJob(engine, interval=60, top_k=2)
+    try:
+        with TestingSessionLocal() as session:
+            borrow(session, users[0], books[0])
+            borrow(session, users[0], books[1])
+            session.commit()
+        job.run_once()
+
+        with TestingSessionLocal() as session:
+            for user, book in [(1, 0), (1, 3), (2, 0), (2, 3), (0, 3), (0, 1)]:
+                borrow(session, users[user], books[book], outbox=True)
+            session.commit()
+        changed = job.run_once()
+        assert sorted(changed.tolist()) == [books[0], books[1], books[3]]
+
+        with TestingSessionLocal() as session:
+            rebuilt = CooccurrenceModel(top_k=2)
+            rebuilt.update(session)
+            session.rollback()
+        for book in books:
+            assert job.model.neighbours(book) == rebuilt.neighbours(book)
+        assert job.model.neighbours(books[0]) == [(books[3], 3), (books[1], 1)]
+    finally:
+        job.stop()
+
+
+def test_recommendations_single_leader(create_book):
+    """
+    Test case that only the worker holding the lock keeps a model, and another takes over when it stops.
+    """
+    seed_books_and_readers(create_book)
+    leader = RecommendationJob(engine, interval=60, top_k=2)
+    follower = RecommendationJob(engine, interval=60, top_k=2)
+    try:
+        assert leader.run_once() is not None
+        assert leader.is_leader
+
+        assert follower.run_once() is None
+        assert not follower.is_leader and follower.model is None
+
+        leader.stop()
+        assert leader.model is None
+        assert follower.run_once() is not None
+        assert follower.is_leader
+    finally:
+        leader.stop()
+        follower.stop()
+
+
+def test_recommendations_unknown_book(create_user, create_book):
+    """
+    Test case for a book without recommendations and a book that doesn't exist.
+    """
+    headers = {"Authorization": f"Bearer {create_user}"}
+    response = client.get(f"/books/{create_book['id']}/recommendations", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = client.get("/books/9999/recommendations", headers=headers)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Book not found."}
@@ -0,0 +1,203 @@
+import csv
+import datetime
+import io
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.testclient import TestClient
+
+from app import reports
+from app.config import settings
+from app.main import app
+from app.models import BorrowingHistory, ReportJob, User
+from tests.conftest import TestingSessionLocal, create_user, create_book, engine
+
+client = TestClient(app)
+
+
+def wait_for_report(report_id: int, headers: dict, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        report = client.get(f"/reports/{report_id}", headers=headers).json()
+        if report["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return report
+        time.sleep(0.2)
+
+
+def test_inventory_audit_csv(create_user, create_book, tmp_path, monkeypatch):
+    """
+    Test case for queuing an inventory audit, polling its status and downloading the CSV.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    client.post("/borrow", json={"book_id": create_book["id"]}, headers=headers)
+
+    response = client.post("/reports", json={"kind": "inventory_audit"}, headers=headers)
+    assert response.status_code == 202
+    assert response.json()["status"] in ("queued", "running", "succeeded")
+
+    report = wait_for_report(response.json()["id"], headers)
+    assert report["status"] == "succeeded", report["error"]
+    assert report["row_count"] == 1
+
+    response = client.get(f"/reports/{report['id']}/download", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows == [{
+        "book_id": str(create_book["id"]),
+        "isbn": create_book["isbn"],
+        "title": create_book["title"],
+        "author": "Jane Austen",
+        "genre": "science fiction",
+        "publisher": "",
+        "available": "True",
+        "on_loan": "True",
+    }]
+
+
+def test_overdue_parquet(create_user, create_book, tmp_path, monkeypatch):
+    """
+    Test case for the overdue list written as Parquet, with loans inside the loan period left out.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    today = datetime.date.today()
+    with TestingSessionLocal() as session:
+        user = session.query(User).filter(User.username == "testuser").one()
+        session.add_all([
+            BorrowingHistory(book_id=create_book["id"], user_id=user.id, borrow_date=today - datetime.timedelta(days=30)),
+            BorrowingHistory(book_id=create_book["id"], user_id=user.id, borrow_date=today - datetime.timedelta(days=3)),
+        ])
+        session.commit()
+
+    response = client.post("/reports", json={"kind": "overdue", "format": "parquet"}, headers=headers)
+    report = wait_for_report(response.json()["id"], headers)
+    assert report["status"] == "succeeded", report["error"]
+    assert report["params"] == {"branch_id": 1, "as_of": today.isoformat(), "loan_period_days": 21}
+
+    response = client.get(f"/reports/{report['id']}/download", headers=headers)
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.column_names == [
+        "loan_id", "book_id", "title", "user_id", "username", "borrow_date", "days_overdue"
+    ]
+    assert table.column("days_overdue").to_pylist() == [9]
+    assert table.column("borrow_date").to_pylist() == [today - datetime.timedelta(days=30)]
+
+
+def test_report_of_another_user(create_user, tmp_path, monkeypatch):
+    """
+    Test case that reports are only visible to the user who requested them,
+    and that unknown kinds are rejected.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    response = client.post("/reports", json={"kind": "weekly_digest"}, headers=headers)
+    assert response.status_code == 422
+
+    response = client.post("/reports", json={"kind": "annual_circulation", "year": 9999}, headers=headers)
+    assert response.status_code == 422
+
+    response = client.post("/reports", json={"kind": "annual_circulation", "year": 2023}, headers=headers)
+    report_id = response.json()["id"]
+    assert wait_for_report(report_id, headers)["row_count"] == 0
+
+    client.post("/auth/signup", json={"username": "other", "password": "otherpassword"})
+    token = client.post("/auth/token", data={"username": "other", "password": "otherpassword"}).json()["access_token"]
+    response = client.get(f"/reports/{report_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+
+
+def add_job(status: str, started_at=None, heartbeat_at=None) -> int:
+    with TestingSessionLocal() as session:
+        user = session.query(User).filter(User.username == "testuser").one()
+        job = ReportJob(
+            user_id=user.id, kind="inventory_audit", format="csv", params={}, status=status,
+            started_at=started_at, heartbeat_at=heartbeat_at,
+        )
+        session.add(job)
+        session.commit()
+        return job.id
+
+
+def test_jobs_of_a_broken_pool(create_user, tmp_path, monkeypatch):
+    """
+    Test case that when a worker dies its job fails, and the jobs still queued in its pool run in a new one.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    running, queued = add_job("running", datetime.datetime.now()), add_job("queued")
+    broken = Future()
+    broken.set_exception(BrokenProcessPool())
+
+    reports._job_done(engine, object(), running, broken)
+    reports._job_done(engine, object(), queued, broken)
+
+    assert client.get(f"/reports/{running}", headers=headers).json()["status"] == "failed"
+    assert wait_for_report(queued, headers)["status"] == "succeeded"
+
+
+def test_submit_to_a_broken_pool(create_user, tmp_path, monkeypatch):
+    """
+    Test case that a report queued after a worker died runs in a new pool.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    pool = reports.get_report_pool(engine.url)
+    crash = pool.submit(os._exit, 1)
+    assert isinstance(crash.exception(timeout=60), BrokenProcessPool)
+
+    response = client.post("/reports", json={"kind": "inventory_audit"}, headers=headers)
+    assert wait_for_report(response.json()["id"], headers)["status"] == "succeeded"
+    assert reports.get_report_pool(engine.url) is not pool
+
+
+def test_stale_running_jobs_queued_again(create_user, tmp_path, monkeypatch):
+    """
+    Test case that jobs left running by a restart run again when the app starts,
+    those recently started or with a recent heartbeat don't.
+    """
+    monkeypatch.setattr(settings, "report_dir", str(tmp_path))
+    headers = {"Authorization": f"Bearer {create_user}"}
+    now = datetime.datetime.now()
+    stale = add_job("running", now - datetime.timedelta(hours=2))
+    recent = add_job("running", now)
+    alive = add_job("running", now - datetime.timedelta(hours=2), heartbeat_at=now)
+
+    reports.submit_queued_reports(engine)
+
+    assert wait_for_report(stale, headers)["status"] == "succeeded"
+    assert client.get(f"/reports/{recent}", headers=headers).json()["status"] == "running"
+    assert client.get(f"/reports/{alive}", headers=headers).json()["status"] == "running"
+
+
+def test_outcome_of_a_superseded_run_dropped(create_user, tmp_path, monkeypatch):
+    """
+    Test case that a run sends heartbeats, and that once its job was claimed by another run
+    it records no outcome and leaves no file behind.
+    """
+    monkeypatch.setattr(settings, "report_heartbeat_seconds", 0.05)
+    monkeypatch.setattr(reports, "_worker_engine", engine)
+    job_id = add_job("queued")
+    generate_report = reports.generate_report
+
+    def requeued_meanwhile(*args):
+        time.sleep(0.3)
+        with TestingSessionLocal() as session:
+            job = session.get(ReportJob, job_id)
+            assert job.heartbeat_at > job.started_at
+            job.claim = "other"
+            session.commit()
+        return generate_report(*args)
+
+    monkeypatch.setattr(reports, "generate_report", requeued_meanwhile)
+    reports.run_report(job_id, str(tmp_path))
+
+    with TestingSessionLocal() as session:
+        job = session.get(ReportJob, job_id)
+        assert (job.status, job.claim, job.path) == ("running", "other", None)
+    assert list(tmp_path.iterdir()) == []
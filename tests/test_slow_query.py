@@ -0,0 +1,58 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app import slow_query
+from app.config import settings
+from app.main import app
+from tests.conftest import create_user, create_book
+
+client = TestClient(app)
+
+
+def test_slow_query_logged_with_route_and_plan(create_user, create_book, caplog, monkeypatch):
+    """
+    Test case that a query over the threshold is logged with its route, handler and plan.
+    """
+    monkeypatch.setattr(settings, "slow_query_threshold_ms", 0)
+    monkeypatch.setattr(settings, "slow_query_explain_sample_rate", 1.0)
+
+    with caplog.at_level(logging.WARNING, logger="app.slow_query"):
+        response = client.get(
+            "/books?sort_by=author", headers={"Authorization": f"Bearer {create_user}"}
+        )
+        # Wait for the queued plan captures to finish
+        slow_query._explain_executor.submit(lambda: None).result()
+
+    assert response.status_code == 200
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(
+        "Slow query" in m and "GET /books" in m and "get_books" in m for m in messages
+    )
+    assert any("Plan for slow query" in m and "Execution Time" in m for m in messages)
+
+
+def test_fast_query_not_logged(create_user, create_book, caplog):
+    """
+    Test case that queries under the threshold are not logged.
+    """
+    with caplog.at_level(logging.WARNING, logger="app.slow_query"):
+        response = client.get(
+            "/books", headers={"Authorization": f"Bearer {create_user}"}
+        )
+
+    assert response.status_code == 200
+    assert not [r for r in caplog.records if r.name == "app.slow_query"]
+
+
+def test_locking_statements_not_explained():
+    """
+    Test case that only plain SELECTs are sampled for EXPLAIN ANALYZE.
+    """
+    assert slow_query._can_explain("SELECT books.id FROM books WHERE books.id = %(id)s")
+    assert not slow_query._can_explain("SELECT books.id FROM books WHERE books.id = 1 FOR UPDATE")
+    assert not slow_query._can_explain("select id from reader_sketches for no key update")
+    assert not slow_query._can_explain("SELECT id FROM books FOR SHARE OF books")
+    assert not slow_query._can_explain("SELECT pg_notify('cache_invalidation', 'x')")
+    assert not slow_query._can_explain("SELECT pg_try_advisory_xact_lock(4224201)")
+    assert not slow_query._can_explain("UPDATE books SET available = false")
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine
+
+from app.database import prewarm_pool
+from tests.conftest import SQLALCHEMY_TEST_DATABASE_URL
+
+
+def test_import_has_no_side_effects():
+    """
+    Test case that importing the app needs neither settings nor a database.
+    """
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": os.getcwd()}
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.main, app.database; assert app.database._engine is None"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_prewarm_pool_opens_connections():
+    """
+    Test case that prewarming leaves the requested connections idle in the pool.
+    """
+    engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, pool_size=3)
+    try:
+        prewarm_pool(engine, 3)
+        assert engine.pool.checkedin() == 3
+        assert engine.pool.checkedout() == 0
+    finally:
+        engine.dispose()